@@ -1,8 +1,21 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session, flash
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, session, flash, send_from_directory, current_app
 from enrollment import EnrollmentFlow
+import enrollment
+import dispatch
+import leads
+import lead_import
+import chat_sessions
+import purge
+import feedback
+import archive
+import metrics
+import profiling
+import ratelimit
+import transcript_search
 from flask_cors import CORS
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
+import hmac
 import json
 
 # Load environment variables from .env file
@@ -13,69 +26,66 @@ import re
 import db
 import requests
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from flask_mail import Mail, Message
+from flask_mail import Mail
 from flask_wtf.csrf import CSRFProtect
 from flask_talisman import Talisman
-import bcrypt
+import passwords
+import user_cache
+import mailer
+import avatars
+import assets
+import compression
 import datetime
+import threading
+import time
 import jwt
 
 # Avatar upload config
-AVATAR_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'avatars')
+AVATAR_UPLOAD_FOLDER = avatars.AVATAR_FOLDER
+AVATAR_MAX_AGE = 365 * 24 * 3600
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-os.makedirs(AVATAR_UPLOAD_FOLDER, exist_ok=True)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'MITU_SECRET_KEY_2024')
-app.config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(days=7)
-# Allow HTTP for OAuth (Development only)
-os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
-
-# Security Headers
-# Talisman(app, content_security_policy=None) # Disable CSP for now to allow external fonts/styles if needed, or configure it
-
-# CSRF Protection
-csrf = CSRFProtect(app)
-app.config['WTF_CSRF_TIME_LIMIT'] = None # Token valid for session lifetime
-
-# Mail Configuration (Example using Gmail)
-app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
-app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
-app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'True') == 'True'
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'your-email@gmail.com')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'your-app-password')
-app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'your-email@gmail.com')
-
-mail = Mail(app)
-
-CORS(app)
+# Extensions are created unbound and attached to the app in create_app()
+csrf = CSRFProtect()
+mail = Mail()
+oauth = OAuth()
 
 # ---------- Google OAuth Configuration ----------
-app.config['GOOGLE_CLIENT_ID'] = os.environ.get('GOOGLE_CLIENT_ID')
-app.config['GOOGLE_CLIENT_SECRET'] = os.environ.get('GOOGLE_CLIENT_SECRET')
-
-oauth = OAuth(app)
+# The OpenID metadata is fetched on first use, not at import time.
 google = oauth.register(
     name='google',
-    client_id=app.config['GOOGLE_CLIENT_ID'],
-    client_secret=app.config['GOOGLE_CLIENT_SECRET'],
+    client_id=os.environ.get('GOOGLE_CLIENT_ID'),
+    client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'),
     server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
     client_kwargs={
         'scope': 'openid email profile'
     }
 )
 
+# Routes are collected here and attached to the app in create_app()
+_routes = []
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
 # ---------- Helper Functions ----------
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return passwords.hash_password(password)
 
 def check_password(hashed_password, user_password):
-    return bcrypt.checkpw(user_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return passwords.check_password(hashed_password, user_password)
+
+def password_hasher_busy(e):
+    flash("The server is busy right now. Please try again in a moment.", "error")
+    return redirect(request.url)
 
 def send_email(subject, recipient, body_html):
     # Print to console for development convenience
@@ -89,22 +99,28 @@ def send_email(subject, recipient, body_html):
         print(f"Links found: {links[0]}")
     print(f"---------------------------\n")
 
-    msg = Message(subject, recipients=[recipient])
-    msg.html = body_html
+    # Delivery happens in the background sender (see mailer.py)
     try:
-        mail.send(msg)
+        mailer.enqueue(subject, recipient, body_html)
     except Exception as e:
-        print(f"Error sending email: {e} (Expected if SMTP not configured)")
+        print(f"Error queueing email: {e}")
 
 def create_verification_token(email):
-    return jwt.encode({'email': email, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)}, app.secret_key, algorithm="HS256")
+    return jwt.encode({'email': email, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)}, current_app.secret_key, algorithm="HS256")
 
 def create_reset_token(email):
-    return jwt.encode({'email': email, 'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=15)}, app.secret_key, algorithm="HS256")
+    return jwt.encode({'email': email, 'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=15)}, current_app.secret_key, algorithm="HS256")
+
+def avatar_url(avatar, size="profile"):
+    if not avatar:
+        return None
+    if avatars.is_hashed_key(avatar):
+        return url_for("avatar_file", filename=avatars.variant_filename(avatar, size))
+    return url_for("static", filename="avatars/" + avatar)
 
 def verify_token(token):
     try:
-        data = jwt.decode(token, app.secret_key, algorithms=["HS256"])
+        data = jwt.decode(token, current_app.secret_key, algorithms=["HS256"])
         return data['email']
     except jwt.ExpiredSignatureError:
         return "expired"
@@ -179,6 +195,9 @@ def init_db():
                 user_id INTEGER NOT NULL,
                 title TEXT,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_message_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                message_count INTEGER DEFAULT 0,
+                last_message_preview VARCHAR(255) DEFAULT NULL,
                 FOREIGN KEY (user_id) REFERENCES users(id)
             )
         ''')
@@ -189,12 +208,21 @@ def init_db():
                 session_id INTEGER,
                 sender TEXT NOT NULL,
                 message TEXT NOT NULL,
+                intent VARCHAR(64) DEFAULT NULL,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users(id),
                 FOREIGN KEY (session_id) REFERENCES sessions(id)
             )
         ''')
 
+        cursor.execute("SHOW COLUMNS FROM messages")
+        message_columns = [column[0] for column in cursor.fetchall()]
+        if 'intent' not in message_columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN intent VARCHAR(64) DEFAULT NULL")
+        cursor.execute("SHOW INDEX FROM messages WHERE Key_name = 'idx_messages_intent'")
+        if not cursor.fetchall():
+            cursor.execute("CREATE INDEX idx_messages_intent ON messages (intent, id)")
+
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS leads (
                 id INTEGER PRIMARY KEY AUTO_INCREMENT,
@@ -204,59 +232,174 @@ def init_db():
                 phone TEXT,
                 course_name TEXT,
                 status VARCHAR(50) DEFAULT 'Pending',
+                source VARCHAR(50) DEFAULT 'enrollment',
+                preferred_time TEXT,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users(id)
             )
         ''')
-        conn.commit()
 
-init_db()
+        cursor.execute("SHOW COLUMNS FROM leads")
+        lead_columns = [column[0] for column in cursor.fetchall()]
+        if 'source' not in lead_columns:
+            cursor.execute("ALTER TABLE leads ADD COLUMN source VARCHAR(50) DEFAULT 'enrollment'")
+        if 'preferred_time' not in lead_columns:
+            cursor.execute("ALTER TABLE leads ADD COLUMN preferred_time TEXT")
+        leads.init_leads_dedup(cursor)
+        chat_sessions.init_session_summary(cursor)
+        purge.init_deletions(cursor)
+        archive.init_archive(cursor)
+        feedback.init_feedback(cursor)
+        transcript_search.init_search_index(cursor)
+
+        mailer.init_outbox(cursor)
+        conn.commit()
 
 # ---------- Load intents ----------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INTENTS_PATH = os.path.join(BASE_DIR, "intents.json")
 
-with open(INTENTS_PATH, "r", encoding="utf-8") as file:
-    intents = json.load(file)
-
-# ---------- Text preprocessing ----------
-def preprocess_text(text):
-    text = text.lower()
-    text = re.sub(r"[^\w\s]", "", text)
-    return text
+intents = None
+
+def load_intents():
+    global intents
+    with open(INTENTS_PATH, "r", encoding="utf-8") as file:
+        intents = json.load(file)
+    return intents
+
+def get_intents():
+    return intents if intents is not None else load_intents()
+
+# ---------- Chat dispatch table ----------
+# Payloads, flow triggers (triggers.json) and the intent keyword index, compiled once
+dispatcher = None
+
+def load_dispatcher():
+    global dispatcher
+    dispatcher = dispatch.build(get_intents(), enrollment.FLOWS)
+    return dispatcher
+
+def get_dispatcher():
+    return dispatcher if dispatcher is not None else load_dispatcher()
+
+# ---------- Lazy bootstrap ----------
+# Work that used to run at import time. It runs once per process on the first
+# request, or up front when a server calls bootstrap() before forking workers.
+STARTUP_TIMINGS = {}
+_bootstrap_lock = threading.Lock()
+_bootstrapped = False
+
+def _timed(name, fn):
+    start = time.perf_counter()
+    result = fn()
+    STARTUP_TIMINGS[name] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+def bootstrap():
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    with _bootstrap_lock:
+        if _bootstrapped:
+            return
+        os.makedirs(AVATAR_UPLOAD_FOLDER, exist_ok=True)
+        _timed("init_db", init_db)
+        _timed("bcrypt_calibrate", passwords.calibrate)
+        _timed("load_intents", load_intents)
+        _timed("build_dispatch", load_dispatcher)
+        _timed("load_asset_manifest", assets.load_manifest)
+        _bootstrapped = True
+
+def _before_request():
+    bootstrap()
+    mailer.start(current_app._get_current_object(), mail)
+    purge.start()
+    feedback.start()
+    metrics.start()
+
+# ---------- Application factory ----------
+def create_app(config=None):
+    app = Flask(__name__)
+    app.secret_key = os.environ.get('SECRET_KEY', 'MITU_SECRET_KEY_2024')
+    app.config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(days=7)
+    # Allow HTTP for OAuth (Development only)
+    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+
+    # Security Headers
+    # Talisman(app, content_security_policy=None) # Disable CSP for now to allow external fonts/styles if needed, or configure it
+
+    # CSRF Protection
+    app.config['WTF_CSRF_TIME_LIMIT'] = None # Token valid for session lifetime
+
+    # Mail Configuration (Example using Gmail)
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'True') == 'True'
+    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'your-email@gmail.com')
+    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'your-app-password')
+    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'your-email@gmail.com')
+
+    app.config['GOOGLE_CLIENT_ID'] = os.environ.get('GOOGLE_CLIENT_ID')
+    app.config['GOOGLE_CLIENT_SECRET'] = os.environ.get('GOOGLE_CLIENT_SECRET')
+
+    if config:
+        app.config.update(config)
+
+    # Behind nginx or a load balancer remote_addr is the proxy's for every client, so the
+    # per-IP rate limits and login_activity would lump everyone together. Trust the
+    # X-Forwarded-For entries added by this many proxies (0 when clients connect directly).
+    trusted_proxies = int(os.environ.get('TRUSTED_PROXIES', 0))
+    if trusted_proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
+
+    csrf.init_app(app)
+    mail.init_app(app)
+    oauth.init_app(app)
+    CORS(app)
+    compression.init_app(app)
+    profiling.init_app(app)
+
+    app.register_error_handler(passwords.PasswordHasherBusy, password_hasher_busy)
+    app.jinja_env.globals["avatar_url"] = avatar_url
+    app.jinja_env.globals["asset_url"] = assets.asset_url
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    metrics.init_app(app)
+    app.before_request(_before_request)
+    ratelimit.init_app(app)
+    return app
 
 # ---------- Intent matching ----------
-def match_intent(user_text):
-    best_intent = None
-    highest_score = 0
-
-    for intent in intents["intents"]:
-        score = 0
-        for keyword in intent.get("keywords", []):
-            # Check for keyword in processed user text
-            if keyword.lower() in user_text:
-                # Score based on how many words match to favor specific keywords
-                # e.g. "data science" (2 words) > "ai" (1 word)
-                score += len(keyword.split())
-
-        if score > highest_score:
-            highest_score = score
-            best_intent = intent
+def route_message(user_input):
+    """(kind, target) for a free-form message; see dispatch.Dispatcher.resolve."""
+    with metrics.timer("mitu_intent_match_seconds"):
+        return get_dispatcher().resolve(dispatch.normalize(user_input))
 
-    return best_intent
+def match_intent(user_text):
+    with metrics.timer("mitu_intent_match_seconds"):
+        return get_dispatcher().match_intent(user_text)
 
 # ---------- Chat response ----------
-def get_response(user_input):
-    user_text = preprocess_text(user_input)
-    intent = match_intent(user_text)
+FALLBACK_TAG = "fallback"
+FALLBACK_REPLY = "Sorry, I couldn't understand that. For more details, please contact us at +91 9960 16 3010 or visit our Pune/Nashik office."
+COURSES_REPLY = "You can explore our courses in the courses section. Just click the button below or the 'Courses' link in the sidebar!"
 
+def intent_reply(intent):
+    """Return (reply, intent tag). Unmatched messages are tagged FALLBACK_TAG (see mine_unmatched.py)."""
     if intent:
-        return random.choice(intent["responses"])
+        return random.choice(intent["responses"]), intent["tag"]
+
+    return FALLBACK_REPLY, FALLBACK_TAG
 
-    return "Sorry, I couldn't understand that. For more details, please contact us at +91 9960 16 3010 or visit our Pune/Nashik office."
+def answer(user_input):
+    return intent_reply(match_intent(dispatch.normalize(user_input)))
+
+def get_response(user_input):
+    return answer(user_input)[0]
 
 # ---------- API endpoint ----------
-@app.route("/")
+@route("/")
 def index():
     if "user_id" not in session:
         return redirect(url_for("login"))
@@ -265,19 +408,37 @@ def index():
     current_session_id = request.args.get("session_id")
     sessions_list = []
     messages = []
+    user_avatar = None
+    sync_history = request.cookies.get("history_cache") == "1"
 
     try:
-        with db.connect() as conn:
+        with db.connect(read_only=True) as conn:
             cursor = conn.cursor()
             
-            # Fetch all sessions for the user
-            cursor.execute("SELECT id, title FROM sessions WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
-            sessions_list = cursor.fetchall()
-
-            # If a session ID is provided, fetch its messages
-            if current_session_id:
-                cursor.execute("SELECT sender, message FROM messages WHERE session_id = ? ORDER BY timestamp ASC", (current_session_id,))
-                messages = cursor.fetchall()
+            # Fetch all sessions for the user, most recently active first
+            sessions_list = chat_sessions.list_sessions(cursor, user_id)
+
+            user = user_cache.get_by_id(user_id, cursor)
+            user_avatar = avatar_url(user.avatar, "sidebar") if user else None
+
+            # If a session ID is provided, fetch its messages, unless the browser keeps its own
+            # copy in IndexedDB and only asks /sync for what it is missing
+            if current_session_id and sync_history:
+                pass
+            elif current_session_id:
+                cursor.execute("SELECT archived_message_id FROM sessions WHERE id = ? AND user_id = ? AND deleted_at IS NULL",
+                               (current_session_id, user_id))
+                row = cursor.fetchone()
+                if row and row[0]:
+                    # Older messages were moved to cold storage; read them back from their segment
+                    messages = [(m["sender"], m["message"], m["id"])
+                                for m in archive.load_session(cursor, current_session_id, user_id)]
+                cursor.execute("""
+                    SELECT m.sender, m.message, m.id FROM messages m JOIN sessions s ON s.id = m.session_id
+                    WHERE m.session_id = ? AND s.user_id = ? AND s.deleted_at IS NULL AND m.id > s.archived_message_id
+                    ORDER BY m.timestamp ASC
+                """, (current_session_id, user_id))
+                messages += cursor.fetchall()
             elif sessions_list:
              # Optional: Redirect to the most recent session if none selected, or stay on new chat
              # For now, let's start a new chat by default if no session specified
@@ -286,20 +447,41 @@ def index():
     except Exception as e:
         print(f"Error fetching data: {e}")
 
-    return render_template("index.html", user_name=session.get("user_name"), messages=messages, sessions=sessions_list, current_session_id=current_session_id)
+    return render_template("index.html", user_name=session.get("user_name"), messages=messages, sessions=sessions_list, current_session_id=current_session_id, user_avatar=user_avatar, user_id=user_id, sync_history=sync_history)
+
+@route("/sync")
+def sync():
+    """Delta for the client-side history cache: see chat_sessions.changes_since."""
+    if "user_id" not in session:
+        return jsonify({"error": "Please log in"}), 401
+
+    args = request.args
+    try:
+        with db.connect(read_only=True) as conn:
+            changes = chat_sessions.changes_since(
+                conn.cursor(), session["user_id"],
+                since=args.get("since", 0, type=int),
+                deleted_since=args.get("deleted_since", 0, type=int),
+                session_id=args.get("session_id", type=int),
+                after=args.get("after", 0, type=int))
+    except Exception as e:
+        print(f"Error syncing history: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify(changes)
 
-@app.route("/new_chat")
+@route("/new_chat")
 def new_chat():
     return redirect(url_for("index"))
 
-@app.route("/signup", methods=["GET", "POST"])
+@route("/signup", methods=["GET", "POST"])
 def signup():
     if request.method == "POST":
         name = request.form["name"]
         email = request.form["email"].lower()
         password = request.form["password"]
         confirm_password = request.form["confirm_password"]
-        role = request.form.get("role", "Student")
+        # Self-service accounts are always students; staff accounts come from create_user.py
+        role = "Student"
 
         if password != confirm_password:
             flash("Passwords do not match!", "error")
@@ -345,7 +527,7 @@ def signup():
 
     return render_template("signup.html")
 
-@app.route("/verify_email/<token>")
+@route("/verify_email/<token>")
 def verify_email(token):
     email = verify_token(token)
     if not email or email == "expired":
@@ -356,11 +538,12 @@ def verify_email(token):
         cursor = conn.cursor()
         cursor.execute("UPDATE users SET is_verified = 1, verification_token = NULL WHERE email = ?", (email,))
         conn.commit()
+    user_cache.invalidate(email=email)
     
     flash("Email verified! You can now login.", "success")
     return redirect(url_for("login"))
 
-@app.route("/login", methods=["GET", "POST"])
+@route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         email = request.form["email"].lower()
@@ -369,7 +552,7 @@ def login():
 
         with db.connect() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id, name, email, password, role, is_verified, failed_attempts, lock_until FROM users WHERE LOWER(email) = ?", (email.lower(),))
+            cursor.execute("SELECT id, name, email, password, role, is_verified, failed_attempts, lock_until FROM users WHERE LOWER(email) = ? AND deleted_at IS NULL", (email.lower(),))
             user = cursor.fetchone()
 
             if not user:
@@ -387,6 +570,14 @@ def login():
 
                 # Reset failed attempts logic removed/simplified
                 cursor.execute("UPDATE users SET failed_attempts = 0, lock_until = NULL WHERE id = ?", (user_id,))
+
+                # Upgrade hashes created with an outdated bcrypt cost. Best effort: with the
+                # hasher pool saturated the login still succeeds and the next one upgrades
+                if passwords.needs_rehash(hashed_pw):
+                    try:
+                        cursor.execute("UPDATE users SET password = ? WHERE id = ?", (hash_password(password), user_id))
+                    except passwords.PasswordHasherBusy:
+                        pass
                 
                 # Log success
                 cursor.execute("INSERT INTO login_activity (user_id, ip_address, status) VALUES (?, ?, ?)", 
@@ -418,7 +609,7 @@ def login():
 
     return render_template("login.html")
 
-@app.route("/forgot_password", methods=["GET", "POST"])
+@route("/forgot_password", methods=["GET", "POST"])
 def forgot_password():
     if request.method == "POST":
         email = request.form["email"].lower()
@@ -441,7 +632,7 @@ def forgot_password():
 
     return render_template("forgot_password.html")
 
-@app.route("/reset_password/<token>", methods=["GET", "POST"])
+@route("/reset_password/<token>", methods=["GET", "POST"])
 def reset_password(token):
     email = verify_token(token)
     if not email or email == "expired":
@@ -463,13 +654,14 @@ def reset_password(token):
             cursor.execute("UPDATE users SET password = ?, reset_token = NULL, reset_token_expiry = NULL, is_verified = 1 WHERE LOWER(email) = ?", 
                            (hashed_pw, email.lower()))
             conn.commit()
+        user_cache.invalidate(email=email)
 
         flash("Password updated successfully! Please login.", "success")
         return redirect(url_for("login"))
 
     return render_template("reset_password.html", token=token)
 
-@app.route("/admin/dashboard")
+@route("/admin/dashboard")
 def admin_dashboard():
     if "user_id" not in session or session.get("user_role") != "Admin":
         flash("Unauthorized access!", "error")
@@ -479,7 +671,7 @@ def admin_dashboard():
     course_filter = request.args.get('course', '')
     status_filter = request.args.get('status', '')
     
-    with db.connect() as conn:
+    with db.connect(read_only=True) as conn:
         cursor = conn.cursor()
         
         # Fetch login activity logs
@@ -492,7 +684,7 @@ def admin_dashboard():
         logs = cursor.fetchall()
 
         # Fetch all registered users
-        cursor.execute("SELECT id, name, email, role, is_verified, created_at FROM users ORDER BY created_at DESC")
+        cursor.execute("SELECT id, name, email, role, is_verified, created_at FROM users WHERE deleted_at IS NULL ORDER BY created_at DESC")
         users = cursor.fetchall()
 
         # Build query for leads with filters
@@ -513,7 +705,7 @@ def admin_dashboard():
         query += " ORDER BY created_at DESC"
         
         cursor.execute(query, params)
-        leads = cursor.fetchall()
+        lead_rows = cursor.fetchall()
 
         # Analytics (Global Totals)
         total_users = len(users)
@@ -536,6 +728,9 @@ def admin_dashboard():
         cursor.execute("SELECT status, COUNT(*) FROM leads GROUP BY status")
         leads_by_status = cursor.fetchall()
 
+        # Per-intent 👍/👎 totals, least liked first
+        intent_satisfaction = feedback.satisfaction(cursor)
+
         # Calculate conversion rate
         conversion_rate = (converted_leads_absolute / total_leads_absolute * 100) if total_leads_absolute > 0 else 0
         conversion_rate = round(conversion_rate, 1)
@@ -543,7 +738,7 @@ def admin_dashboard():
     return render_template("admin_dashboard.html", 
                            logs=logs, 
                            users=users, 
-                           leads=leads,
+                           leads=lead_rows,
                            total_users=total_users,
                            total_leads=total_leads_absolute,
                            leads_by_course=leads_by_course,
@@ -551,12 +746,13 @@ def admin_dashboard():
                            pending_leads=pending_leads_absolute,
                            converted_leads=converted_leads_absolute,
                            conversion_rate=conversion_rate,
+                           intent_satisfaction=intent_satisfaction,
                            course_filter=course_filter,
                            status_filter=status_filter,
                            all_courses=EnrollmentFlow.COURSES,
                            all_statuses=['Pending', 'Contacted', 'Converted'])
 
-@app.route("/admin/verify_user/<int:user_id>")
+@route("/admin/verify_user/<int:user_id>")
 def admin_verify_user(user_id):
     if "user_id" not in session or session.get("user_role") != "Admin":
         flash("Unauthorized access!", "error")
@@ -566,30 +762,112 @@ def admin_verify_user(user_id):
         cursor = conn.cursor()
         cursor.execute("UPDATE users SET is_verified = 1 WHERE id = ?", (user_id,))
         conn.commit()
+    user_cache.invalidate(user_id=user_id)
     
     flash("User verified successfully!", "success")
     return redirect(url_for("admin_dashboard"))
 
-@app.route("/admin/update_lead_status/<int:lead_id>/<status>")
+@route("/admin/deletions")
+def deletion_jobs():
+    """Progress of queued and recent background deletions (see purge.py)."""
+    if "user_id" not in session or session.get("user_role") != "Admin":
+        return jsonify({"error": "Unauthorized"}), 403
+    try:
+        return jsonify({"jobs": purge.jobs(min(request.args.get("limit", 20, type=int), 200))})
+    except Exception as e:
+        print(f"Error fetching deletion jobs: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@route("/metrics")
+def metrics_endpoint():
+    # Admin session, or the scraper's bearer token when METRICS_TOKEN is set
+    token = os.environ.get("METRICS_TOKEN")
+    authorized = session.get("user_role") == "Admin" or (
+        token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"))
+    if not authorized:
+        return jsonify({"error": "Unauthorized"}), 403
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@route("/admin/search")
+def admin_search():
+    if "user_id" not in session or session.get("user_role") not in ("Admin", "Counselor"):
+        flash("Unauthorized access!", "error")
+        return redirect(url_for("index"))
+
+    filters = {key: request.args.get(key, "").strip() for key in ("q", "user", "session_id", "date_from", "date_to")}
+    results = {"results": [], "total": 0, "page": 1, "pages": 0, "searched": False}
+    try:
+        with db.connect(read_only=True) as conn:
+            results = transcript_search.search(
+                conn.cursor(), filters["q"], user=filters["user"],
+                session_id=filters["session_id"] if filters["session_id"].isdigit() else None,
+                date_from=filters["date_from"], date_to=filters["date_to"],
+                page=request.args.get("page", 1, type=int))
+    except Exception as e:
+        print(f"Error searching transcripts: {e}")
+        flash("Search failed. Please try a different query.", "error")
+    return render_template("admin_search.html", filters=filters, **results)
+
+@route("/admin/profiles")
+def admin_profiles():
+    if "user_id" not in session or session.get("user_role") != "Admin":
+        flash("Unauthorized access!", "error")
+        return redirect(url_for("index"))
+    return render_template("admin_profiles.html", profiles=profiling.recent(),
+                           sample_percent=profiling.SAMPLE_PERCENT, profile_dir=profiling.PROFILE_DIR)
+
+@route("/admin/profiles/<filename>")
+def admin_profile_file(filename):
+    if "user_id" not in session or session.get("user_role") != "Admin":
+        return jsonify({"error": "Unauthorized"}), 403
+    path = profiling.artifact_path(filename)
+    if path is None:
+        return jsonify({"error": "Not found"}), 404
+    return send_from_directory(profiling.PROFILE_DIR, filename, as_attachment=True)
+
+@route("/admin/update_lead_status/<int:lead_id>/<status>")
 def update_lead_status(lead_id, status):
     if "user_id" not in session or session.get("user_role") != "Admin":
         flash("Unauthorized access!", "error")
         return redirect(url_for("index"))
     
-    with db.connect() as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE leads SET status = ? WHERE id = ?", (status, lead_id))
-        conn.commit()
+    try:
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE leads SET status = ? WHERE id = ?", (status, lead_id))
+            conn.commit()
+    except Exception as e:
+        # Reopening a lead when the same person already has a newer pending one (uniq_leads_dedup)
+        print(f"Error updating lead {lead_id}: {e}")
+        flash("Could not update the lead: another pending lead has the same email, phone and course.", "error")
+        return redirect(url_for("admin_dashboard"))
     
     flash(f"Lead status updated to {status}", "success")
     return redirect(url_for("admin_dashboard"))
 
-@app.route("/logout")
+@route("/admin/leads/import", methods=["POST"])
+def import_leads():
+    if "user_id" not in session or session.get("user_role") != "Admin":
+        return jsonify({"error": "Unauthorized access!"}), 403
+
+    file = request.files.get("file")
+    if not file or file.filename == "":
+        return jsonify({"error": "No file selected."}), 400
+
+    source = request.form.get("source", "").strip() or "import"
+    try:
+        report = lead_import.import_upload(file, source=source, user_id=None)
+    except Exception as e:
+        print(f"Error importing leads: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify(report.as_dict())
+
+@route("/logout")
 def logout():
     session.clear()
     return redirect(url_for("login"))
 
-@app.route("/chat", methods=["POST"])
+@route("/chat", methods=["POST"])
 def chat():
     if "user_id" not in session:
         return jsonify({"reply": "Please log in to chat."}), 401
@@ -602,47 +880,44 @@ def chat():
     bot_reply = ""
     buttons = []
     progress = ""
+    intent_tag = None
     
-    # Check for active enrollment flow
-    if session.get('flow') == 'enrollment':
-        response = EnrollmentFlow.handle_input(user_message)
+    # Check for an active guided flow (enrollment, demo booking, callback)
+    if session.get('flow') in enrollment.FLOWS:
+        intent_tag = f"flow:{session['flow']}"
+        response = enrollment.handle_input(user_message)
         bot_reply = response.get('reply')
         buttons = response.get('buttons', [])
         progress = response.get('progress', "")
         
-        # Check if lead needs to be saved
+        # Check if lead needs to be saved (the flow has already cleared itself from the session).
+        # Upsert on the email+phone+course key so a double-click or retry can't duplicate it.
         if response.get('save_lead'):
             lead_data = response.get('lead_data')
             try:
                 with db.connect() as conn:
                     cursor = conn.cursor()
-                    cursor.execute("""
-                        INSERT INTO leads (user_id, full_name, email, phone, course_name)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (user_id, lead_data['name'], lead_data['email'], lead_data['phone'], lead_data['course']))
+                    leads.upsert_lead(cursor, user_id, lead_data)
                     conn.commit()
             except Exception as e:
                 print(f"Error saving lead: {e}")
             
-            # Clear session
-            session.pop('flow', None)
-            session.pop('step', None)
-            session.pop('enroll_data', None)
-            
     else:
-        # Check if user wants to enroll
-        # Check intent or keywords "enroll", "register", "join course"
-        user_text_lower = user_message.lower()
-        if any(w in user_text_lower for w in ['enroll', 'register', 'join course', 'book demo']):
-            response = EnrollmentFlow.start_flow()
+        # One pass: quick-reply payloads and flow triggers ("enroll", "book demo", "call me", ...)
+        # from triggers.json, then the intent keywords
+        kind, target = route_message(user_message)
+        if kind == dispatch.FLOW:
+            intent_tag = f"flow:{target}"
+            response = enrollment.start_flow(target)
             bot_reply = response.get('reply')
+            buttons = response.get('buttons', [])
             progress = response.get('progress')
-        elif user_message.strip().lower() == 'courses' or any(w in user_text_lower for w in ['explore courses', 'show courses']):
-            # Special handling for courses
-            bot_reply = "You can explore our courses in the courses section. Just click the button below or the 'Courses' link in the sidebar!"
+        elif kind == dispatch.COURSES:
+            bot_reply = COURSES_REPLY
             progress = "Opening Courses..."
+            intent_tag = "courses"
         else:
-            bot_reply = get_response(user_message)
+            bot_reply, intent_tag = intent_reply(target)
         
         # Add quick replies for general chat (if not in a guided flow)
         if not session.get('flow'):
@@ -655,6 +930,16 @@ def chat():
     try:
         with db.connect() as conn:
             cursor = conn.cursor()
+            # First, so this user's message ids and sync versions follow commit order
+            version = chat_sessions.bump_version(cursor, user_id)
+
+            # A session deleted (e.g. in another tab) or not this user's gets no more messages:
+            # the purge job would trip over them. Carry on in a new session instead.
+            if session_id:
+                cursor.execute("SELECT 1 FROM sessions WHERE id = ? AND user_id = ? AND deleted_at IS NULL",
+                               (session_id, user_id))
+                if not cursor.fetchone():
+                    session_id = None
             
             # Create new session if none exists
             if not session_id:
@@ -663,10 +948,14 @@ def chat():
                 cursor.execute("INSERT INTO sessions (user_id, title) VALUES (?, ?)", (user_id, title))
                 session_id = cursor.lastrowid
             
-            cursor.execute("INSERT INTO messages (user_id, session_id, sender, message) VALUES (?, ?, ?, ?)", 
-                           (user_id, session_id, "user", user_message))
-            cursor.execute("INSERT INTO messages (user_id, session_id, sender, message) VALUES (?, ?, ?, ?)", 
-                           (user_id, session_id, "bot", bot_reply))
+            # Both rows carry the intent the message was answered with
+            cursor.execute("INSERT INTO messages (user_id, session_id, sender, message, intent) VALUES (?, ?, ?, ?, ?)", 
+                           (user_id, session_id, "user", user_message, intent_tag))
+            user_message_id = cursor.lastrowid
+            cursor.execute("INSERT INTO messages (user_id, session_id, sender, message, intent) VALUES (?, ?, ?, ?, ?)", 
+                           (user_id, session_id, "bot", bot_reply, intent_tag))
+            message_id = cursor.lastrowid
+            chat_sessions.record_messages(cursor, session_id, user_id, 2, bot_reply, message_id, version)
             conn.commit()
     except Exception as e:
         print(f"Error saving message: {e}")
@@ -675,18 +964,20 @@ def chat():
     return jsonify({
         "reply": bot_reply, 
         "session_id": session_id, 
+        "message_id": message_id,
+        "user_message_id": user_message_id,
         "buttons": buttons, 
         "progress": progress
     })
 
-@app.route("/google-login")
+@route("/google-login")
 def google_login():
     base_url = os.environ.get('BASE_URL', 'http://127.0.0.1:5000')
     redirect_uri = f"{base_url}/google-callback"
     print(f"DEBUG: Google Redirect URI: {redirect_uri}")
     return google.authorize_redirect(redirect_uri)
 
-@app.route("/google-callback")
+@route("/google-callback")
 def google_authorize():
     try:
         token = google.authorize_access_token()
@@ -698,32 +989,31 @@ def google_authorize():
         
         with db.connect() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM users WHERE email = ? OR google_id = ?", (email, google_id))
-            user = cursor.fetchone()
+            user = user_cache.get_by_email(email, cursor)
+            if not user and google_id:
+                cursor.execute("SELECT email FROM users WHERE google_id = ? AND deleted_at IS NULL", (google_id,))
+                row = cursor.fetchone()
+                if row:
+                    user = user_cache.get_by_email(row[0], cursor)
             
             if not user:
-                # Create a new user for Google login
-                random_password = os.urandom(16).hex()
-                hashed_password = hash_password(random_password)
+                # Create a new user for Google login (no usable password)
                 cursor.execute("""
                     INSERT INTO users (name, email, password, google_id, is_verified, role) 
                     VALUES (?, ?, ?, ?, ?, ?)
-                """, (name, email, hashed_password, google_id, 1, 'Student'))
-                conn.commit()
-                cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-                user = cursor.fetchone()
-            elif not user[5]: # If google_id not stored but email matches
-                cursor.execute("UPDATE users SET google_id = ?, is_verified = 1 WHERE email = ?", (google_id, email))
+                """, (name, email, passwords.UNUSABLE_PASSWORD, google_id, 1, 'Student'))
                 conn.commit()
-            
-            # user schema: id[0], name[1], email[2], password[3], role[4], google_id[5], is_verified[6]...
-            # Fetch updated user to be sure
-            cursor.execute("SELECT id, name, role FROM users WHERE email = ?", (email,))
-            user_data = cursor.fetchone()
-
-            session["user_id"] = user_data[0]
-            session["user_name"] = user_data[1]
-            session["user_role"] = user_data[2]
+                user_id, user_name, user_role = cursor.lastrowid, name, 'Student'
+            else:
+                if not user.google_id: # If google_id not stored but email matches
+                    cursor.execute("UPDATE users SET google_id = ?, is_verified = 1 WHERE id = ?", (google_id, user.id))
+                    conn.commit()
+                    user_cache.invalidate(user_id=user.id)
+                user_id, user_name, user_role = user.id, user.name, user.role
+
+            session["user_id"] = user_id
+            session["user_name"] = user_name
+            session["user_role"] = user_role
             
         return redirect(url_for("index"))
     except Exception as e:
@@ -731,7 +1021,7 @@ def google_authorize():
         flash("Failed to login with Google.", "error")
         return redirect(url_for("login"))
 
-@app.route("/delete_session/<int:session_id>", methods=["POST"])
+@route("/delete_session/<int:session_id>", methods=["POST"])
 def delete_session(session_id):
     if "user_id" not in session:
         return jsonify({"error": "Please log in"}), 401
@@ -741,39 +1031,42 @@ def delete_session(session_id):
     try:
         with db.connect() as conn:
             cursor = conn.cursor()
-            # Ensure the session belongs to the user
-            cursor.execute("SELECT id FROM sessions WHERE id = ? AND user_id = ?", (session_id, user_id))
-            if not cursor.fetchone():
+            # Hide it now (only if it belongs to the user); messages are purged in the background
+            job_id = purge.delete_session(cursor, user_id, session_id)
+            if job_id is None:
                 return jsonify({"error": "Session not found or unauthorized"}), 404
-            
-            # Delete messages first due to foreign key constraints (though mysql might handle it if configured with CASCADE)
-            cursor.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
-            cursor.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
             conn.commit()
+        purge.wake()
             
-        return jsonify({"success": True})
+        return jsonify({"success": True, "job_id": job_id})
     except Exception as e:
         print(f"Error deleting session: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/react", methods=["POST"])
+@route("/react", methods=["POST"])
 def react():
     """Receive 👍/👎 reaction feedback from the user."""
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
-    data = request.get_json()
-    reaction = data.get("reaction", "")  # 'like' or 'dislike'
-    user_id = session["user_id"]
+    data = request.get_json(silent=True) or {}
+    reaction = data.get("reaction", "")  # 'like', 'dislike' or 'none' to take it back
+    try:
+        message_id = int(data.get("message_id"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "message_id is required"}), 400
+    if reaction not in feedback.REACTIONS:
+        return jsonify({"error": "Unknown reaction"}), 400
 
-    # Log reaction (can be extended to store per-message in DB)
-    print(f"[REACTION] user_id={user_id} reaction={reaction}")
+    # Buffered; the feedback writer stores it with the message's intent in its next batch
+    if not feedback.record(session["user_id"], message_id, reaction):
+        return jsonify({"error": "Feedback is temporarily unavailable"}), 503
 
     return jsonify({"status": "ok", "reaction": reaction})
 
 
 # ---------- Profile Routes ----------
-@app.route("/profile", methods=["GET", "POST"])
+@route("/profile", methods=["GET", "POST"])
 def profile():
     if "user_id" not in session:
         return redirect(url_for("login"))
@@ -796,6 +1089,7 @@ def profile():
                     (new_name, new_email, user_id)
                 )
                 conn.commit()
+            user_cache.invalidate(user_id=user_id)
             session["user_name"] = new_name
             flash("Profile updated successfully! ✅", "success")
         except db.IntegrityError:
@@ -804,14 +1098,9 @@ def profile():
         return redirect(url_for("profile"))
 
     # GET – fetch user data + enrollment history
-    with db.connect() as conn:
+    with db.connect(read_only=True) as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, name, email, role, is_verified, created_at, avatar "
-            "FROM users WHERE id = ?",
-            (user_id,)
-        )
-        user = cursor.fetchone()
+        user = user_cache.get_by_id(user_id, cursor)
 
         cursor.execute(
             "SELECT full_name, email, phone, course_name, status, created_at "
@@ -832,7 +1121,7 @@ def profile():
     )
 
 
-@app.route("/profile/change_password", methods=["POST"])
+@route("/profile/change_password", methods=["POST"])
 def change_password():
     if "user_id" not in session:
         return redirect(url_for("login"))
@@ -861,24 +1150,24 @@ def change_password():
 
     with db.connect() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT password FROM users WHERE id = ?", (user_id,))
+        # Always the stored hash, never a cached copy another worker may have outdated
+        cursor.execute("SELECT password FROM users WHERE id = ? AND deleted_at IS NULL", (user_id,))
         row = cursor.fetchone()
 
-    if not row or not check_password(row[0], current_pw):
-        flash("Current password is incorrect.", "error")
-        return redirect(url_for("profile"))
+        if not row or not check_password(row[0], current_pw):
+            flash("Current password is incorrect.", "error")
+            return redirect(url_for("profile"))
 
-    hashed = hash_password(new_pw)
-    with db.connect() as conn:
-        cursor = conn.cursor()
+        hashed = hash_password(new_pw)
         cursor.execute("UPDATE users SET password = ? WHERE id = ?", (hashed, user_id))
         conn.commit()
+    user_cache.invalidate(user_id=user_id)
 
     flash("Password changed successfully! 🔒", "success")
     return redirect(url_for("profile"))
 
 
-@app.route("/profile/upload_avatar", methods=["POST"])
+@route("/profile/upload_avatar", methods=["POST"])
 def upload_avatar():
     if "user_id" not in session:
         return redirect(url_for("login"))
@@ -907,19 +1196,31 @@ def upload_avatar():
         flash("File too large. Maximum size is 2MB.", "error")
         return redirect(url_for("profile"))
 
-    ext      = file.filename.rsplit('.', 1)[1].lower()
-    filename = secure_filename(f"avatar_{user_id}.{ext}")
-    filepath = os.path.join(AVATAR_UPLOAD_FOLDER, filename)
-    file.save(filepath)
+    data = file.read()
+    if not avatars.probe(data):
+        flash("Could not read that image. Please try another file.", "error")
+        return redirect(url_for("profile"))
 
-    with db.connect() as conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE users SET avatar = ? WHERE id = ?", (filename, user_id))
-        conn.commit()
+    # Resizing/encoding happens in the background (see avatars.py)
+    avatars.submit_upload(user_id, data)
 
-    flash("Profile picture updated! 🖼️", "success")
+    flash("Profile picture updated! 🖼️ It may take a moment to appear.", "success")
     return redirect(url_for("profile"))
 
 
+@route("/assets/<path:filename>")
+def asset_file(filename):
+    # Fingerprinted build output from build_assets.py
+    return assets.serve_asset(filename)
+
+
+@route("/media/avatars/<filename>")
+def avatar_file(filename):
+    # Content-hashed names never change, so they can be cached forever
+    response = send_from_directory(AVATAR_UPLOAD_FOLDER, filename, max_age=AVATAR_MAX_AGE)
+    response.headers["Cache-Control"] = f"public, max-age={AVATAR_MAX_AGE}, immutable"
+    return response
+
+
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0')
+    create_app().run(debug=True, host='0.0.0.0')
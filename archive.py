@@ -0,0 +1,491 @@
+# Cold storage for old chat history.
+#
+# Sessions with no activity for ARCHIVE_AFTER_DAYS have their messages moved out of
+# MySQL into append-only segment files under ARCHIVE_DIR. Each session becomes one
+# independently compressed JSONL frame (zstd when installed, gzip otherwise). The
+# archive_chunks table records the segment, byte offset and length of every frame,
+# and each segment has a .idx sidecar with the same entries, so one frame can be read
+# with a single seek. Opening an archived session reads its frames back (see load_session()).
+# A session that gets new messages is simply archived again later as another chunk.
+# Deleting a session or user (purge.py) marks its chunks forgotten, which hides them
+# at once; compact (run it from cron) then rewrites every segment holding a forgotten
+# chunk, once per segment however many deletions it collected, so the text leaves the
+# disk. Segment numbers only ever grow, so a cached frame can never be mistaken for
+# one in a later file of the same name.
+#   python archive.py run [--days 180] [--limit 1000] [--optimize]
+#   python archive.py report | compact [--min-dead 0.3] [--forgotten-min-dead 0]
+import argparse
+import fcntl
+import functools
+import gzip
+import json
+import os
+import re
+import statistics
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import db
+
+# ---------- Settings ----------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 180))
+CODEC = os.environ.get("ARCHIVE_CODEC", "zstd" if zstandard else "gzip")
+SEGMENT_BYTES = int(os.environ.get("ARCHIVE_SEGMENT_BYTES", 64 * 1024 * 1024))
+BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 500))
+MAX_ROWS_PER_SECOND = int(os.environ.get("ARCHIVE_MAX_ROWS_PER_SECOND", 2000))
+
+EXTENSIONS = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+SEGMENT_RE = re.compile(r"^segment-(\d{6})(\.jsonl\.(?:zst|gz))$")
+COUNTER_NAME = ".last_segment"
+
+
+def init_archive(cursor):
+    cursor.execute("SHOW COLUMNS FROM sessions")
+    if 'archived_message_id' not in [column[0] for column in cursor.fetchall()]:
+        # Messages up to this id live in the archive; the hot table only holds newer ones
+        cursor.execute("ALTER TABLE sessions ADD COLUMN archived_message_id INTEGER DEFAULT 0")
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_chunks (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            session_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            segment VARCHAR(64) NOT NULL,
+            byte_offset BIGINT NOT NULL,
+            byte_length INTEGER NOT NULL,
+            message_count INTEGER NOT NULL,
+            first_message_id INTEGER NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            purged TINYINT DEFAULT 0,
+            forgotten TINYINT DEFAULT 0,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_archive_session (session_id, first_message_id),
+            INDEX idx_archive_segment (segment, byte_offset),
+            INDEX idx_archive_user (user_id),
+            INDEX idx_archive_purged (purged),
+            INDEX idx_archive_forgotten (forgotten, segment)
+        )
+    ''')
+    cursor.execute("SHOW COLUMNS FROM archive_chunks")
+    if 'forgotten' not in [column[0] for column in cursor.fetchall()]:
+        # Set by purge.py for deleted sessions and users; compact() erases the bytes
+        cursor.execute("ALTER TABLE archive_chunks ADD COLUMN forgotten TINYINT DEFAULT 0")
+        cursor.execute("CREATE INDEX idx_archive_forgotten ON archive_chunks (forgotten, segment)")
+
+
+# ---------- Frames ----------
+def _compress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("ARCHIVE_CODEC=zstd needs the zstandard package")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, segment):
+    if segment.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{segment} is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def encode(rows):
+    lines = []
+    for message_id, session_id, user_id, sender, message, intent, timestamp in rows:
+        lines.append(json.dumps({
+            "id": message_id, "session_id": session_id, "user_id": user_id, "sender": sender,
+            "message": message, "intent": intent, "timestamp": str(timestamp).replace(" ", "T", 1) if timestamp else None,
+        }, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+@functools.lru_cache(maxsize=64)
+def read_frame(segment, offset, length):
+    # Frames never change once written and segment names are never reused, so
+    # caching by location is safe
+    with open(os.path.join(ARCHIVE_DIR, segment), "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    if len(data) != length:
+        raise OSError(f"{segment} is truncated at {offset}")
+    return tuple(json.loads(line) for line in _decompress(data, segment).decode("utf-8").splitlines())
+
+
+def load(cursor, session_id, user_id, after=0):
+    """Archived messages of a session, oldest first, as dicts. Empty for sessions never archived."""
+    cursor.execute("""
+        SELECT segment, byte_offset, byte_length FROM archive_chunks
+        WHERE session_id = ? AND user_id = ? AND last_message_id > ? AND forgotten = 0 ORDER BY first_message_id
+    """, (session_id, user_id, after))
+    messages = []
+    for segment, offset, length in cursor.fetchall():
+        messages.extend(m for m in read_frame(segment, offset, length) if m["id"] > after)
+    return messages
+
+
+def load_session(cursor, session_id, user_id, after=0):
+    try:
+        return load(cursor, session_id, user_id, after)
+    except FileNotFoundError:
+        # A compaction moved the frames between our lookup and the read; look them up again
+        return load(cursor, session_id, user_id, after)
+
+
+# ---------- Segments ----------
+class SegmentWriter:
+    """Appends frames to a fresh segment per run, rolling over past SEGMENT_BYTES."""
+
+    def __init__(self, codec=CODEC):
+        self.codec = codec
+        self.extension = EXTENSIONS[codec]
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        # One archiver at a time: appends and compaction both assume exclusive access
+        self._lock = open(os.path.join(ARCHIVE_DIR, ".lock"), "w")
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        # The highest number ever handed out, even if compaction has since removed
+        # that file: web workers cache frames by segment name
+        self.counter = os.path.join(ARCHIVE_DIR, COUNTER_NAME)
+        try:
+            with open(self.counter, encoding="utf-8") as f:
+                last = int(f.read())
+        except (OSError, ValueError):
+            last = 0
+        numbers = [int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(ARCHIVE_DIR)) if m]
+        self.number = max(numbers + [last])
+        self.segment = self.data = self.index = None
+
+    def _next_number(self):
+        self.number += 1
+        tmp = self.counter + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(self.number))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.counter)
+        return self.number
+
+    def _open(self):
+        if self.segment is None or self.data.tell() >= SEGMENT_BYTES:
+            self.close_segment()
+            self.segment = f"segment-{self._next_number():06d}{self.extension}"
+            self.data = open(os.path.join(ARCHIVE_DIR, self.segment), "ab")
+            self.index = open(os.path.join(ARCHIVE_DIR, self.segment + ".idx"), "a", encoding="utf-8")
+
+    def append(self, frame, entry):
+        """Write one frame durably; returns (segment, offset)."""
+        self._open()
+        offset = self.data.tell()
+        self.data.write(frame)
+        self.data.flush()
+        os.fsync(self.data.fileno())
+        self.index.write(json.dumps(dict(entry, offset=offset, length=len(frame))) + "\n")
+        self.index.flush()
+        return self.segment, offset
+
+    def close_segment(self):
+        for f in (self.data, self.index):
+            if f is not None:
+                f.close()
+        self.segment = self.data = self.index = None
+
+    def close(self):
+        self.close_segment()
+        self._lock.close()
+
+
+# ---------- Archiving ----------
+def _delete_archived(chunk_id, session_id, first_id, last_id):
+    """Remove a chunk's rows from the hot table in throttled batches."""
+    removed = 0
+    while True:
+        start = time.monotonic()
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM messages WHERE session_id = ? AND id BETWEEN ? AND ? LIMIT ?",
+                           (session_id, first_id, last_id, BATCH_SIZE))
+            count = cursor.rowcount
+            removed += count
+            if count < BATCH_SIZE:
+                cursor.execute("UPDATE archive_chunks SET purged = 1 WHERE id = ?", (chunk_id,))
+            conn.commit()
+        if count < BATCH_SIZE:
+            return removed
+        time.sleep(max(0.0, count / MAX_ROWS_PER_SECOND - (time.monotonic() - start)))
+
+
+def _resume_deletes():
+    # Chunks written by a run that stopped before clearing their rows from MySQL
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, session_id, first_message_id, last_message_id FROM archive_chunks WHERE purged = 0")
+        pending = cursor.fetchall()
+    return sum(_delete_archived(*chunk) for chunk in pending)
+
+
+def archive_session(writer, session_id, user_id, archived_id):
+    """Move one session's hot messages into the archive. Returns the number of messages moved."""
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, session_id, user_id, sender, message, intent, timestamp FROM messages
+            WHERE session_id = ? AND id > ? ORDER BY id
+        """, (session_id, archived_id))
+        rows = cursor.fetchall()
+        if not rows:
+            # Summary ran ahead of the table; nothing to move, so stop picking this session
+            cursor.execute("UPDATE sessions SET archived_message_id = last_message_id WHERE id = ?", (session_id,))
+            conn.commit()
+            return 0
+        first_id, last_id = rows[0][0], rows[-1][0]
+        entry = {"session_id": session_id, "user_id": user_id, "messages": len(rows),
+                 "first_id": first_id, "last_id": last_id}
+        frame = _compress(encode(rows), writer.codec)
+        segment, offset = writer.append(frame, entry)
+        cursor.execute("""
+            INSERT INTO archive_chunks (session_id, user_id, segment, byte_offset, byte_length, message_count,
+                                        first_message_id, last_message_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (session_id, user_id, segment, offset, len(frame), len(rows), first_id, last_id))
+        chunk_id = cursor.lastrowid
+        cursor.execute("UPDATE sessions SET archived_message_id = ? WHERE id = ?", (last_id, session_id))
+        conn.commit()
+    _delete_archived(chunk_id, session_id, first_id, last_id)
+    return len(rows)
+
+
+def run(days=AFTER_DAYS, limit=None, progress=None):
+    """Archive every session idle for `days`. Returns (sessions, messages) moved."""
+    writer = SegmentWriter()
+    sessions = moved = 0
+    try:
+        _resume_deletes()
+        last_id = 0
+        while limit is None or sessions < limit:
+            with db.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT id, user_id, archived_message_id FROM sessions
+                    WHERE id > ? AND deleted_at IS NULL AND last_message_id > archived_message_id
+                      AND last_message_at < NOW() - INTERVAL ? DAY
+                    ORDER BY id LIMIT ?
+                """, (last_id, days, BATCH_SIZE))
+                due = cursor.fetchall()
+            if not due:
+                break
+            for session_id, user_id, archived_id in due[:None if limit is None else limit - sessions]:
+                moved += archive_session(writer, session_id, user_id, archived_id or 0)
+                sessions += 1
+                if progress and sessions % 100 == 0:
+                    progress(sessions, moved)
+            last_id = due[-1][0]
+    finally:
+        writer.close()
+    return sessions, moved
+
+
+def _chunks_in(name):
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, session_id, user_id, byte_offset, byte_length, message_count,
+                   first_message_id, last_message_id, forgotten
+            FROM archive_chunks WHERE segment = ? ORDER BY byte_offset
+        """, (name,))
+        return cursor.fetchall()
+
+
+def _rewrite(writer, name, chunks, drop=()):
+    """Copy a segment's chunks, except the ids in drop, to the writer's current segment,
+    then remove the old file and the dropped chunks' rows.
+
+    Safe to repeat after a crash: the old file goes only once the moves are committed,
+    and dropped rows only once the old file is gone.
+    """
+    path = os.path.join(ARCHIVE_DIR, name)
+    if os.path.exists(path):
+        if name == writer.segment:
+            writer.close_segment()
+        moves = []
+        with open(path, "rb") as f:
+            for chunk_id, session_id, user_id, offset, length, count, first_id, last_id, _ in chunks:
+                if chunk_id in drop:
+                    continue
+                f.seek(offset)
+                frame = f.read(length)
+                if not name.endswith(writer.extension):
+                    # Written under the other ARCHIVE_CODEC
+                    frame = _compress(_decompress(frame, name), writer.codec)
+                entry = {"session_id": session_id, "user_id": user_id, "messages": count,
+                         "first_id": first_id, "last_id": last_id}
+                moves.append((chunk_id, len(frame)) + writer.append(frame, entry))
+        if moves:
+            with db.connect() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("UPDATE archive_chunks SET segment = ?, byte_offset = ?, byte_length = ? WHERE id = ?",
+                                   [(segment, offset, length, chunk_id) for chunk_id, length, segment, offset in moves])
+                conn.commit()
+        os.remove(path)
+        if os.path.exists(path + ".idx"):
+            os.remove(path + ".idx")
+    if drop:
+        with db.connect() as conn:
+            conn.cursor().executemany("DELETE FROM archive_chunks WHERE id = ?", [(chunk_id,) for chunk_id in drop])
+            conn.commit()
+
+
+def compact(min_dead=0.3, forgotten_min_dead=0.0, progress=None):
+    """Rewrite segments where at least min_dead of the bytes are unreferenced, dropping
+    forgotten chunks. Segments holding a forgotten chunk use forgotten_min_dead instead,
+    so by default deleted history always leaves the disk on the next run.
+    """
+    writer = SegmentWriter()
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT segment FROM archive_chunks WHERE forgotten = 1")
+        holding_forgotten = {row[0] for row in cursor.fetchall()}
+    freed = 0
+    try:
+        # Forgotten rows whose file is already gone (a rewrite interrupted) are cleaned up too
+        for name in sorted(set(os.listdir(ARCHIVE_DIR)) | holding_forgotten):
+            if not SEGMENT_RE.match(name) or name == writer.segment:
+                continue
+            path = os.path.join(ARCHIVE_DIR, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            chunks = _chunks_in(name)
+            drop = {row[0] for row in chunks if row[8]}
+            live = sum(row[4] for row in chunks if row[0] not in drop)
+            threshold = forgotten_min_dead if drop else min_dead
+            if (size and 1 - live / size < threshold) or not (size or drop):
+                continue
+            _rewrite(writer, name, chunks, drop)
+            freed += max(0, size - live)
+            if progress:
+                progress(name, len(chunks) - len(drop), size)
+    finally:
+        writer.close()
+    read_frame.cache_clear()
+    return freed
+
+
+# ---------- Reporting ----------
+def _sample_history_latency(cursor, sample=50):
+    """Median and p95 ms of the history query index() runs, over recently active sessions."""
+    cursor.execute("""
+        SELECT id, user_id FROM sessions WHERE deleted_at IS NULL AND message_count > 0
+        ORDER BY last_message_at DESC LIMIT ?
+    """, (sample,))
+    timings = []
+    for session_id, user_id in cursor.fetchall():
+        start = time.perf_counter()
+        cursor.execute("""
+            SELECT m.sender, m.message FROM messages m JOIN sessions s ON s.id = m.session_id
+            WHERE m.session_id = ? AND s.user_id = ? AND s.deleted_at IS NULL AND m.id > s.archived_message_id
+            ORDER BY m.timestamp ASC
+        """, (session_id, user_id))
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    if not timings:
+        return None, None
+    timings.sort()
+    return round(statistics.median(timings), 2), round(timings[int(0.95 * (len(timings) - 1))], 2)
+
+
+def _sample_archive_latency(cursor, sample=20):
+    cursor.execute("SELECT DISTINCT session_id, user_id FROM archive_chunks WHERE forgotten = 0 "
+                   "ORDER BY session_id DESC LIMIT ?", (sample,))
+    timings = []
+    for session_id, user_id in cursor.fetchall():
+        read_frame.cache_clear()
+        start = time.perf_counter()
+        load(cursor, session_id, user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 2) if timings else None
+
+
+def report():
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT table_rows, data_length + index_length FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = 'messages'
+        """)
+        rows, size = cursor.fetchone() or (0, 0)
+        cursor.execute("SELECT COUNT(DISTINCT session_id), COALESCE(SUM(message_count), 0) FROM archive_chunks "
+                       "WHERE forgotten = 0")
+        archived_sessions, archived_messages = cursor.fetchone()
+        p50, p95 = _sample_history_latency(cursor)
+        archive_ms = _sample_archive_latency(cursor)
+    archive_bytes = sum(os.path.getsize(os.path.join(ARCHIVE_DIR, n)) for n in os.listdir(ARCHIVE_DIR)
+                        if SEGMENT_RE.match(n)) if os.path.isdir(ARCHIVE_DIR) else 0
+    return {
+        "hot_rows_estimate": int(rows or 0),
+        "hot_bytes": int(size or 0),
+        "history_query_p50_ms": p50,
+        "history_query_p95_ms": p95,
+        "archived_sessions": int(archived_sessions or 0),
+        "archived_messages": int(archived_messages or 0),
+        "archive_bytes": archive_bytes,
+        "archive_load_p50_ms": archive_ms,
+    }
+
+
+def _print_report(title, numbers):
+    print(f"{title}:")
+    print(f"  messages table  ~{numbers['hot_rows_estimate']} rows, {numbers['hot_bytes'] / 1048576:.1f} MiB")
+    print(f"  history query   p50 {numbers['history_query_p50_ms']} ms, p95 {numbers['history_query_p95_ms']} ms")
+    print(f"  archive         {numbers['archived_messages']} messages in {numbers['archived_sessions']} sessions, "
+          f"{numbers['archive_bytes'] / 1048576:.1f} MiB, load p50 {numbers['archive_load_p50_ms']} ms")
+
+
+# ---------- Admin CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move idle chat sessions to compressed cold storage.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="archive sessions idle for --days")
+    p.add_argument("--days", type=int, default=AFTER_DAYS)
+    p.add_argument("--limit", type=int, help="stop after this many sessions")
+    p.add_argument("--optimize", action="store_true",
+                   help="OPTIMIZE TABLE messages afterwards so InnoDB gives the space back")
+    sub.add_parser("report", help="hot table size and history query latency")
+    p = sub.add_parser("compact", help="erase deleted sessions from the segments and reclaim space")
+    p.add_argument("--min-dead", type=float, default=0.3, help="rewrite when this share of a segment is unreferenced")
+    p.add_argument("--forgotten-min-dead", type=float, default=0.0,
+                   help="the same, for segments holding deleted sessions (0: always rewrite them)")
+    args = parser.parse_args(argv)
+
+    with db.connect() as conn:
+        init_archive(conn.cursor())
+        conn.commit()
+
+    if args.command == "report":
+        _print_report("Current", report())
+        return
+
+    if args.command == "compact":
+        freed = compact(args.min_dead, args.forgotten_min_dead, progress=lambda name, chunks, size: print(f"  rewrote {name} ({chunks} live chunks)"))
+        print(f"Freed {freed / 1048576:.1f} MiB.")
+        return
+
+    before = report()
+    _print_report("Before", before)
+    start = time.perf_counter()
+    sessions, moved = run(args.days, args.limit,
+                          progress=lambda s, m: print(f"  {s} sessions, {m} messages archived"))
+    print(f"Archived {moved} messages from {sessions} sessions in {time.perf_counter() - start:.1f}s ({CODEC}).")
+    if args.optimize:
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("OPTIMIZE TABLE messages")
+            cursor.fetchall()
+    _print_report("After", report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import json
+import mimetypes
+import os
+
+from flask import abort, send_file, url_for
+
+import compression
+from build_assets import DIST_DIR, MANIFEST_PATH
+
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = None
+
+
+def load_manifest():
+    global _manifest
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            _manifest = json.load(f)
+    except (OSError, ValueError):
+        # No build yet: fall back to the plain static handler
+        _manifest = {}
+    return _manifest
+
+
+def asset_url(filename):
+    """Drop-in for url_for('static', filename=...) that points at the fingerprinted copy."""
+    manifest = _manifest if _manifest is not None else load_manifest()
+    hashed = manifest.get(filename)
+    if hashed is None:
+        return url_for("static", filename=filename)
+    return url_for("asset_file", filename=hashed)
+
+
+def serve_asset(filename):
+    path = os.path.normpath(os.path.join(DIST_DIR, filename))
+    if not path.startswith(DIST_DIR + os.sep) or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    accepted = compression.accepted_encodings()
+    chosen, serve_path = None, path
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(path + suffix):
+            chosen, serve_path = encoding, path + suffix
+            break
+
+    response = send_file(serve_path, mimetype=mimetype, max_age=ASSET_MAX_AGE, conditional=True, etag=True)
+    if chosen:
+        response.headers["Content-Encoding"] = chosen
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    return response
@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+import db
+import user_cache
+
+# ---------- Settings ----------
+AVATAR_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'avatars')
+# Variant name -> square edge in pixels
+SIZES = {"sidebar": 64, "profile": 160}
+WEBP_QUALITY = int(os.environ.get("AVATAR_WEBP_QUALITY", 82))
+# Unreferenced variants younger than this may belong to an upload still in flight.
+GC_GRACE_SECONDS = 3600
+# Only files process_upload() wrote; legacy "avatar_<id>.<ext>" uploads are never collected.
+VARIANT_RE = re.compile(r"^([0-9a-f]{20})-(%s)\.webp$" % "|".join(SIZES))
+
+_executor = None
+
+
+def _reset_after_fork():
+    global _executor
+    _executor = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def variant_filename(key, size_name):
+    return f"{key}-{size_name}.webp"
+
+
+def is_hashed_key(avatar):
+    # Legacy uploads are stored as "avatar_<id>.<ext>"; processed ones as a bare hash.
+    return bool(avatar) and "." not in avatar
+
+
+def probe(data):
+    """Cheap header-only check that the upload is an image Pillow can decode."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.format is not None
+    except Exception:
+        return False
+
+
+# ---------- Processing ----------
+def render_variants(data):
+    """Decode once and return {size_name: webp_bytes}."""
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        largest = max(SIZES.values())
+        square = ImageOps.fit(img, (largest, largest), Image.LANCZOS)
+
+    variants = {}
+    for size_name, edge in SIZES.items():
+        resized = square if edge == largest else square.resize((edge, edge), Image.LANCZOS)
+        out = io.BytesIO()
+        resized.save(out, "WEBP", quality=WEBP_QUALITY, method=6)
+        variants[size_name] = out.getvalue()
+    return variants
+
+
+def _write_atomic(path, payload):
+    tmp = f"{path}.tmp{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def process_upload(user_id, data):
+    variants = render_variants(data)
+    key = hashlib.sha256(b"".join(variants[name] for name in sorted(variants))).hexdigest()[:20]
+
+    for size_name, payload in variants.items():
+        path = os.path.join(AVATAR_FOLDER, variant_filename(key, size_name))
+        try:
+            # Same image uploaded again: refresh the mtime so collect_garbage() treats it as new
+            os.utime(path)
+        except FileNotFoundError:
+            _write_atomic(path, payload)
+
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET avatar = ? WHERE id = ?", (key, user_id))
+        conn.commit()
+    user_cache.invalidate(user_id=user_id)
+    return key
+
+
+def _process_safely(user_id, data):
+    try:
+        process_upload(user_id, data)
+    except Exception as e:
+        print(f"Error processing avatar for user {user_id}: {e}")
+
+
+def submit_upload(user_id, data):
+    """Queue decoding/encoding off the request thread."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="avatars")
+    return _executor.submit(_process_safely, user_id, data)
+
+
+# ---------- Garbage collection ----------
+# Run from cron rather than the upload path, so only one process scans the folder:
+#   python avatars.py gc [--grace 3600]
+def collect_garbage(grace=GC_GRACE_SECONDS):
+    """Delete avatar variants no user row points at any more."""
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT avatar FROM users WHERE avatar IS NOT NULL")
+        referenced = {row[0] for row in cursor.fetchall()}
+
+    cutoff = time.time() - grace
+    removed = 0
+    for name in os.listdir(AVATAR_FOLDER):
+        match = VARIANT_RE.match(name)
+        if not match or match.group(1) in referenced:
+            continue
+        path = os.path.join(AVATAR_FOLDER, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avatar file maintenance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gc = sub.add_parser("gc", help="delete unreferenced avatar variants")
+    gc.add_argument("--grace", type=int, default=GC_GRACE_SECONDS,
+                    help="keep unreferenced files younger than this many seconds")
+    args = parser.parse_args()
+
+    if args.command == "gc":
+        print(f"Removed {collect_garbage(args.grace)} unreferenced avatar files.")
+
+
+if __name__ == "__main__":
+    main()
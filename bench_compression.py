@@ -0,0 +1,86 @@
+# Wire size and CPU cost of compressing representative pages.
+# Renders the real templates with synthetic data, no database needed:
+#   python bench_compression.py [--sessions 40] [--messages 200] [--users 500] [--leads 1000]
+import argparse
+import json
+import time
+
+import app as app_module
+import compression
+from enrollment import EnrollmentFlow
+
+
+def make_app():
+    # The real app, so every url_for() in the templates resolves. Rendering inside a
+    # test request context never runs bootstrap(), so no database is touched.
+    return app_module.create_app()
+
+
+def build_payloads(app, args):
+    bot_reply = ("Our <b>Data Science & AI</b> course covers Python, statistics, machine learning "
+                 "and deep learning with hands-on projects. Duration: 8 weeks.")
+    messages = []
+    for i in range(args.messages):
+        messages.append(("user", f"Tell me about course number {i} and the fees", 2 * i + 1))
+        messages.append(("bot", bot_reply, 2 * i + 2))
+    sessions = [(i, f"Question about course {i}...", "2025-01-01 10:00:00", 2 * args.messages, bot_reply[:80])
+                for i in range(args.sessions)]
+    users = [(i, f"Student {i}", f"student{i}@example.com", "Student", i % 2, "2025-01-01 10:00:00")
+             for i in range(args.users)]
+    leads = [(i, f"Lead {i}", f"lead{i}@example.com", "9876543210", EnrollmentFlow.COURSES[i % 6],
+              ("Pending", "Contacted", "Converted")[i % 3], "2025-01-01 10:00:00") for i in range(args.leads)]
+    logs = [("2025-01-01 10:00:00", f"Student {i}", f"student{i}@example.com", "127.0.0.1", "Success")
+            for i in range(100)]
+
+    with app.test_request_context():
+        index_html = app.jinja_env.get_template("index.html").render(
+            user_name="Student", messages=messages, sessions=sessions, current_session_id="1", user_avatar=None)
+        admin_html = app.jinja_env.get_template("admin_dashboard.html").render(
+            logs=logs, users=users, leads=leads, total_users=len(users), total_leads=len(leads),
+            leads_by_course=[(c, 10) for c in EnrollmentFlow.COURSES],
+            leads_by_status=[("Pending", 1), ("Contacted", 1), ("Converted", 1)],
+            pending_leads=1, converted_leads=1, conversion_rate=33.3,
+            intent_satisfaction=[(f"intent_{i}", 40 - i, i, round(100 * (40 - i) / 40, 1)) for i in range(20)],
+            course_filter="", status_filter="",
+            all_courses=EnrollmentFlow.COURSES, all_statuses=["Pending", "Contacted", "Converted"])
+
+    chat_json = json.dumps({"reply": bot_reply, "session_id": 1, "progress": "",
+                            "buttons": [{"label": "Enroll Now", "payload": "enroll"},
+                                        {"label": "Explore Courses", "payload": "courses"},
+                                        {"label": "Contact Us", "payload": "contact"}]})
+    return {"index.html": index_html.encode(), "admin_dashboard.html": admin_html.encode(),
+            "/chat json": chat_json.encode()}
+
+
+def measure(data, encoding, repeat, **levels):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = compression.compress(data, encoding, **levels)
+    return len(out), (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--leads", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = build_payloads(make_app(), args)
+    variants = [("gzip", {"gzip_level": level}) for level in (1, 6, 9)]
+    if compression.brotli is not None:
+        variants += [("br", {"brotli_quality": q}) for q in (1, 4, 6)]
+
+    print(f"{'payload':<22}{'variant':<12}{'raw':>10}{'wire':>10}{'ratio':>8}{'ms':>9}")
+    for name, data in payloads.items():
+        below = " (below COMPRESS_MIN_SIZE, sent raw)" if len(data) < compression.MIN_SIZE else ""
+        for encoding, levels in variants:
+            size, ms = measure(data, encoding, args.repeat, **levels)
+            label = f"{encoding}-{list(levels.values())[0]}"
+            print(f"{name:<22}{label:<12}{len(data):>10}{size:>10}{size / len(data):>8.2f}{ms:>9.3f}{below}")
+
+
+if __name__ == "__main__":
+    main()
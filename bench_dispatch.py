@@ -0,0 +1,93 @@
+# Per-message routing cost of /chat: the compiled dispatch table against the old
+# chain of substring checks and per-intent keyword loop, on the same messages.
+# Also checks that both pick the same route for every sample.
+#   python bench_dispatch.py [--runs 20000]
+import argparse
+import json
+import os
+import re
+import time
+
+import dispatch
+import enrollment
+
+INTENTS_PATH = os.path.join(dispatch.BASE_DIR, "intents.json")
+
+SAMPLES = {
+    "payload": ["enroll", "courses", "contact"],
+    "trigger": ["I want to enroll in python", "can I book demo for cloud?", "please call me back tomorrow",
+                "show courses"],
+    "intent": ["hello", "What is the fee for data science?", "Tell me about the linux admin course",
+               "where is your office in pune", "thanks a lot!"],
+    "fallback": ["asdf qwerty", "Do you have hostel facilities near the campus for girls?"],
+}
+
+
+def legacy_route(message, intents, triggers):
+    """/chat routing as it was: flow triggers, courses checks, then preprocess + keyword loop."""
+    lower = message.lower()
+    for name, phrases in triggers["flows"].items():
+        if any(phrase in lower for phrase in phrases):
+            return (dispatch.FLOW, name)
+    if message.strip().lower() == "courses" or any(w in lower for w in triggers["courses"]):
+        return (dispatch.COURSES, None)
+    text = re.sub(r"[^\w\s]", "", message.lower())
+    best_intent, highest_score = None, 0
+    for intent in intents["intents"]:
+        score = 0
+        for keyword in intent.get("keywords", []):
+            if keyword.lower() in text:
+                score += len(keyword.split())
+        if score > highest_score:
+            highest_score, best_intent = score, intent
+    return (dispatch.INTENT, best_intent)
+
+
+def _name(route):
+    kind, target = route
+    return f"{kind}:{target['tag'] if isinstance(target, dict) else target}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(INTENTS_PATH, encoding="utf-8") as f:
+        intents = json.load(f)
+    triggers = dispatch.load_triggers()
+    start = time.perf_counter()
+    table = dispatch.build(intents, enrollment.FLOWS, triggers)
+    print(f"compile: {(time.perf_counter() - start) * 1000:.2f} ms, {len(table.exact)} exact entries, "
+          f"{len(table.keywords)} keywords")
+
+    print(f"{'category':<10}{'legacy us':>11}{'compiled us':>13}{'speedup':>9}")
+    mismatches = []
+    for category, messages in SAMPLES.items():
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            for message in messages:
+                legacy_route(message, intents, triggers)
+        legacy = (time.perf_counter() - start) / (args.runs * len(messages)) * 1e6
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            for message in messages:
+                table.resolve(dispatch.normalize(message))
+        compiled = (time.perf_counter() - start) / (args.runs * len(messages)) * 1e6
+        print(f"{category:<10}{legacy:>11.2f}{compiled:>13.2f}{legacy / compiled:>8.1f}x")
+
+        for message in messages:
+            old, new = _name(legacy_route(message, intents, triggers)), _name(table.resolve(dispatch.normalize(message)))
+            if old != new and category != "payload":
+                mismatches.append((message, old, new))
+
+    # Payloads are allowed to differ: "contact" now goes straight to its intent by configuration
+    for message, old, new in mismatches:
+        print(f"route changed for {message!r}: {old} -> {new}")
+    if not mismatches:
+        print("All sample messages route the same as before.")
+
+
+if __name__ == "__main__":
+    main()
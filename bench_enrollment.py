@@ -0,0 +1,58 @@
+# Per-step cost of the guided flows (enrollment, demo, callback).
+#   python bench_enrollment.py [--runs 20000]
+import argparse
+import time
+
+from flask import Flask
+
+import enrollment
+
+SAMPLE_INPUT = {
+    "name": "Roshni Borade",
+    "email": "roshni@example.com",
+    "phone": "+91 99601 63010",
+    "course": "data science",
+    "preferred_time": "Saturday 11 AM",
+}
+
+
+def bench_flow(app, flow, runs):
+    inputs = [SAMPLE_INPUT[step.field] for step in flow.steps] + ["yes"]
+    labels = ["start"] + [step.field for step in flow.steps] + ["confirm"]
+    totals = [0.0] * len(labels)
+
+    with app.test_request_context():
+        for _ in range(runs):
+            start = time.perf_counter()
+            enrollment.start_flow(flow.name)
+            totals[0] += time.perf_counter() - start
+            for i, text in enumerate(inputs, 1):
+                start = time.perf_counter()
+                enrollment.handle_input(text)
+                totals[i] += time.perf_counter() - start
+
+    return [(label, total / runs * 1e6) for label, total in zip(labels, totals)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    for flow in enrollment.FLOWS.values():
+        print(f"--- {flow.name} ({args.runs} runs) ---")
+        for label, us in bench_flow(app, flow, args.runs):
+            print(f"{label:<16}{us:8.2f} us/step")
+
+    print("--- course resolution ---")
+    for text in ("Data Science & AI", "data science", "pyhton", "something else"):
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            enrollment.COURSE_INDEX.resolve(text)
+        print(f"{text!r:<20}{(time.perf_counter() - start) / args.runs * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
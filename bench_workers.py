@@ -0,0 +1,114 @@
+# /chat throughput vs. gunicorn worker count. Needs MySQL configured as for app.py.
+#   python bench_workers.py --workers 1 2 4 --clients 16 --duration 15
+import argparse
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = "Bench!12345"
+MESSAGES = ["What courses do you offer?", "Tell me about data science", "fees for python",
+            "Where is your office?", "Do you provide placement support?"]
+
+
+def csrf_token(html):
+    match = re.search(r'name="csrf_token" value="([^"]+)"', html) or re.search(r'id="csrf_token" value="([^"]+)"', html)
+    return match.group(1)
+
+
+def logged_in_client(base_url):
+    client = requests.Session()
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    token = csrf_token(client.get(f"{base_url}/signup").text)
+    client.post(f"{base_url}/signup", data={"csrf_token": token, "name": "Bench User", "email": email,
+                                            "password": PASSWORD, "confirm_password": PASSWORD})
+    token = csrf_token(client.get(f"{base_url}/login").text)
+    client.post(f"{base_url}/login", data={"csrf_token": token, "email": email, "password": PASSWORD})
+    client.headers["X-CSRFToken"] = csrf_token(client.get(f"{base_url}/").text)
+    return client
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base_url}/login", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def run_load(base_url, clients, duration):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+    sessions = [logged_in_client(base_url) for _ in range(clients)]
+
+    def worker(client):
+        session_id, i = "", 0
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                r = client.post(f"{base_url}/chat", json={"message": MESSAGES[i % len(MESSAGES)], "session_id": session_id})
+                ok = r.status_code == 200
+                if ok:
+                    session_id = r.json().get("session_id") or session_id
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+            i += 1
+
+    threads = [threading.Thread(target=worker, args=(s,)) for s in sessions]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for count in args.workers:
+        # Every client signs up and chats from 127.0.0.1 in a closed loop; the rate
+        # limiter would turn most of the load into 429s
+        env = dict(os.environ, WEB_CONCURRENCY=str(count), BIND=f"127.0.0.1:{args.port}",
+                   RATELIMIT_ENABLED="False")
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                                  cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(base_url)
+            latencies, errors = run_load(base_url, args.clients, args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        if latencies:
+            q = statistics.quantiles(latencies, n=100)
+            print(f"{count:>8}{len(latencies) / args.duration:>10.1f}{q[49] * 1000:>10.1f}{q[94] * 1000:>10.1f}{errors:>8}")
+        else:
+            print(f"{count:>8}{'-':>10}{'-':>10}{'-':>10}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Fingerprint static assets and write gzip/brotli variants plus a manifest.
+# Run after changing anything in static/:  python build_assets.py
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+# User uploads and build output are not part of the pipeline
+SKIP_DIRS = {"avatars", "dist"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+# Below this size a compressed variant saves less than the extra file costs.
+MIN_COMPRESS_SIZE = 256
+
+
+def iter_assets():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = [d for d in dirs if not (root == STATIC_DIR and d in SKIP_DIRS)]
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, "/"), path
+
+
+def fingerprint(rel_path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = os.path.splitext(rel_path)
+    return f"{stem}.{digest}{ext}"
+
+
+def build():
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    for rel_path, path in iter_assets():
+        with open(path, "rb") as f:
+            content = f.read()
+        hashed = fingerprint(rel_path, content)
+        out_path = os.path.join(DIST_DIR, hashed)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "wb") as f:
+            f.write(content)
+
+        if os.path.splitext(rel_path)[1].lower() in COMPRESSIBLE and len(content) >= MIN_COMPRESS_SIZE:
+            with open(out_path + ".gz", "wb") as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(out_path + ".br", "wb") as f:
+                    f.write(brotli.compress(content, quality=11))
+
+        manifest[rel_path] = hashed
+        print(f"{rel_path} -> dist/{hashed}")
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        print("brotli not installed; only gzip variants were written.")
+    print(f"Wrote {len(manifest)} assets to {MANIFEST_PATH}")
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,208 @@
+import argparse
+import re
+import time
+
+import archive
+import db
+
+# The sidebar reads last activity, message count and a preview straight off the
+# session row; /chat keeps them current in the same transaction as the messages.
+# Sessions from before the columns existed are filled in by a one-off batched job
+# rather than at startup:
+#   python chat_sessions.py [--chunk 1000]
+PREVIEW_LENGTH = 120
+SYNC_PAGE_SIZE = 500
+TAG_RE = re.compile(r"<[^>]+>")
+MARKUP_RE = re.compile(r"[*_`#]+")
+SPACE_RE = re.compile(r"\s+")
+
+
+def init_session_summary(cursor):
+    cursor.execute("SHOW COLUMNS FROM sessions")
+    columns = [column[0] for column in cursor.fetchall()]
+    added = False
+    if 'last_message_at' not in columns:
+        cursor.execute("ALTER TABLE sessions ADD COLUMN last_message_at DATETIME DEFAULT CURRENT_TIMESTAMP")
+        added = True
+    if 'message_count' not in columns:
+        cursor.execute("ALTER TABLE sessions ADD COLUMN message_count INTEGER DEFAULT 0")
+        added = True
+    if 'last_message_preview' not in columns:
+        cursor.execute("ALTER TABLE sessions ADD COLUMN last_message_preview VARCHAR(255) DEFAULT NULL")
+        added = True
+    if 'last_message_id' not in columns:
+        cursor.execute("ALTER TABLE sessions ADD COLUMN last_message_id INTEGER DEFAULT 0")
+        added = True
+    if 'sync_version' not in columns:
+        # The session changed since a client's cursor iff this moved past it (see bump_version)
+        cursor.execute("ALTER TABLE sessions ADD COLUMN sync_version BIGINT DEFAULT 0")
+    if added:
+        print("Session summary columns added; existing sessions show no activity until you run: python chat_sessions.py")
+
+    cursor.execute("SHOW INDEX FROM sessions WHERE Key_name = 'idx_sessions_user_activity'")
+    if not cursor.fetchall():
+        cursor.execute("CREATE INDEX idx_sessions_user_activity ON sessions (user_id, last_message_at)")
+    cursor.execute("SHOW INDEX FROM sessions WHERE Key_name = 'idx_sessions_user_sync'")
+    if not cursor.fetchall():
+        cursor.execute("CREATE INDEX idx_sessions_user_sync ON sessions (user_id, sync_version)")
+
+    cursor.execute("SHOW COLUMNS FROM users")
+    if 'sync_version' not in [column[0] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE users ADD COLUMN sync_version BIGINT NOT NULL DEFAULT 0")
+
+    # Deleted sessions leave a tombstone so cached clients can drop them on their next sync
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS session_tombstones (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            user_id INTEGER NOT NULL,
+            session_id INTEGER NOT NULL,
+            version BIGINT NOT NULL DEFAULT 0,
+            deleted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_tombstones_version (user_id, version)
+        )
+    ''')
+    cursor.execute("SHOW COLUMNS FROM session_tombstones")
+    if 'version' not in [column[0] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE session_tombstones ADD COLUMN version BIGINT NOT NULL DEFAULT 0")
+    cursor.execute("SHOW INDEX FROM session_tombstones WHERE Key_name = 'idx_tombstones_version'")
+    if not cursor.fetchall():
+        cursor.execute("CREATE INDEX idx_tombstones_version ON session_tombstones (user_id, version)")
+
+
+def backfill_summaries(chunk, progress=None):
+    """Fill the summary columns from messages, one range of session ids per transaction."""
+    last_id, updated = 0, 0
+    while True:
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM sessions WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            # Archived sessions have no messages left to count; their numbers were kept when archived
+            cursor.execute("""
+                UPDATE sessions s
+                LEFT JOIN (SELECT session_id, COUNT(*) AS total, MAX(timestamp) AS latest, MAX(id) AS latest_id
+                           FROM messages WHERE session_id BETWEEN ? AND ? GROUP BY session_id) m ON m.session_id = s.id
+                SET s.message_count = COALESCE(m.total, 0),
+                    s.last_message_at = COALESCE(m.latest, s.created_at),
+                    s.last_message_id = COALESCE(m.latest_id, 0)
+                WHERE s.id BETWEEN ? AND ? AND s.archived_message_id = 0
+            """, (ids[0], ids[-1], ids[0], ids[-1]))
+            conn.commit()
+        last_id = ids[-1]
+        updated += len(ids)
+        if progress:
+            progress(updated, last_id)
+    return updated
+
+
+def preview(text):
+    text = SPACE_RE.sub(" ", MARKUP_RE.sub("", TAG_RE.sub(" ", text or ""))).strip()
+    return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 3].rstrip() + "..."
+
+
+def bump_version(cursor, user_id):
+    """Take the user's next sync version. Call it first in the transaction.
+
+    The row lock it takes is held until commit, so a user's writes get versions (and
+    message ids) in commit order: a client that has seen version N has seen every
+    change up to N, which AUTO_INCREMENT ids alone don't guarantee.
+    """
+    cursor.execute("UPDATE users SET sync_version = LAST_INSERT_ID(sync_version + 1) WHERE id = ?", (user_id,))
+    return cursor.lastrowid
+
+
+def record_messages(cursor, session_id, user_id, count, last_message, last_message_id, version):
+    cursor.execute("""
+        UPDATE sessions
+        SET last_message_at = NOW(), message_count = message_count + ?, last_message_preview = ?,
+            last_message_id = ?, sync_version = ?
+        WHERE id = ? AND user_id = ?
+    """, (count, preview(last_message), last_message_id, version, session_id, user_id))
+
+
+def add_tombstone(cursor, user_id, session_id, version):
+    cursor.execute("INSERT INTO session_tombstones (user_id, session_id, version) VALUES (?, ?, ?)",
+                   (user_id, session_id, version))
+
+
+def list_sessions(cursor, user_id):
+    """Sidebar rows: (id, title, last_message_at, message_count, last_message_preview), newest activity first."""
+    cursor.execute("""
+        SELECT id, title, last_message_at, message_count, last_message_preview FROM sessions
+        WHERE user_id = ? AND deleted_at IS NULL ORDER BY last_message_at DESC
+    """, (user_id,))
+    return cursor.fetchall()
+
+
+# ---------- Delta sync ----------
+def _iso(value):
+    # db.connect() hands DATETIMEs back as "YYYY-MM-DD HH:MM:SS" strings
+    return str(value).replace(" ", "T", 1) if value else None
+
+
+def changes_since(cursor, user_id, since=0, deleted_since=0, session_id=None, after=0, limit=SYNC_PAGE_SIZE):
+    """Everything a cached client is missing.
+
+    since / deleted_since are the cursors from the previous response (sync versions,
+    see bump_version); after is the newest message id the client holds for session_id.
+    """
+    # A first sync (since=0) also needs sessions no write has versioned yet
+    cursor.execute("""
+        SELECT id, title, last_message_at, message_count, last_message_preview, sync_version FROM sessions
+        WHERE user_id = ? AND sync_version > ? AND deleted_at IS NULL ORDER BY sync_version
+    """, (user_id, since if since else -1))
+    sessions = [{"id": sid, "title": title, "last_message_at": _iso(last_at), "message_count": count,
+                 "preview": text, "version": version}
+                for sid, title, last_at, count, text, version in cursor.fetchall()]
+
+    cursor.execute("SELECT version, session_id FROM session_tombstones WHERE user_id = ? AND version > ? ORDER BY version",
+                   (user_id, deleted_since))
+    tombstones = cursor.fetchall()
+
+    messages, has_more = [], False
+    if session_id:
+        cursor.execute("SELECT archived_message_id FROM sessions WHERE id = ? AND user_id = ? AND deleted_at IS NULL",
+                       (session_id, user_id))
+        row = cursor.fetchone()
+        archived_id = (row[0] or 0) if row else 0
+        if archived_id > after:
+            messages = [{"id": m["id"], "session_id": int(session_id), "sender": m["sender"],
+                         "message": m["message"], "timestamp": m["timestamp"]}
+                        for m in archive.load_session(cursor, session_id, user_id, after)[:limit + 1]]
+        if len(messages) <= limit:
+            cursor.execute("""
+                SELECT id, sender, message, timestamp FROM messages
+                WHERE session_id = ? AND user_id = ? AND id > ? ORDER BY id LIMIT ?
+            """, (session_id, user_id, max(after, archived_id), limit + 1 - len(messages)))
+            messages += [{"id": mid, "session_id": int(session_id), "sender": sender, "message": text,
+                          "timestamp": _iso(ts)} for mid, sender, text, ts in cursor.fetchall()]
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+
+    return {
+        "sessions": sessions,
+        "deleted_sessions": [sid for _, sid in tombstones],
+        "messages": messages,
+        "has_more": has_more,
+        "cursor": {
+            "since": max([since] + [s["version"] for s in sessions]),
+            "deleted_since": tombstones[-1][0] if tombstones else deleted_since,
+            "after": messages[-1]["id"] if messages else after,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill session summaries (activity, count) from messages.")
+    parser.add_argument("--chunk", type=int, default=1000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    total = backfill_summaries(args.chunk, progress=lambda n, last: print(f"  {n} sessions (up to id {last})"))
+    print(f"Backfilled {total} sessions in {time.perf_counter() - start:.1f}s. Previews fill in on the next message.")
+
+
+if __name__ == "__main__":
+    main()
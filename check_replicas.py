@@ -0,0 +1,48 @@
+# Which MySQL server db.connect() hands out for reads, with MYSQL_REPLICAS set.
+# Two local instances are enough; set MYSQL_REPLICA_MAX_LAG=-1 if the second one
+# is not actually replicating from the first:
+#   MYSQL_PORT=3306 MYSQL_REPLICAS=127.0.0.1:3307 python check_replicas.py
+import time
+
+from flask import Flask, session
+
+import db
+
+
+def server(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT @@hostname, @@port, @@read_only")
+    host, port, read_only = cursor.fetchone()
+    return f"{host}:{port}{' (read only)' if read_only else ''}"
+
+
+def main():
+    if not db.REPLICA_HOSTS:
+        print("MYSQL_REPLICAS is not set; every connection goes to the primary.")
+        return
+
+    with db.connect() as conn:
+        print(f"primary:                   {server(conn)}")
+    with db.connect(read_only=True) as conn:
+        print(f"read:                      {server(conn)}")
+
+    app = Flask(__name__)
+    app.secret_key = "check_replicas"
+    with app.test_request_context():
+        session["user_id"] = 0
+        with db.connect() as conn:
+            # Any write marks the user; a temporary table is gone once the connection closes
+            conn.cursor().execute("CREATE TEMPORARY TABLE check_replicas (id INTEGER)")
+            conn.commit()
+        with db.connect(read_only=True) as conn:
+            print(f"read right after a write:  {server(conn)}")
+        time.sleep(db.READ_YOUR_WRITES_SECONDS + 0.1)
+        with db.connect(read_only=True) as conn:
+            print(f"read {db.READ_YOUR_WRITES_SECONDS:g}s later:            {server(conn)}")
+
+    for status in db.replica_status():
+        print(status)
+
+
+if __name__ == "__main__":
+    main()
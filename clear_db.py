@@ -1,26 +1,8 @@
-import db
+# Delete every user, session and message in small batches (see purge.py).
+#   python clear_db.py --yes [--background]
+import sys
 
-
-def clear_users():
-    try:
-        conn = db.connect()
-        cursor = conn.cursor()
-        
-        # Deleting in order to respect potential foreign keys
-        print("Cleaning up database...")
-        cursor.execute("DELETE FROM messages")
-        cursor.execute("DELETE FROM sessions")
-        cursor.execute("DELETE FROM login_activity")
-        cursor.execute("DELETE FROM users")
-        
-        conn.commit()
-        print("✅ Successfully deleted all users and related activity.")
-        
-    except Exception as e:
-        print(f"❌ Error: {e}")
-    finally:
-        if conn:
-            conn.close()
+import purge
 
 if __name__ == "__main__":
-    clear_users()
+    purge.main(["all"] + sys.argv[1:])
@@ -0,0 +1,90 @@
+import gzip
+import os
+
+from flask import request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ---------- Settings ----------
+MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 500))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+# Dynamic responses are compressed per request, so keep brotli on a cheap quality.
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BR_QUALITY", 4))
+MIMETYPES = {
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+}
+
+
+def accepted_encodings():
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        token, _, params = part.partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                pass
+        if q > 0:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def compress(data, encoding, gzip_level=None, brotli_quality=None):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY if brotli_quality is None else brotli_quality)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if gzip_level is None else gzip_level, mtime=0)
+
+
+def _skip():
+    metrics.inc("mitu_compression_responses_total", (("result", "skipped"),))
+
+
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    accepted = accepted_encodings()
+    if brotli is not None and "br" in accepted:
+        encoding = "br"
+    elif "gzip" in accepted:
+        encoding = "gzip"
+    else:
+        _skip()
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        _skip()
+        return response
+
+    compressed = compress(data, encoding)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    if response.headers.get("ETag"):
+        # A compressed body is a different representation
+        response.set_etag(response.get_etag()[0] + "-" + encoding, weak=True)
+
+    metrics.inc("mitu_compression_responses_total", (("result", encoding),))
+    metrics.inc("mitu_compression_bytes_total", (("direction", "in"),), len(data))
+    metrics.inc("mitu_compression_bytes_total", (("direction", "out"),), len(compressed))
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
+
@@ -0,0 +1,58 @@
+# Create a staff account (or change an existing account's role) straight in the
+# database; the signup form only ever creates students.
+#   python create_user.py admin@example.com --role Admin [--name "Site Admin"] [--password ...]
+import argparse
+import getpass
+
+import db
+import passwords
+
+ROLES = ("Student", "Counselor", "Admin")
+
+
+def find_user(email):
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users WHERE LOWER(email) = ? AND deleted_at IS NULL", (email.strip().lower(),))
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_user(email, password=None, name="", role="Student"):
+    """Insert a verified account, or give an existing one this role (and password, if given).
+
+    Returns (user_id, created).
+    """
+    email = email.strip().lower()
+    hashed = passwords.hash_password(password) if password else None
+    user_id = find_user(email)
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        if user_id is not None:
+            cursor.execute("UPDATE users SET role = ?, password = COALESCE(?, password) WHERE id = ?",
+                           (role, hashed, user_id))
+            return user_id, False
+        if hashed is None:
+            raise ValueError("a new account needs a password")
+        cursor.execute("INSERT INTO users (name, email, password, role, is_verified) VALUES (?, ?, ?, ?, 1)",
+                       (name or email.split("@")[0], email, hashed, role))
+        return cursor.lastrowid, True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("email")
+    parser.add_argument("--role", choices=ROLES, default="Admin")
+    parser.add_argument("--name", default="")
+    parser.add_argument("--password", help="asked for when creating an account without one")
+    args = parser.parse_args()
+
+    password = args.password
+    if password is None and find_user(args.email) is None:
+        password = getpass.getpass("Password: ")
+    user_id, created = create_user(args.email, password, args.name, args.role)
+    print(f"{'Created' if created else 'Updated'} user {user_id} ({args.email}) as {args.role}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,150 @@
+import itertools
 import os
 import pymysql
 import re
+import threading
+import time
 import pymysql.converters
 from pymysql.constants import FIELD_TYPE
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 
+# ---------- Read replicas ----------
+# connect(read_only=True) goes to a replica from MYSQL_REPLICAS ("host[:port],...")
+# unless the user wrote something in the last READ_YOUR_WRITES_SECONDS, or no replica
+# is reachable and within MYSQL_REPLICA_MAX_LAG seconds of the primary; then it gets
+# the primary like every other connection.
+REPLICA_HOSTS = [h.strip() for h in os.environ.get("MYSQL_REPLICAS", "").split(",") if h.strip()]
+REPLICA_MAX_LAG = float(os.environ.get("MYSQL_REPLICA_MAX_LAG", 2))    # -1 skips the lag check
+REPLICA_CHECK_INTERVAL = float(os.environ.get("MYSQL_REPLICA_CHECK_INTERVAL", 5))
+REPLICA_RETRY_SECONDS = float(os.environ.get("MYSQL_REPLICA_RETRY_SECONDS", 30))
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get("MYSQL_REPLICA_CONNECT_TIMEOUT", 2))
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 5))
+READ_RE = re.compile(r"^\s*(SELECT|SHOW|EXPLAIN|DESCRIBE|DESC|WITH)\b", re.IGNORECASE)
+MAX_TRACKED_WRITERS = 10000
+
+
+class Replica:
+    def __init__(self, spec):
+        host, _, port = spec.partition(":")
+        self.host = host
+        self.port = int(port or 3306)
+        self.down_until = 0.0
+        self.checked_at = 0.0
+        self.lag = None
+        self.error = None
+
+
+_replicas = [Replica(spec) for spec in REPLICA_HOSTS]
+_next_replica = itertools.count()
+_writers_lock = threading.Lock()
+_recent_writers = {}    # user_id -> monotonic deadline of their read-your-writes window
+
+
+def _reset_after_fork():
+    global _next_replica, _writers_lock, _recent_writers
+    _next_replica = itertools.count()
+    _writers_lock = threading.Lock()
+    _recent_writers = {}
+    for replica in _replicas:
+        replica.checked_at = 0.0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _current_user():
+    from flask import has_request_context, session
+    return session if has_request_context() else None
+
+
+def note_write():
+    """Send this user's reads to the primary for the next READ_YOUR_WRITES_SECONDS."""
+    user_session = _current_user()
+    if user_session is None:
+        return
+    # In the signed session cookie so every worker honours it, and in memory for
+    # requests already in flight on this one
+    user_session["_db_primary_until"] = time.time() + READ_YOUR_WRITES_SECONDS
+    user_id = user_session.get("user_id")
+    if user_id is not None:
+        now = time.monotonic()
+        with _writers_lock:
+            if len(_recent_writers) >= MAX_TRACKED_WRITERS:
+                for key in [k for k, deadline in _recent_writers.items() if deadline <= now]:
+                    del _recent_writers[key]
+            _recent_writers[user_id] = now + READ_YOUR_WRITES_SECONDS
+
+
+def _recently_wrote():
+    user_session = _current_user()
+    if user_session is None:
+        return False
+    if user_session.get("_db_primary_until", 0) > time.time():
+        return True
+    return _recent_writers.get(user_session.get("user_id"), 0) > time.monotonic()
+
+
+def _replica_lag(conn):
+    """Seconds behind the primary, or None when the server is not replicating."""
+    with conn.cursor() as cursor:
+        for statement in ("SHOW REPLICA STATUS", "SHOW SLAVE STATUS"):
+            try:
+                cursor.execute(statement)
+            except pymysql.err.ProgrammingError:
+                continue    # MySQL before 8.0.22 only knows the old spelling
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            status = dict(zip((column[0] for column in cursor.description), row))
+            return status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    return None
+
+
+def _replica_connection(conv):
+    """An open connection to a healthy replica, round robin, or None."""
+    now = time.monotonic()
+    start = next(_next_replica)
+    for i in range(len(_replicas)):
+        replica = _replicas[(start + i) % len(_replicas)]
+        if replica.down_until > now:
+            continue
+        try:
+            conn = _open(replica.host, replica.port, conv, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+        except pymysql.err.MySQLError as e:
+            replica.error = str(e)
+            replica.down_until = now + REPLICA_RETRY_SECONDS
+            print(f"Replica {replica.host}:{replica.port} unavailable, using the primary: {e}")
+            continue
+        if REPLICA_MAX_LAG >= 0 and now - replica.checked_at >= REPLICA_CHECK_INTERVAL:
+            try:
+                replica.lag = _replica_lag(conn)
+                replica.error = None
+            except pymysql.err.MySQLError as e:
+                replica.lag, replica.error = None, str(e)
+            replica.checked_at = now
+        if REPLICA_MAX_LAG >= 0 and (replica.lag is None or replica.lag > REPLICA_MAX_LAG):
+            # Lagging or not replicating: skip it until the next check
+            conn.close()
+            replica.down_until = replica.checked_at + REPLICA_CHECK_INTERVAL
+            continue
+        return conn
+    return None
+
+
+def replica_status():
+    return [{"replica": f"{r.host}:{r.port}", "lag": r.lag, "error": r.error,
+             "available": r.down_until <= time.monotonic()} for r in _replicas]
+
+
 class MySQLCursorWrapper:
-    def __init__(self, cursor):
+    def __init__(self, cursor, connection=None):
         self.cursor = cursor
+        self.connection = connection
+        self.read_only = connection is not None and connection.read_only
 
     def _convert_query(self, query):
         # Extremely simple ? to %s converter.
@@ -18,12 +153,26 @@ class MySQLCursorWrapper:
         # Just replace ? with %s
         return query.replace('?', '%s')
 
+    def _track(self, query):
+        if self.connection is None or READ_RE.match(query):
+            return
+        if self.connection.read_only:
+            raise pymysql.err.ProgrammingError(f"write on a read-only (replica) connection: {query.strip()[:60]}")
+        self.connection.wrote = True
+
     def execute(self, query, args=None):
+        self._track(query)
         converted_query = self._convert_query(query)
-        if args is not None:
-            self.cursor.execute(converted_query, args)
-        else:
-            self.cursor.execute(converted_query)
+        with metrics.timer("mitu_db_query_seconds"):
+            if args is not None:
+                self.cursor.execute(converted_query, args)
+            else:
+                self.cursor.execute(converted_query)
+
+    def executemany(self, query, seq_of_args):
+        self._track(query)
+        with metrics.timer("mitu_db_query_seconds"):
+            self.cursor.executemany(self._convert_query(query), seq_of_args)
 
     def fetchall(self):
         return self.cursor.fetchall()
@@ -35,15 +184,28 @@ class MySQLCursorWrapper:
     def lastrowid(self):
         return self.cursor.lastrowid
 
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
 class MySQLConnectionWrapper:
-    def __init__(self, conn):
+    def __init__(self, conn, read_only=False):
         self.conn = conn
+        self.read_only = read_only
+        self.wrote = False
 
     def cursor(self):
-        return MySQLCursorWrapper(self.conn.cursor())
+        # Writes are only tracked when replicas are configured
+        return MySQLCursorWrapper(self.conn.cursor(), self if _replicas else None)
 
     def commit(self):
         self.conn.commit()
+        if self.wrote:
+            self.wrote = False
+            note_write()
+
+    def rollback(self):
+        self.conn.rollback()
 
     def close(self):
         self.conn.close()
@@ -56,9 +218,39 @@ class MySQLConnectionWrapper:
             self.commit()
         self.close()
 
-def connect(database=None):
+def _open(host, port, conv, connect_timeout=10):
+    return pymysql.connect(
+        host=host,
+        port=port,
+        user=os.environ.get("MYSQL_USER", "root"),
+        password=os.environ.get("MYSQL_PASSWORD", ""),
+        database=os.environ.get("MYSQL_DB", "mitu_chatbot_db"),
+        cursorclass=pymysql.cursors.Cursor, # default returns tuple
+        conv=conv,
+        connect_timeout=connect_timeout
+    )
+
+def connect(database=None, read_only=False):
+    """read_only=True may be served by a replica; see MYSQL_REPLICAS above."""
+    conv = pymysql.converters.conversions.copy()
+    conv[FIELD_TYPE.DATETIME] = str
+    conv[FIELD_TYPE.TIMESTAMP] = str
+    conv[FIELD_TYPE.DATE] = str
+
+    if read_only and _replicas:
+        if _recently_wrote():
+            reason = "read_your_writes"
+        else:
+            conn = _replica_connection(conv)
+            if conn is not None:
+                metrics.inc("mitu_db_connections_total", (("target", "replica"), ("reason", "read")))
+                return MySQLConnectionWrapper(conn, read_only=True)
+            reason = "replica_unavailable"
+        metrics.inc("mitu_db_connections_total", (("target", "primary"), ("reason", reason)))
+
     # Connect to MySQL server without database first to ensure the db exists
     host = os.environ.get("MYSQL_HOST", "localhost")
+    port = int(os.environ.get("MYSQL_PORT", 3306))
     user = os.environ.get("MYSQL_USER", "root")
     password = os.environ.get("MYSQL_PASSWORD", "")
     db_name = os.environ.get("MYSQL_DB", "mitu_chatbot_db")
@@ -66,6 +258,7 @@ def connect(database=None):
     # Check if database exists, create if not
     temp_conn = pymysql.connect(
         host=host,
+        port=port,
         user=user,
         password=password
     )
@@ -73,20 +266,7 @@ def connect(database=None):
         cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
     temp_conn.close()
 
-    conv = pymysql.converters.conversions.copy()
-    conv[FIELD_TYPE.DATETIME] = str
-    conv[FIELD_TYPE.TIMESTAMP] = str
-    conv[FIELD_TYPE.DATE] = str
-
-    conn = pymysql.connect(
-        host=host,
-        user=user,
-        password=password,
-        database=db_name,
-        cursorclass=pymysql.cursors.Cursor, # default returns tuple
-        conv=conv
-    )
-    return MySQLConnectionWrapper(conn)
+    return MySQLConnectionWrapper(_open(host, port, conv))
 
 # Fallback for Exceptions
 IntegrityError = pymysql.err.IntegrityError
@@ -0,0 +1,118 @@
+# One-time cleanup: backfill leads.dedup_key, merge duplicate pending leads, then add the unique index.
+#   python dedup_leads.py [--chunk 1000] [--dry-run]
+import argparse
+import time
+
+import db
+import leads
+
+
+def backfill_keys(chunk):
+    last_id, updated = 0, 0
+    while True:
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, email, phone, course_name FROM leads
+                WHERE dedup_key IS NULL AND id > ? ORDER BY id LIMIT ?
+            """, (last_id, chunk))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany("UPDATE leads SET dedup_key = ? WHERE id = ?",
+                               [(leads.dedup_key(email, phone, course), lead_id) for lead_id, email, phone, course in rows])
+            conn.commit()
+        last_id = rows[-1][0]
+        updated += len(rows)
+        print(f"  backfilled {updated} keys (up to id {last_id})")
+    return updated
+
+
+def merge_group(rows):
+    """rows: (id, user_id, full_name, preferred_time), all Pending.
+
+    The oldest lead keeps its place in the queue and takes the newest name, the
+    newest preferred time and any user_id it is missing. Returns (survivor, values, doomed).
+    """
+    rows = sorted(rows)
+    survivor = rows[0]
+    newest_first = rows[::-1]
+    user_id = survivor[1] if survivor[1] is not None else next((r[1] for r in newest_first if r[1] is not None), None)
+    preferred_time = next((r[3] for r in newest_first if r[3]), survivor[3])
+    return survivor[0], (user_id, newest_first[0][2], preferred_time), [r[0] for r in rows[1:]]
+
+
+def merge_duplicates(chunk, dry_run):
+    merged_groups, removed = 0, 0
+    while True:
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT open_key FROM leads WHERE open_key IS NOT NULL
+                GROUP BY open_key HAVING COUNT(*) > 1 LIMIT ?
+            """, (chunk,))
+            keys = [row[0] for row in cursor.fetchall()]
+            if not keys:
+                break
+
+            placeholders = ", ".join("?" for _ in keys)
+            cursor.execute(f"""
+                SELECT open_key, id, user_id, full_name, preferred_time FROM leads
+                WHERE open_key IN ({placeholders}) FOR UPDATE
+            """, keys)
+            groups = {}
+            for key, *row in cursor.fetchall():
+                groups.setdefault(key, []).append(tuple(row))
+
+            updates, doomed = [], []
+            for rows in groups.values():
+                survivor, (user_id, full_name, preferred_time), losers = merge_group(rows)
+                updates.append((user_id, full_name, preferred_time, survivor))
+                doomed.extend(losers)
+
+            if dry_run:
+                print(f"  would merge {len(groups)} groups, removing {len(doomed)} leads")
+                return len(groups), len(doomed)
+
+            # One transaction: the survivor never loses what the duplicates knew
+            cursor.executemany("""
+                UPDATE leads SET user_id = ?, full_name = ?, preferred_time = ?, updated_at = NOW()
+                WHERE id = ?
+            """, updates)
+            cursor.executemany("DELETE FROM leads WHERE id = ?", [(lead_id,) for lead_id in doomed])
+            conn.commit()
+        merged_groups += len(groups)
+        removed += len(doomed)
+        print(f"  merged {merged_groups} groups, removed {removed} duplicate leads")
+    return merged_groups, removed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with db.connect() as conn:
+        leads.init_leads_dedup(conn.cursor())
+
+    print("Backfilling dedup keys...")
+    backfill_keys(args.chunk)
+    print("Merging duplicates...")
+    groups, removed = merge_duplicates(args.chunk, args.dry_run)
+
+    if not args.dry_run:
+        # Leads added while this ran may duplicate old ones that had no key yet
+        backfill_keys(args.chunk)
+        merge_duplicates(args.chunk, False)
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SHOW INDEX FROM leads WHERE Key_name = 'uniq_leads_dedup'")
+            if not cursor.fetchall() and leads.add_dedup_index(cursor):
+                print("Unique index uniq_leads_dedup created.")
+    print(f"Done in {time.perf_counter() - start:.1f}s: {groups} groups merged, {removed} leads removed.")
+
+
+if __name__ == "__main__":
+    main()
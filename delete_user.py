@@ -1,56 +1,8 @@
-import db
-import os
+# Delete a user and everything they own, in small batches (see purge.py).
+#   python delete_user.py someone@example.com [--background]
+import sys
 
-EMAIL_TO_DELETE = 'roshh5432105@gmail.com'
-
-def delete_user_by_email(email):
-    if not os.path.exists(DATABASE):
-        print(f"Error: {DATABASE} not found.")
-        return
-
-    try:
-        conn = db.connect()
-        cursor = conn.cursor()
-
-        # Find user ID
-        cursor.execute("SELECT id FROM users WHERE email = ?", (email,))
-        user_row = cursor.fetchone()
-
-        if not user_row:
-             print(f"User with email {email} not found.")
-             return
-
-        user_id = user_row[0]
-        print(f"Deleting user {email} (ID: {user_id})")
-
-        # Delete from messages
-        cursor.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
-        print("Deleted related messages.")
-
-        # Delete from sessions
-        cursor.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
-        print("Deleted related sessions.")
-
-        # Delete from login_activity
-        cursor.execute("DELETE FROM login_activity WHERE user_id = ?", (user_id,))
-        print("Deleted related login activity.")
-
-        # Delete from leads (new table)
-        cursor.execute("DELETE FROM leads WHERE user_id = ?", (user_id,))
-        print("Deleted related leads.")
-
-        # Delete from users
-        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        print("Deleted user record.")
-
-        conn.commit()
-        print("\nSuccessfully deleted user and related data.")
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
-    finally:
-        if conn:
-            conn.close()
+import purge
 
 if __name__ == "__main__":
-    delete_user_by_email(EMAIL_TO_DELETE)
+    purge.main(["user"] + sys.argv[1:])
@@ -0,0 +1,101 @@
+# Routing for free-form /chat messages, compiled once from triggers.json and intents.json.
+#
+# A message is normalized once (lowercased, punctuation stripped, whitespace
+# collapsed). Quick-reply payloads, trigger phrases and intent keywords sent on
+# their own resolve with one dict lookup. Otherwise the trigger phrases are looked
+# for inside the message in priority order, and anything left falls through to the
+# keyword index over intents.
+import json
+import os
+import re
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRIGGERS_PATH = os.environ.get("TRIGGERS_PATH", os.path.join(BASE_DIR, "triggers.json"))
+
+PUNCT_RE = re.compile(r"[^\w\s]+")
+
+# Route kinds: (FLOW, flow name), (COURSES, None), (INTENT, intent dict or None for no match)
+FLOW = "flow"
+COURSES = "courses"
+INTENT = "intent"
+
+
+def normalize(text):
+    return " ".join(PUNCT_RE.sub("", text.lower()).split())
+
+
+def load_triggers(path=TRIGGERS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Dispatcher:
+    def __init__(self, triggers, intents, flows):
+        self.intents = tuple(intents["intents"])
+        by_tag = {intent["tag"]: intent for intent in self.intents}
+
+        # Phrases found anywhere in a message, in priority order: flows in file order,
+        # then the courses page
+        phrases = {}
+        for name, flow_phrases in triggers.get("flows", {}).items():
+            if name not in flows:
+                raise ValueError(f"triggers.json: unknown flow {name!r}")
+            for phrase in flow_phrases:
+                phrases.setdefault(normalize(phrase), (FLOW, name))
+        for phrase in triggers.get("courses", []):
+            phrases.setdefault(normalize(phrase), (COURSES, None))
+        phrases.pop("", None)
+        self.phrases = tuple(phrases.items())
+
+        # Keyword index: every distinct keyword once, with the intents it scores for
+        index = {}
+        for i, intent in enumerate(self.intents):
+            for keyword in intent.get("keywords", []):
+                # Multi-word keywords weigh more: "data science" beats "ai"
+                index.setdefault(keyword.lower(), []).append((i, len(keyword.split())))
+        self.keywords = tuple((keyword, tuple(hits)) for keyword, hits in index.items())
+
+        # Whole-message lookups: payloads as configured, plus every phrase and keyword
+        # pre-resolved exactly as the slow path would resolve it
+        self.exact = {}
+        for payload, target in triggers.get("payloads", {}).items():
+            self.exact[normalize(payload)] = self._parse_target(target, flows, by_tag)
+        for text in [phrase for phrase, _ in self.phrases] + [keyword for keyword, _ in self.keywords]:
+            if text not in self.exact:
+                self.exact[text] = self._search(text)
+
+    @staticmethod
+    def _parse_target(target, flows, by_tag):
+        kind, _, name = target.partition(":")
+        if kind == FLOW and name in flows:
+            return (FLOW, name)
+        if kind == COURSES and not name:
+            return (COURSES, None)
+        if kind == INTENT and name in by_tag:
+            return (INTENT, by_tag[name])
+        raise ValueError(f"triggers.json: bad payload target {target!r}")
+
+    def match_intent(self, text):
+        """Best-scoring intent for normalized text, or None. Ties go to the earlier intent."""
+        scores = [0] * len(self.intents)
+        for keyword, hits in self.keywords:
+            if keyword in text:
+                for i, weight in hits:
+                    scores[i] += weight
+        best = max(scores, default=0)
+        return self.intents[scores.index(best)] if best > 0 else None
+
+    def _search(self, text):
+        for phrase, route in self.phrases:
+            if phrase in text:
+                return route
+        return (INTENT, self.match_intent(text))
+
+    def resolve(self, text):
+        """Route for a normalized message."""
+        route = self.exact.get(text)
+        return route if route is not None else self._search(text)
+
+
+def build(intents, flows, triggers=None):
+    return Dispatcher(triggers if triggers is not None else load_triggers(), intents, flows)
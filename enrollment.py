@@ -1,129 +1,305 @@
+import difflib
 import re
 from flask import session
 
+COURSES = (
+    "Data Science & AI",
+    "Python Programming",
+    "Linux Administration",
+    "Cloud Computing",
+    "IoT & Raspberry Pi",
+    "Full Stack Web Dev"
+)
+
+# Extra words students use for a course, on top of the words in its title
+COURSE_ALIASES = {
+    "Data Science & AI": ["ds", "ml", "machine learning", "artificial intelligence", "data"],
+    "Python Programming": ["py"],
+    "Linux Administration": ["linux admin", "sysadmin", "kernel"],
+    "Cloud Computing": ["openstack", "aws", "virtualization"],
+    "IoT & Raspberry Pi": ["internet of things", "arduino", "raspberry", "pi"],
+    "Full Stack Web Dev": ["web development", "web dev", "php", "wordpress", "fullstack"],
+}
+
+# ---------- Validators ----------
+# Each validator returns the cleaned value, or None when the input is rejected.
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+NON_DIGIT_RE = re.compile(r"\D")
+NORMALIZE_RE = re.compile(r"[^a-z0-9 ]+")
+
+
+def validate_name(text):
+    text = text.strip()
+    return text if len(text) >= 2 else None
+
+
+def validate_email(text):
+    text = text.strip()
+    return text if EMAIL_RE.match(text) else None
+
+
+def validate_phone(text):
+    return text.strip() if len(NON_DIGIT_RE.sub("", text)) >= 10 else None
+
+
+def validate_text(text):
+    text = text.strip()
+    return text or None
+
+
+def _normalize(text):
+    return " ".join(NORMALIZE_RE.sub(" ", text.lower().replace("&", " and ")).split())
+
+
+class CourseIndex:
+    """Resolves free-text course input: exact name, then (typo-tolerant) word overlap, then close spelling."""
+
+    STOPWORDS = {"and", "the", "course", "in", "of", "dev"}
+    CACHE_SIZE = 4096
+
+    def __init__(self, courses, aliases):
+        self.exact = {}
+        self.words = {}
+        for course in courses:
+            names = [course] + aliases.get(course, [])
+            for name in names:
+                self.exact[_normalize(name)] = course
+                for word in _normalize(name).split():
+                    if word not in self.STOPWORDS:
+                        self.words.setdefault(word, set()).add(course)
+        self.spellings = list(self.exact)
+        self.vocabulary = list(self.words)
+        self._cache = {}
+
+    def resolve(self, text):
+        # Course answers repeat a lot (buttons, bulk imports), so remember recent lookups
+        try:
+            return self._cache[text]
+        except KeyError:
+            pass
+        course = self._resolve(text)
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[text] = course
+        return course
+
+    def _resolve(self, text):
+        key = _normalize(text)
+        if not key:
+            return None
+        if key in self.exact:
+            return self.exact[key]
+
+        scores = {}
+        for word in key.split():
+            if word not in self.words:
+                # Tolerate typos like "pyhton" or "clould"
+                close = difflib.get_close_matches(word, self.vocabulary, n=1, cutoff=0.8)
+                word = close[0] if close else word
+            for course in self.words.get(word, ()):
+                scores[course] = scores.get(course, 0) + 1
+        if scores:
+            best = max(scores.values())
+            matches = [c for c, s in scores.items() if s == best]
+            if len(matches) == 1:
+                return matches[0]
+
+        close = difflib.get_close_matches(key, self.spellings, n=1, cutoff=0.75)
+        return self.exact[close[0]] if close else None
+
+
+COURSE_INDEX = CourseIndex(COURSES, COURSE_ALIASES)
+
+# ---------- Flow definitions ----------
+# Button payloads are built once and shared between responses: treat them as read-only.
+COURSE_BUTTONS = tuple({"label": c, "payload": c} for c in COURSES)
+CONFIRM_BUTTONS = (
+    {"label": "Confirm & Submit", "payload": "yes"},
+    {"label": "Cancel", "payload": "cancel"},
+)
+# "no" only cancels at the confirmation step; earlier it can be a genuine answer
+CANCEL_WORDS = frozenset(["cancel", "stop", "exit"])
+CONFIRM_CANCEL_WORDS = CANCEL_WORDS | {"no"}
+
+
+class Step:
+    __slots__ = ("field", "label", "question", "validate", "error", "buttons")
+
+    def __init__(self, field, label, question, validate, error, buttons=()):
+        self.field = field
+        self.label = label
+        self.question = question      # str.format() template over the data collected so far
+        self.validate = validate
+        self.error = error
+        self.buttons = buttons
+
+
+class Flow:
+    def __init__(self, name, source, steps, done_reply, cancel_reply):
+        self.name = name
+        self.source = source          # stored on the lead so the admin can tell flows apart
+        self.steps = tuple(steps)
+        self.done_reply = done_reply
+        self.cancel_reply = cancel_reply
+        total = len(self.steps) + 1   # plus the confirmation step
+        self.progress = tuple(f"Step {i} of {total}" for i in range(1, total + 1))
+        self.confirm_step = len(self.steps)
+
+
+FLOWS = {}
+
+
+def register_flow(flow):
+    FLOWS[flow.name] = flow
+    return flow
+
+
+register_flow(Flow(
+    name="enrollment",
+    source="enrollment",
+    steps=[
+        Step("name", "Name", "Great! Let's get you enrolled. May I know your **Full Name**?",
+             validate_name, "Please enter a valid full name (min 2 characters)."),
+        Step("email", "Email", "Thanks {name}. Now, please enter your **Email Address**.",
+             validate_email, "Please enter a valid email address."),
+        Step("phone", "Phone", "Got it. What is your **Contact Number**?",
+             validate_phone, "Please enter a valid 10-digit phone number."),
+        Step("course", "Course", "Which course are you interested in?",
+             COURSE_INDEX.resolve, "Please pick one of our courses below.", COURSE_BUTTONS),
+    ],
+    done_reply="Thank you! Your enrollment request has been submitted. Our team will contact you shortly.",
+    cancel_reply="Enrollment cancelled. Let me know if you need anything else!",
+))
+
+register_flow(Flow(
+    name="demo",
+    source="demo",
+    steps=[
+        Step("name", "Name", "Let's book your free demo session. May I know your **Full Name**?",
+             validate_name, "Please enter a valid full name (min 2 characters)."),
+        Step("phone", "Phone", "Thanks {name}. What is your **Contact Number**?",
+             validate_phone, "Please enter a valid 10-digit phone number."),
+        Step("course", "Course", "Which course would you like a demo of?",
+             COURSE_INDEX.resolve, "Please pick one of our courses below.", COURSE_BUTTONS),
+        Step("preferred_time", "Preferred Time", "When would you like the demo? (e.g. **Saturday 11 AM**)",
+             validate_text, "Please tell us a day and time that suits you."),
+    ],
+    done_reply="Your demo request is booked! Our team will call you to confirm the slot.",
+    cancel_reply="Demo booking cancelled. Let me know if you need anything else!",
+))
+
+register_flow(Flow(
+    name="callback",
+    source="callback",
+    steps=[
+        Step("name", "Name", "Sure, we'll call you back. May I know your **Full Name**?",
+             validate_name, "Please enter a valid full name (min 2 characters)."),
+        Step("phone", "Phone", "Thanks {name}. What number should we call?",
+             validate_phone, "Please enter a valid 10-digit phone number."),
+        Step("preferred_time", "Preferred Time", "When is a good time to call? (e.g. **today after 5 PM**)",
+             validate_text, "Please tell us when we should call."),
+    ],
+    done_reply="Thanks! A counselor will call you back at your preferred time.",
+    cancel_reply="Callback request cancelled. Let me know if you need anything else!",
+))
+
+
+# ---------- Engine ----------
+def _confirm_summary(flow, data):
+    lines = ["**Please Confirm Your Details:**"]
+    lines.extend(f"{step.label}: {data.get(step.field)}" for step in flow.steps)
+    return "<br>".join(lines)
+
+
+def clear_flow():
+    session.pop('flow', None)
+    session.pop('flow_step', None)
+    session.pop('step', None)
+    session.pop('enroll_data', None)
+
+
+def _current_step(flow):
+    if 'flow_step' in session:
+        return session['flow_step']
+    # Sessions started before the flow table kept the enrollment step 1-based
+    # under 'step' (1 = name ... 5 = confirm); carry them over instead of restarting.
+    legacy = session.pop('step', None)
+    if flow is not None and flow.name == 'enrollment' and isinstance(legacy, int) and legacy >= 1:
+        session['flow_step'] = legacy - 1
+        return legacy - 1
+    return None
+
+
+def _ask(flow, step_index, data):
+    step = flow.steps[step_index]
+    response = {"reply": step.question.format(**data), "progress": flow.progress[step_index]}
+    if step.buttons:
+        response["buttons"] = step.buttons
+    return response
+
+
+def start_flow(name):
+    flow = FLOWS[name]
+    session['flow'] = name
+    session['flow_step'] = 0
+    session['enroll_data'] = {}
+    return _ask(flow, 0, {})
+
+
+def handle_input(user_input):
+    flow = FLOWS.get(session.get('flow'))
+    step_index = _current_step(flow)
+    if flow is None or not isinstance(step_index, int) or not 0 <= step_index <= flow.confirm_step:
+        clear_flow()
+        return {"reply": "Something went wrong. Let's start over.", "reset": True}
+
+    cancel_words = CONFIRM_CANCEL_WORDS if step_index == flow.confirm_step else CANCEL_WORDS
+    if user_input.strip().lower() in cancel_words:
+        clear_flow()
+        return {"reply": flow.cancel_reply}
+
+    data = session.get('enroll_data', {})
+
+    if step_index == flow.confirm_step:
+        # Anything other than a cancel word confirms
+        clear_flow()
+        return {
+            "reply": flow.done_reply,
+            "save_lead": True,
+            "lead_data": dict(data, source=flow.source),
+            "completed": True
+        }
+
+    step = flow.steps[step_index]
+    value = step.validate(user_input)
+    if value is None:
+        response = {"reply": step.error}
+        if step.buttons:
+            response["buttons"] = step.buttons
+        return response
+
+    data[step.field] = value
+    session['enroll_data'] = data
+    session['flow_step'] = step_index + 1
+
+    if step_index + 1 == flow.confirm_step:
+        return {
+            "reply": _confirm_summary(flow, data),
+            "buttons": CONFIRM_BUTTONS,
+            "progress": flow.progress[flow.confirm_step]
+        }
+
+    return _ask(flow, step_index + 1, data)
+
+
 class EnrollmentFlow:
-    # Steps
-    STEP_INIT = 0
-    STEP_NAME = 1
-    STEP_EMAIL = 2
-    STEP_PHONE = 3
-    STEP_COURSE = 4
-    STEP_CONFIRM = 5
-    
-    COURSES = [
-        "Data Science & AI",
-        "Python Programming",
-        "Linux Administration",
-        "Cloud Computing",
-        "IoT & Raspberry Pi",
-        "Full Stack Web Dev"
-    ]
+    # Kept for callers that predate the flow table
+    COURSES = list(COURSES)
 
     @staticmethod
     def start_flow():
-        session['flow'] = 'enrollment'
-        session['step'] = EnrollmentFlow.STEP_NAME
-        session['enroll_data'] = {}
-        return {
-            "reply": "Great! Let's get you enrolled. May I know your **Full Name**?",
-            "progress": "Step 1 of 5"
-        }
+        return start_flow('enrollment')
 
     @staticmethod
     def handle_input(user_input):
-        step = session.get('step')
-        data = session.get('enroll_data', {})
-
-        if step == EnrollmentFlow.STEP_NAME:
-            # Basic validation: Name should be at least 2 chars
-            if len(user_input.strip()) < 2:
-                return {"reply": "Please enter a valid full name (min 2 characters)."}
-            
-            data['name'] = user_input.strip()
-            session['enroll_data'] = data
-            session['step'] = EnrollmentFlow.STEP_EMAIL
-            return {
-                "reply": f"Thanks {data['name']}. Now, please enter your **Email Address**.",
-                "progress": "Step 2 of 5"
-            }
-
-        elif step == EnrollmentFlow.STEP_EMAIL:
-            # Email validation regex
-            if not re.match(r"[^@]+@[^@]+\.[^@]+", user_input):
-                return {"reply": "Please enter a valid email address."}
-            
-            data['email'] = user_input.strip()
-            session['enroll_data'] = data
-            session['step'] = EnrollmentFlow.STEP_PHONE
-            return {
-                "reply": "Got it. What is your **Contact Number**?",
-                "progress": "Step 3 of 5"
-            }
-
-        elif step == EnrollmentFlow.STEP_PHONE:
-            # Basic phone validation (digits, min length)
-            phone = re.sub(r'\D', '', user_input)
-            if len(phone) < 10:
-                return {"reply": "Please enter a valid 10-digit phone number."}
-            
-            data['phone'] = user_input.strip()
-            session['enroll_data'] = data
-            session['step'] = EnrollmentFlow.STEP_COURSE
-            
-            # Generate course buttons
-            buttons = [{"label": c, "payload": c} for c in EnrollmentFlow.COURSES]
-            return {
-                "reply": "Which course are you interested in?",
-                "buttons": buttons,
-                "progress": "Step 4 of 5"
-            }
-
-        elif step == EnrollmentFlow.STEP_COURSE:
-            # Validate course selection
-            selected_course = user_input.strip()
-            # If user typed something not in list, we could either be strict or loose. 
-            # Let's be semi-strict but allow text entry if it matches roughly.
-            
-            # Let's trust the input or buttons for now.
-            data['course'] = selected_course
-            session['enroll_data'] = data
-            session['step'] = EnrollmentFlow.STEP_CONFIRM
-            
-            summary = (
-                f"**Please Confirm Your Details:**<br>"
-                f"Name: {data.get('name')}<br>"
-                f"Email: {data.get('email')}<br>"
-                f"Phone: {data.get('phone')}<br>"
-                f"Course: {data.get('course')}"
-            )
-            
-            buttons = [
-                {"label": "Confirm & Submit", "payload": "yes"},
-                {"label": "Cancel", "payload": "cancel"}
-            ]
-            
-            return {
-                "reply": summary,
-                "buttons": buttons,
-                "progress": "Step 5 of 5"
-            }
-
-        elif step == EnrollmentFlow.STEP_CONFIRM:
-            if user_input.lower() in ['cancel', 'no']:
-                session.pop('flow', None)
-                session.pop('step', None)
-                session.pop('enroll_data', None)
-                return {"reply": "Enrollment cancelled. Let me know if you need anything else!"}
-            
-            # Assuming Yes/Confirm
-            final_data = session.get('enroll_data')
-            
-            # Return special flag to app.py to save to DB
-            return {
-                "reply": "Thank you! Your enrollment request has been submitted. Our team will contact you shortly.",
-                "save_lead": True,
-                "lead_data": final_data,
-                "completed": True
-            }
-
-        return {"reply": "Something went wrong. Let's start over.", "reset": True}
+        return handle_input(user_input)
@@ -1,5 +1,9 @@
+import time
+
 from docx import Document
 
+import knowledge_base
+
 def extract_text(file_path):
     try:
         doc = Document(file_path)
@@ -12,8 +16,9 @@ def extract_text(file_path):
         return f"Error reading file: {e}"
 
 if __name__ == "__main__":
-    file_path = "MITU SKILLOGIES WEBSITE DATA.docx"
-    content = extract_text(file_path)
-    with open("extracted_data.txt", "w", encoding="utf-8") as f:
-        f.write(content)
-    print("Succesfully wrote content to extracted_data.txt")
+    # Chunks (paragraphs and tables) go into knowledge_base.bin/.idx; only changed chunks are written.
+    start = time.perf_counter()
+    result = knowledge_base.ingest()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Knowledge base {result['status']}: {result['chunks']} chunks "
+          f"({result['added']} new, {result['reused']} reused) in {elapsed_ms:.1f} ms")
@@ -0,0 +1,183 @@
+# 👍/👎 reactions on bot replies.
+#
+# /react only records the reaction in memory; a background thread writes the
+# buffer every FEEDBACK_FLUSH_INTERVAL seconds (sooner once FEEDBACK_BATCH_SIZE
+# pile up) in one transaction. Each flush looks up the rated messages' intent
+# tags, upserts message_reactions and applies the like/dislike deltas to
+# intent_feedback, the per-intent totals the admin dashboard reads as they are.
+import os
+import threading
+
+import db
+
+# ---------- Settings ----------
+BATCH_SIZE = int(os.environ.get("FEEDBACK_BATCH_SIZE", 200))
+FLUSH_INTERVAL = float(os.environ.get("FEEDBACK_FLUSH_INTERVAL", 5))
+MAX_PENDING = 10000         # beyond this (database down for long) new reactions are dropped
+REACTIONS = ("like", "dislike", "none")     # "none" takes a reaction back
+
+_lock = threading.Lock()
+_pending = {}               # (user_id, message_id) -> reaction; the latest click wins
+_wakeup = threading.Event()
+_stop = threading.Event()
+_thread = None
+
+
+def _reset_after_fork():
+    # Reactions buffered by the master were never real traffic; each worker starts empty.
+    global _lock, _pending, _wakeup, _stop, _thread
+    _lock = threading.Lock()
+    _pending = {}
+    _wakeup = threading.Event()
+    _stop = threading.Event()
+    _thread = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_feedback(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_reactions (
+            message_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            session_id INTEGER,
+            intent VARCHAR(64),
+            reaction VARCHAR(10) NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_reactions_user (user_id),
+            INDEX idx_reactions_session (session_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS intent_feedback (
+            intent VARCHAR(64) PRIMARY KEY,
+            likes INTEGER DEFAULT 0,
+            dislikes INTEGER DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def record(user_id, message_id, reaction):
+    """Buffer one reaction. Returns False when it was dropped."""
+    with _lock:
+        if len(_pending) >= MAX_PENDING and (user_id, message_id) not in _pending:
+            return False
+        _pending[(user_id, message_id)] = reaction
+        full = len(_pending) >= BATCH_SIZE
+    if full:
+        _wakeup.set()
+    return True
+
+
+# ---------- Writing ----------
+def write_batch(batch):
+    """Persist {(user_id, message_id): reaction} and update the per-intent totals."""
+    ids = sorted({message_id for _, message_id in batch})
+    marks = ", ".join("?" * len(ids))
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        # Only bot replies the reacting user owns count
+        cursor.execute(f"SELECT id, user_id, session_id, intent FROM messages WHERE id IN ({marks}) AND sender = 'bot'",
+                       ids)
+        messages = {mid: (uid, sid, intent) for mid, uid, sid, intent in cursor.fetchall()}
+        # Lock the existing rows so two workers flushing the same message count it once
+        cursor.execute(f"SELECT message_id, reaction FROM message_reactions WHERE message_id IN ({marks}) FOR UPDATE",
+                       ids)
+        previous = dict(cursor.fetchall())
+
+        upserts, removals, deltas = [], [], {}
+        for (user_id, message_id), reaction in batch.items():
+            message = messages.get(message_id)
+            if message is None or message[0] != user_id:
+                continue
+            _, session_id, intent = message
+            intent = intent or "unknown"
+            old = previous.get(message_id)
+            if old == reaction or (old is None and reaction == "none"):
+                continue
+            counts = deltas.setdefault(intent, {"like": 0, "dislike": 0})
+            if old in counts:
+                counts[old] -= 1
+            if reaction in counts:
+                counts[reaction] += 1
+                upserts.append((message_id, user_id, session_id, intent, reaction))
+            else:
+                removals.append((message_id,))
+            previous[message_id] = reaction if reaction != "none" else None
+
+        if upserts:
+            cursor.executemany("""
+                INSERT INTO message_reactions (message_id, user_id, session_id, intent, reaction)
+                VALUES (?, ?, ?, ?, ?)
+                ON DUPLICATE KEY UPDATE reaction = VALUES(reaction), updated_at = NOW()
+            """, upserts)
+        if removals:
+            cursor.executemany("DELETE FROM message_reactions WHERE message_id = ?", removals)
+        changed = [(intent, c["like"], c["dislike"]) for intent, c in deltas.items() if c["like"] or c["dislike"]]
+        if changed:
+            cursor.executemany("""
+                INSERT INTO intent_feedback (intent, likes, dislikes) VALUES (?, ?, ?)
+                ON DUPLICATE KEY UPDATE likes = likes + VALUES(likes), dislikes = dislikes + VALUES(dislikes),
+                                        updated_at = NOW()
+            """, changed)
+        conn.commit()
+    return len(upserts) + len(removals)
+
+
+def flush():
+    global _pending
+    with _lock:
+        batch, _pending = _pending, {}
+    if not batch:
+        return 0
+    try:
+        return write_batch(batch)
+    except Exception:
+        # Put the batch back under anything clicked since, and try again next round
+        with _lock:
+            for key, reaction in batch.items():
+                _pending.setdefault(key, reaction)
+        raise
+
+
+def satisfaction(cursor, min_votes=1):
+    """Per-intent totals, least liked first: [(intent, likes, dislikes, percent liked)]."""
+    cursor.execute("""
+        SELECT intent, likes, dislikes FROM intent_feedback WHERE likes + dislikes >= ?
+        ORDER BY likes / (likes + dislikes) ASC, dislikes DESC
+    """, (min_votes,))
+    return [(intent, likes, dislikes, round(100 * likes / (likes + dislikes), 1))
+            for intent, likes, dislikes in cursor.fetchall()]
+
+
+# ---------- Background writer ----------
+def _run():
+    while not _stop.is_set():
+        _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception as e:
+            print(f"Reaction writer error: {e}")
+
+
+def start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="feedback", daemon=True)
+    _thread.start()
+
+
+def stop(timeout=10):
+    _stop.set()
+    _wakeup.set()
+    if _thread is not None:
+        _thread.join(timeout)
+    try:
+        flush()
+    except Exception as e:
+        print(f"Reaction writer error: {e}")
@@ -0,0 +1,55 @@
+# Pre-fork production profile. The master imports the app and runs bootstrap()
+# once (schema, bcrypt cost, intents, dispatch table, asset manifest); workers
+# inherit that state copy-on-write and rebuild threads, locks and pools after fork
+# (see the os.register_at_fork hooks in passwords, user_cache, mailer, avatars,
+# compression).
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
+
+timeout = 60
+# In-flight requests get this long to finish on SIGTERM / HUP before workers are killed
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Recycle workers periodically to bound memory growth
+max_requests = 5000
+max_requests_jitter = 500
+
+
+def when_ready(server):
+    import app
+    import metrics
+    # Per-worker metric snapshots from the previous run would be counted again
+    metrics.clear_dir()
+    try:
+        app.bootstrap()
+    except Exception as e:
+        # Workers retry lazily on their first request
+        server.log.warning("Bootstrap in master failed: %s", e)
+        return
+    # Keep objects created so far out of the GC's reach so collections in the
+    # workers do not touch (and copy) the shared pages.
+    gc.freeze()
+    server.log.info("Bootstrap done in master: %s", app.STARTUP_TIMINGS)
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s forked", worker.pid)
+
+
+def worker_exit(server, worker):
+    # Let the outbox sender finish its current batch before the process goes away
+    import mailer
+    import purge
+    import feedback
+    import metrics
+    mailer.stop(timeout=graceful_timeout)
+    purge.stop(timeout=graceful_timeout)
+    feedback.stop(timeout=graceful_timeout)
+    metrics.stop()
@@ -0,0 +1,39 @@
+# Bulk-import leads from CSV or JSONL (walk-ins, webinars, website forms).
+#   python import_leads.py leads.csv [--format csv|jsonl] [--source webinar] [--flow enrollment]
+import argparse
+import json
+import time
+
+import enrollment
+import lead_import
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--source", default="import")
+    parser.add_argument("--flow", default="enrollment", choices=sorted(enrollment.FLOWS),
+                        help="whose validation rules the rows must pass")
+    parser.add_argument("--batch", type=int, default=lead_import.BATCH_SIZE)
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.path, "r", encoding="utf-8-sig", newline="") as f:
+        report = lead_import.import_leads(f, fmt=args.format or lead_import.detect_format(args.path),
+                                          source=args.source, flow_name=args.flow, batch_size=args.batch)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(dict(report.as_dict(), seconds=round(elapsed, 2)), indent=2))
+        return
+    print(f"{report.rows} rows read, {report.written} written, {report.failed} rejected in {elapsed:.1f}s")
+    for err in report.errors[:20]:
+        print(f"  line {err['line']}: {err['error']}")
+    if report.failed > 20:
+        print(f"  ... {report.failed - 20} more (use --json for the full list)")
+
+
+if __name__ == "__main__":
+    main()
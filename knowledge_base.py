@@ -0,0 +1,184 @@
+import hashlib
+import mmap
+import os
+import struct
+
+from docx import Document
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_PATH = os.path.join(BASE_DIR, "MITU SKILLOGIES WEBSITE DATA.docx")
+DATA_PATH = os.path.join(BASE_DIR, "knowledge_base.bin")
+INDEX_PATH = os.path.join(BASE_DIR, "knowledge_base.idx")
+
+# Store layout
+#   knowledge_base.bin  append-only records: <u32 length><utf-8 text>
+#   knowledge_base.idx  header + one fixed-size entry per chunk, in document order
+HEADER = struct.Struct("<4sH32sI")     # magic, version, source sha256, chunk count
+ENTRY = struct.Struct("<16sQIB")       # chunk hash, record offset, text length, kind
+LENGTH = struct.Struct("<I")
+MAGIC = b"MKB1"
+VERSION = 1
+
+KIND_PARAGRAPH = 0
+KIND_TABLE = 1
+
+# Rewrite the data file once less than this share of it is still referenced.
+COMPACT_RATIO = 0.5
+
+
+# ---------- Chunking ----------
+def iter_chunks(doc):
+    """Yield (kind, text) for every non-empty paragraph and table, in document order."""
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            text = Paragraph(child, doc).text.strip()
+            if text:
+                yield KIND_PARAGRAPH, text
+        elif tag == "tbl":
+            rows = []
+            for row in Table(child, doc).rows:
+                cells = [cell.text.strip().replace("\t", " ").replace("\n", " ") for cell in row.cells]
+                if any(cells):
+                    rows.append("\t".join(cells))
+            if rows:
+                yield KIND_TABLE, "\n".join(rows)
+
+
+def chunk_hash(kind, text):
+    return hashlib.sha256(bytes([kind]) + text.encode("utf-8")).digest()[:16]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+# ---------- Index ----------
+def read_index(index_path=INDEX_PATH):
+    """Return (source_hash, [(hash, offset, length, kind), ...]) or (None, []) if missing/corrupt."""
+    try:
+        with open(index_path, "rb") as f:
+            raw = f.read()
+        magic, version, source_hash, count = HEADER.unpack_from(raw, 0)
+    except (OSError, struct.error):
+        return None, []
+    if magic != MAGIC or version != VERSION or len(raw) != HEADER.size + count * ENTRY.size:
+        return None, []
+    entries = [ENTRY.unpack_from(raw, HEADER.size + i * ENTRY.size) for i in range(count)]
+    return source_hash, entries
+
+
+def _write_index(index_path, source_hash, entries):
+    tmp = index_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, source_hash, len(entries)))
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+    os.replace(tmp, index_path)
+
+
+# ---------- Ingestion ----------
+def ingest(source_path=SOURCE_PATH, data_path=DATA_PATH, index_path=INDEX_PATH):
+    """Bring the store up to date with the DOCX, writing only chunks that changed."""
+    source_hash = file_hash(source_path)
+    old_source_hash, old_entries = read_index(index_path)
+    data_size = os.path.getsize(data_path) if os.path.exists(data_path) else None
+    needed = max((offset + LENGTH.size + length for _, offset, length, _ in old_entries), default=0)
+    intact = data_size is not None and data_size >= needed
+    if old_source_hash == source_hash and intact:
+        return {"status": "unchanged", "chunks": len(old_entries), "added": 0, "reused": len(old_entries)}
+
+    if old_source_hash is None or not intact:
+        # Index lost or from another version, or the data file is missing or truncated:
+        # neither side can be trusted, so rebuild from scratch
+        if data_size is not None:
+            os.remove(data_path)
+        old_entries = []
+    known = {h: (offset, length) for h, offset, length, _ in old_entries}
+
+    entries, added, reused = [], 0, 0
+    with open(data_path, "ab") as data:
+        for kind, text in iter_chunks(Document(source_path)):
+            h = chunk_hash(kind, text)
+            if h in known:
+                offset, length = known[h]
+                reused += 1
+            else:
+                payload = text.encode("utf-8")
+                offset, length = data.tell(), len(payload)
+                data.write(LENGTH.pack(length) + payload)
+                known[h] = (offset, length)
+                added += 1
+            entries.append((h, offset, length, kind))
+        data.flush()
+        os.fsync(data.fileno())
+
+    _write_index(index_path, source_hash, entries)
+
+    live = sum(LENGTH.size + length for _, _, length, _ in {e[0]: e for e in entries}.values())
+    compacted = os.path.getsize(data_path) * COMPACT_RATIO > live
+    if compacted:
+        compact(data_path, index_path)
+    return {"status": "updated", "chunks": len(entries), "added": added, "reused": reused, "compacted": compacted}
+
+
+def compact(data_path=DATA_PATH, index_path=INDEX_PATH):
+    """Rewrite the data file keeping only records the index still points at."""
+    source_hash, entries = read_index(index_path)
+    moved, new_entries = {}, []
+    tmp = data_path + ".tmp"
+    with open(data_path, "rb") as old, open(tmp, "wb") as new:
+        for h, offset, length, kind in entries:
+            if h not in moved:
+                old.seek(offset)
+                record = old.read(LENGTH.size + length)
+                moved[h] = new.tell()
+                new.write(record)
+            new_entries.append((h, moved[h], length, kind))
+    os.replace(tmp, data_path)
+    _write_index(index_path, source_hash, new_entries)
+
+
+# ---------- Reader ----------
+class KnowledgeBase:
+    """Read-only view over the store; chunk text is decoded straight from the memory map."""
+
+    def __init__(self, data_path=DATA_PATH, index_path=INDEX_PATH):
+        self.source_hash, self.entries = read_index(index_path)
+        self._file = open(data_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._by_hash = {h: i for i, (h, _, _, _) in enumerate(self.entries)}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, i):
+        _, offset, length, kind = self.entries[i]
+        start = offset + LENGTH.size
+        return kind, self._map[start:start + length].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield self[i]
+
+    def get(self, h):
+        i = self._by_hash.get(h)
+        return None if i is None else self[i]
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+
+import db
+import enrollment
+import leads
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+
+# Accepted spellings for each lead field in uploaded files
+COLUMN_ALIASES = {
+    "name": ("name", "full_name", "full name"),
+    "email": ("email", "email_address", "email address"),
+    "phone": ("phone", "mobile", "contact", "contact_number", "phone number"),
+    "course": ("course", "course_name", "course name"),
+    "preferred_time": ("preferred_time", "preferred time"),
+}
+
+
+# ---------- Parsing ----------
+def iter_csv(text_stream):
+    for line_no, record in enumerate(csv.DictReader(text_stream), start=2):
+        yield line_no, record
+
+
+def iter_jsonl(text_stream):
+    for line_no, line in enumerate(text_stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"invalid JSON: {e}")
+            continue
+        yield line_no, record if isinstance(record, dict) else ValueError("expected a JSON object")
+
+
+def detect_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def _pick(record, field):
+    lowered = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+    for alias in COLUMN_ALIASES[field]:
+        value = lowered.get(alias)
+        if value not in (None, ""):
+            return str(value)
+    return ""
+
+
+# ---------- Validation ----------
+def validate_record(record, flow):
+    """Apply the chat flow's own step validators. Returns (lead_data, None) or (None, error)."""
+    data = {}
+    for step in flow.steps:
+        value = step.validate(_pick(record, step.field))
+        if value is None:
+            return None, f"{step.label}: {step.error}"
+        data[step.field] = value
+    return data, None
+
+
+# ---------- Import ----------
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.written = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line_no, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def as_dict(self):
+        return {"rows": self.rows, "written": self.written, "failed": self.failed,
+                "errors": self.errors, "errors_truncated": self.failed > len(self.errors)}
+
+
+def _flush(conn, batch, report):
+    cursor = conn.cursor()
+    try:
+        leads.upsert_rows(cursor, [row for _, row in batch])
+        conn.commit()
+        report.written += len(batch)
+    except Exception:
+        conn.rollback()
+        # Retry row by row so one bad row doesn't sink the rest of the chunk
+        for line_no, row in batch:
+            try:
+                leads.upsert_rows(cursor, [row])
+                conn.commit()
+                report.written += 1
+            except Exception as e:
+                conn.rollback()
+                report.error(line_no, f"database: {e}")
+    batch.clear()
+
+
+def import_leads(text_stream, fmt="csv", source="import", flow_name="enrollment", user_id=None, batch_size=BATCH_SIZE):
+    flow = enrollment.FLOWS[flow_name]
+    records = iter_jsonl(text_stream) if fmt == "jsonl" else iter_csv(text_stream)
+    report = ImportReport()
+    batch = []
+
+    with db.connect() as conn:
+        for line_no, record in records:
+            report.rows += 1
+            if isinstance(record, Exception):
+                report.error(line_no, str(record))
+                continue
+            data, error = validate_record(record, flow)
+            if error:
+                report.error(line_no, error)
+                continue
+            data["source"] = source
+            data.setdefault("preferred_time", _pick(record, "preferred_time") or None)
+            batch.append((line_no, leads.lead_row(user_id, data)))
+            if len(batch) >= batch_size:
+                _flush(conn, batch, report)
+        if batch:
+            _flush(conn, batch, report)
+    return report
+
+
+def import_upload(file_storage, **kwargs):
+    fmt = kwargs.pop("fmt", None) or detect_format(file_storage.filename or "")
+    text_stream = io.TextIOWrapper(file_storage.stream, encoding="utf-8-sig", newline="")
+    return import_leads(text_stream, fmt=fmt, **kwargs)
@@ -0,0 +1,142 @@
+import hashlib
+import re
+
+from enrollment import COURSE_INDEX
+
+NON_DIGIT_RE = re.compile(r"\D")
+SPACE_RE = re.compile(r"\s+")
+
+# ---------- Dedup key ----------
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def normalize_phone(phone):
+    # Last 10 digits, so "+91 99601 63010" and "9960163010" agree
+    return NON_DIGIT_RE.sub("", phone or "")[-10:]
+
+
+def normalize_course(course):
+    course = (course or "").strip()
+    return (COURSE_INDEX.resolve(course) or SPACE_RE.sub(" ", course)).lower()
+
+
+# The key identifies a person asking about a course. Only a Pending lead claims it
+# (open_key): once the team has contacted or closed a lead, asking again opens a new one.
+def dedup_key(email, phone, course):
+    raw = "|".join((normalize_email(email), normalize_phone(phone), normalize_course(course)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Set by init_leads_dedup(). Until the unique index exists, upserts lock the key
+# themselves (see _upsert_locked); a restart after dedup_leads.py switches back.
+unique_index = False
+
+
+def init_leads_dedup(cursor):
+    global unique_index
+    cursor.execute("SHOW COLUMNS FROM leads")
+    columns = [column[0] for column in cursor.fetchall()]
+    if 'dedup_key' not in columns:
+        cursor.execute("ALTER TABLE leads ADD COLUMN dedup_key CHAR(64) DEFAULT NULL")
+    if 'updated_at' not in columns:
+        cursor.execute("ALTER TABLE leads ADD COLUMN updated_at DATETIME DEFAULT NULL")
+    if 'open_key' not in columns:
+        # Virtual: no table rebuild, the index below stores it
+        cursor.execute("ALTER TABLE leads ADD COLUMN open_key CHAR(64) "
+                       "AS (IF(status = 'Pending', dedup_key, NULL)) VIRTUAL")
+
+    cursor.execute("SHOW INDEX FROM leads WHERE Key_name IN ('uniq_leads_dedup', 'idx_leads_open_key')")
+    indexes = {row[2] for row in cursor.fetchall()}
+    if 'uniq_leads_dedup' in indexes:
+        unique_index = True
+        return
+    if 'idx_leads_open_key' not in indexes:
+        # Keeps the FOR UPDATE in _upsert_locked() to one key instead of the whole table
+        cursor.execute("CREATE INDEX idx_leads_open_key ON leads (open_key)")
+
+    cursor.execute("SELECT COUNT(*) FROM leads WHERE dedup_key IS NULL AND status = 'Pending'")
+    missing = cursor.fetchone()[0]
+    if missing:
+        # Leads from before the key existed: the index would make the backfill fail on
+        # the first historical duplicate, so dedup_leads.py adds it after merging
+        print(f"WARNING: {missing} pending leads have no dedup key and uniq_leads_dedup does not exist; "
+              "lead upserts take row locks until it does. Run: python dedup_leads.py")
+        return
+    unique_index = add_dedup_index(cursor)
+
+
+def add_dedup_index(cursor):
+    """Create the unique index once every pending lead has a key and duplicates are merged."""
+    try:
+        cursor.execute("CREATE UNIQUE INDEX uniq_leads_dedup ON leads (open_key)")
+    except Exception as e:
+        print(f"WARNING: lead dedup index not created ({e}); "
+              "lead upserts take row locks until it is. Run: python dedup_leads.py")
+        return False
+    cursor.execute("SHOW INDEX FROM leads WHERE Key_name = 'idx_leads_open_key'")
+    if cursor.fetchall():
+        cursor.execute("DROP INDEX idx_leads_open_key ON leads")
+    return True
+
+
+# ---------- Upsert ----------
+INSERT_SQL = """
+    INSERT INTO leads (user_id, full_name, email, phone, course_name, source, preferred_time, dedup_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# The only unique key a new row can hit is a Pending lead's open_key
+UPSERT_SQL = INSERT_SQL + """
+    ON DUPLICATE KEY UPDATE
+        full_name = VALUES(full_name),
+        preferred_time = VALUES(preferred_time),
+        user_id = COALESCE(user_id, VALUES(user_id)),
+        updated_at = NOW()
+"""
+
+
+def lead_row(user_id, lead_data):
+    return (user_id, lead_data['name'], lead_data.get('email'), lead_data['phone'],
+            lead_data.get('course'), lead_data.get('source', 'enrollment'), lead_data.get('preferred_time'),
+            dedup_key(lead_data.get('email'), lead_data['phone'], lead_data.get('course')))
+
+
+def upsert_lead(cursor, user_id, lead_data):
+    """Insert the lead, or refresh the matching pending one. Safe to repeat.
+
+    A matching lead that is no longer Pending is left alone and a new one is inserted.
+    """
+    upsert_rows(cursor, [lead_row(user_id, lead_data)])
+
+
+def upsert_rows(cursor, rows):
+    """upsert_lead() for rows already built with lead_row()."""
+    if unique_index:
+        if len(rows) == 1:
+            cursor.execute(UPSERT_SQL, rows[0])
+        else:
+            # pymysql turns this into one multi-row INSERT per call
+            cursor.executemany(UPSERT_SQL, rows)
+        return
+    for row in rows:
+        _upsert_locked(cursor, row)
+
+
+def _upsert_locked(cursor, row):
+    # Without the unique index nothing stops two requests inserting the same lead,
+    # so lock the key (a gap lock when no lead has it yet) before deciding.
+    user_id, full_name, preferred_time, key = row[0], row[1], row[6], row[7]
+    cursor.execute("SELECT id FROM leads WHERE open_key = ? ORDER BY id LIMIT 1 FOR UPDATE", (key,))
+    existing = cursor.fetchone()
+    if existing is None:
+        cursor.execute(INSERT_SQL, row)
+        return
+    cursor.execute("""
+        UPDATE leads SET
+            full_name = ?,
+            preferred_time = ?,
+            user_id = COALESCE(user_id, ?),
+            updated_at = NOW()
+        WHERE id = ?
+    """, (full_name, preferred_time, user_id, existing[0]))
@@ -0,0 +1,315 @@
+# End-to-end load test: simulated students (signup, login, chat, enrollment, reaction,
+# history reload, password reset mail) plus admins viewing the dashboard. Needs MySQL
+# configured as for app.py; mail goes to a built-in SMTP stand-in.
+#   python loadtest.py --concurrency 20 --rate 5 --duration 60 --output result.json
+#   python loadtest.py --base-url http://127.0.0.1:8000 --smtp-port 2525   (server already running;
+#   start it with RATELIMIT_ENABLED=False, or signups past the per-IP limit fail with 429)
+import argparse
+import json
+import os
+import random
+import signal
+import socketserver
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+import create_user
+from bench_workers import BASE_DIR, csrf_token, wait_ready
+
+PASSWORD = "Load!12345"
+MESSAGES = ["What courses do you offer?", "Tell me about data science", "fees for python",
+            "Where is your office?", "Do you provide placement support?", "hello",
+            "What is the duration of the linux course?", "courses"]
+ENROLLMENT = ["enroll", "Load Test Student", None, "+91 99601 63010", "data science", "yes"]
+
+
+# ---------- SMTP stand-in ----------
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Accepts and discards mail so the outbox sender has somewhere to deliver."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port):
+        super().__init__(("127.0.0.1", port), _SMTPHandler)
+        self.received = 0
+        self.lock = threading.Lock()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(b"220 loadtest ESMTP\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b"DATA":
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.received += 1
+                self.wfile.write(b"250 OK\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            elif command == b"EHLO":
+                self.wfile.write(b"250-loadtest\r\n250 8BITMIME\r\n")
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+# ---------- Recording ----------
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.journeys = {"student": 0, "admin": 0, "failed": 0}
+
+    def record(self, name, elapsed, ok):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, wall_time):
+        endpoints = {}
+        total = 0
+        for name, values in sorted(self.latencies.items()):
+            total += len(values)
+            values = sorted(values)
+            q = statistics.quantiles(values, n=100) if len(values) > 1 else values * 99
+            errors = self.errors.get(name, 0)
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": errors,
+                "error_rate": round(errors / len(values), 4),
+                "throughput_rps": round(len(values) / wall_time, 2),
+                "p50_ms": round(q[49] * 1000, 1),
+                "p90_ms": round(q[89] * 1000, 1),
+                "p95_ms": round(q[94] * 1000, 1),
+                "p99_ms": round(q[98] * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+            }
+        errors = sum(self.errors.values())
+        return {
+            "duration_s": round(wall_time, 2),
+            "requests": total,
+            "throughput_rps": round(total / wall_time, 2),
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "journeys": dict(self.journeys),
+            "endpoints": endpoints,
+        }
+
+
+class JourneyFailed(Exception):
+    pass
+
+
+class VirtualUser:
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url
+        self.stats = stats
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    def call(self, name, method, path, expect=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            r = self.http.request(method, self.base_url + path, allow_redirects=False, timeout=self.timeout, **kwargs)
+            ok = r.status_code in expect
+        except requests.RequestException:
+            r, ok = None, False
+        self.stats.record(name, time.perf_counter() - start, ok)
+        if not ok:
+            raise JourneyFailed(f"{name}: {r.status_code if r is not None else 'no response'}")
+        return r
+
+    def form_token(self, name, path):
+        return csrf_token(self.call(name, "GET", path).text)
+
+    def signup(self, email):
+        token = self.form_token("GET /signup", "/signup")
+        self.call("POST /signup", "POST", "/signup", expect=(302,),
+                  data={"csrf_token": token, "name": "Load Test", "email": email,
+                        "password": PASSWORD, "confirm_password": PASSWORD})
+
+    def login(self, email, password=PASSWORD):
+        token = self.form_token("GET /login", "/login")
+        r = self.call("POST /login", "POST", "/login", expect=(302,),
+                      data={"csrf_token": token, "email": email, "password": password})
+        if "/login" in r.headers.get("Location", ""):
+            raise JourneyFailed("POST /login: rejected")
+
+    def chat(self, message, session_id):
+        r = self.call("POST /chat", "POST", "/chat", json={"message": message, "session_id": session_id})
+        return r.json()
+
+
+def student_journey(vu, turns, send_mail):
+    email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+    vu.signup(email)
+    vu.login(email)
+    vu.http.headers["X-CSRFToken"] = csrf_token(vu.call("GET /", "GET", "/").text)
+
+    session_id, reply = "", {}
+    for message in random.sample(MESSAGES, min(turns, len(MESSAGES))):
+        reply = vu.chat(message, session_id)
+        session_id = reply.get("session_id") or session_id
+
+    for text in ENROLLMENT:
+        reply = vu.chat(text or email, session_id)
+
+    vu.call("POST /react", "POST", "/react",
+            json={"reaction": random.choice(["like", "dislike"]), "message_id": reply.get("message_id")})
+
+    # History reload: the server-rendered page, then the cached client's delta
+    vu.call("GET /?session_id", "GET", f"/?session_id={session_id}")
+    vu.call("GET /sync", "GET", "/sync", params={"session_id": session_id, "since": 0, "after": 0})
+
+    if send_mail:
+        token = vu.form_token("GET /forgot_password", "/forgot_password")
+        vu.call("POST /forgot_password", "POST", "/forgot_password", expect=(302,),
+                data={"csrf_token": token, "email": email})
+    vu.call("GET /logout", "GET", "/logout", expect=(302,))
+
+
+def admin_journey(vu, admin_email, admin_password, views):
+    vu.login(admin_email, admin_password)
+    filters = [{}, {"status": "Pending"}, {"course": "Python Programming"}]
+    for i in range(views):
+        vu.call("GET /admin/dashboard", "GET", "/admin/dashboard", params=filters[i % len(filters)])
+    vu.call("GET /logout", "GET", "/logout", expect=(302,))
+
+
+# ---------- Driver ----------
+def run(args, base_url):
+    stats = Stats()
+    admin_email, admin_password = args.admin_email, args.admin_password
+    if args.admin_ratio > 0 and not admin_email:
+        # Throwaway admin for the dashboard journeys, written straight to the database
+        admin_email, admin_password = f"load-admin-{uuid.uuid4().hex[:8]}@example.com", PASSWORD
+        create_user.create_user(admin_email, admin_password, "Load Test Admin", "Admin")
+
+    def journey():
+        vu = VirtualUser(base_url, stats, args.timeout)
+        kind = "admin" if random.random() < args.admin_ratio else "student"
+        try:
+            if kind == "admin":
+                admin_journey(vu, admin_email, admin_password, args.admin_views)
+            else:
+                student_journey(vu, args.turns, not args.no_mail)
+            with stats.lock:
+                stats.journeys[kind] += 1
+        except JourneyFailed:
+            with stats.lock:
+                stats.journeys["failed"] += 1
+
+    slots = threading.Semaphore(args.concurrency)
+    threads = []
+    start = time.perf_counter()
+    stop_at = start + args.duration
+
+    def closed_loop():
+        while time.perf_counter() < stop_at:
+            journey()
+
+    if args.rate <= 0:
+        # Closed model: a fixed number of users, each starting a new journey when one ends
+        threads = [threading.Thread(target=closed_loop) for _ in range(args.concurrency)]
+        for t in threads:
+            t.start()
+    else:
+        # Open model: Poisson arrivals at --rate per second, at most --concurrency in flight
+        def arrival():
+            try:
+                journey()
+            finally:
+                slots.release()
+
+        while time.perf_counter() < stop_at:
+            time.sleep(random.expovariate(args.rate))
+            if not slots.acquire(timeout=max(0.0, stop_at - time.perf_counter())):
+                break
+            t = threading.Thread(target=arrival)
+            t.start()
+            threads.append(t)
+    for t in threads:
+        t.join()
+    return stats.report(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated student/admin traffic against the chatbot.")
+    parser.add_argument("--base-url", help="target a running server instead of starting gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers when starting a server")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--smtp-port", type=int, default=2526, help="port for the SMTP stand-in (0 = don't start)")
+    parser.add_argument("--concurrency", type=int, default=10, help="max journeys in flight")
+    parser.add_argument("--rate", type=float, default=0, help="new journeys per second (0 = closed loop)")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--turns", type=int, default=4, help="free-form /chat turns per student")
+    parser.add_argument("--admin-ratio", type=float, default=0.1, help="share of journeys that are admins")
+    parser.add_argument("--admin-views", type=int, default=3)
+    parser.add_argument("--admin-email")
+    parser.add_argument("--admin-password", default=PASSWORD)
+    parser.add_argument("--no-mail", action="store_true", help="skip the password-reset email step")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    sink = None
+    if args.smtp_port:
+        sink = SMTPSink(args.smtp_port)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        base_url = f"http://127.0.0.1:{args.port}"
+        # Every virtual user signs up from 127.0.0.1, so the per-IP signup limit would
+        # fail all but the first few journeys
+        env = dict(os.environ, WEB_CONCURRENCY=str(args.workers), BIND=f"127.0.0.1:{args.port}",
+                   MAIL_SERVER="127.0.0.1", MAIL_PORT=str(args.smtp_port), MAIL_USE_TLS="False",
+                   MAIL_POLL_INTERVAL="1", RATELIMIT_ENABLED="False")
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                                  cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(base_url)
+        report = run(args, base_url)
+        if sink is not None:
+            time.sleep(2)  # let the outbox drain what the last journeys queued
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        if sink is not None:
+            sink.shutdown()
+
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("admin_password", "output")}
+    report["emails_received"] = sink.received if sink is not None else None
+
+    print(f"{'endpoint':<26}{'reqs':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}", file=sys.stderr)
+    for name, row in report["endpoints"].items():
+        print(f"{name:<26}{row['requests']:>7}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+              f"{row['error_rate'] * 100:>7.1f}%", file=sys.stderr)
+    print(f"{report['throughput_rps']} req/s, {report['errors']} errors, journeys {report['journeys']}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
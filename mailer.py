@@ -0,0 +1,155 @@
+import os
+import threading
+import uuid
+
+from flask_mail import Message
+
+import db
+
+# ---------- Settings ----------
+BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE", 20))
+POLL_INTERVAL = float(os.environ.get("MAIL_POLL_INTERVAL", 5))
+MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", 5))
+BACKOFF_BASE = int(os.environ.get("MAIL_BACKOFF_SECONDS", 30))
+# Rows left in 'Sending' longer than this belong to a sender that died mid-batch.
+STALE_CLAIM_MINUTES = 10
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_thread = None
+
+
+def _reset_after_fork():
+    # The sender thread is not copied into a forked child; each worker starts its own.
+    global _wakeup, _stop, _thread
+    _wakeup = threading.Event()
+    _stop = threading.Event()
+    _thread = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_outbox(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            recipient VARCHAR(255) NOT NULL,
+            subject TEXT NOT NULL,
+            body_html MEDIUMTEXT NOT NULL,
+            status VARCHAR(20) DEFAULT 'Pending',
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            claimed_by VARCHAR(64),
+            claimed_at DATETIME,
+            next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME,
+            INDEX idx_outbox_due (status, next_attempt_at)
+        )
+    ''')
+
+
+def enqueue(subject, recipient, body_html):
+    """Store the message in the outbox; the background sender delivers it."""
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO email_outbox (recipient, subject, body_html) VALUES (?, ?, ?)",
+                       (recipient, subject, body_html))
+        conn.commit()
+    _wakeup.set()
+
+
+# ---------- Background sender ----------
+def _claim_batch():
+    token = uuid.uuid4().hex
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE email_outbox SET status = 'Sending', claimed_by = ?, claimed_at = NOW()
+            WHERE (status = 'Pending' AND next_attempt_at <= NOW())
+               OR (status = 'Sending' AND claimed_at < NOW() - INTERVAL {STALE_CLAIM_MINUTES} MINUTE)
+            ORDER BY id LIMIT {BATCH_SIZE}
+        """, (token,))
+        conn.commit()
+        cursor.execute("SELECT id, recipient, subject, body_html, attempts FROM email_outbox WHERE claimed_by = ? AND status = 'Sending'",
+                       (token,))
+        return cursor.fetchall()
+
+
+def _record_results(sent_ids, failures):
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        for outbox_id in sent_ids:
+            cursor.execute("UPDATE email_outbox SET status = 'Sent', sent_at = NOW(), claimed_by = NULL WHERE id = ?",
+                           (outbox_id,))
+        for outbox_id, attempts, error in failures:
+            if attempts >= MAX_ATTEMPTS:
+                cursor.execute("UPDATE email_outbox SET status = 'Failed', attempts = ?, last_error = ?, claimed_by = NULL WHERE id = ?",
+                               (attempts, error, outbox_id))
+            else:
+                delay = BACKOFF_BASE * (2 ** (attempts - 1))
+                cursor.execute(f"""
+                    UPDATE email_outbox SET status = 'Pending', attempts = ?, last_error = ?, claimed_by = NULL,
+                        next_attempt_at = NOW() + INTERVAL {int(delay)} SECOND
+                    WHERE id = ?
+                """, (attempts, error, outbox_id))
+        conn.commit()
+
+
+def send_batch(mail):
+    """Deliver one batch of due messages over a single SMTP connection. Returns the batch size."""
+    rows = _claim_batch()
+    if not rows:
+        return 0
+
+    sent_ids, failures = [], []
+    try:
+        with mail.connect() as smtp:
+            for outbox_id, recipient, subject, body_html, attempts in rows:
+                msg = Message(subject, recipients=[recipient])
+                msg.html = body_html
+                try:
+                    smtp.send(msg)
+                    sent_ids.append(outbox_id)
+                except Exception as e:
+                    failures.append((outbox_id, attempts + 1, str(e)))
+    except Exception as e:
+        # Could not connect at all: every message not yet sent counts as a failed attempt.
+        print(f"Error connecting to SMTP server: {e}")
+        done = set(sent_ids) | {f[0] for f in failures}
+        failures.extend((r[0], r[4] + 1, str(e)) for r in rows if r[0] not in done)
+
+    _record_results(sent_ids, failures)
+    if failures:
+        print(f"Outbox: {len(sent_ids)} sent, {len(failures)} failed")
+    return len(rows)
+
+
+def _run(app, mail):
+    while not _stop.is_set():
+        try:
+            with app.app_context():
+                # Keep draining while full batches come back
+                while send_batch(mail) >= BATCH_SIZE and not _stop.is_set():
+                    pass
+        except Exception as e:
+            print(f"Outbox sender error: {e}")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start(app, mail):
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, args=(app, mail), name="mail-outbox", daemon=True)
+    _thread.start()
+
+
+def stop(timeout=10):
+    _stop.set()
+    _wakeup.set()
+    if _thread is not None:
+        _thread.join(timeout)
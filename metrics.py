@@ -0,0 +1,343 @@
+# In-process request metrics, exposed in Prometheus text format on /metrics.
+#
+# Every thread records into its own shard, so the hot path only takes that
+# shard's (uncontended) lock. A scrape merges the shards. Under a pre-fork server
+# each worker also writes its totals to METRICS_DIR every few seconds, and the
+# worker answering the scrape adds up every worker's file. A worker that exits
+# cleanly folds its totals into metrics-retired.json, so recycled workers
+# (max_requests) don't leave a file each behind.
+import fcntl
+import json
+import os
+import threading
+import time
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+
+# Upper bounds in seconds; the +Inf bucket is implied
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    "http_requests_total": ("counter", "HTTP requests by route, method and status."),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route."),
+    "mitu_intent_match_seconds": ("histogram", "Time spent matching chat messages to intents."),
+    "mitu_db_query_seconds": ("histogram", "Time spent executing MySQL statements."),
+    "mitu_bcrypt_seconds": ("histogram", "Time spent in bcrypt hashing and checking."),
+    "mitu_template_render_seconds": ("histogram", "Time spent rendering Jinja templates."),
+    "mitu_ratelimit_rejected_total": ("counter", "Requests rejected with 429 by the rate limiter."),
+    "mitu_db_connections_total": ("counter", "Read-only MySQL connections by target (replica/primary) and reason."),
+    "mitu_user_cache_lookups_total": ("counter", "User cache lookups by result (hit/miss)."),
+    "mitu_user_cache_invalidations_total": ("counter", "User cache invalidations."),
+    "mitu_compression_responses_total": ("counter", "Compressible responses by result (gzip/br/skipped)."),
+    "mitu_compression_bytes_total": ("counter", "Bytes of compressed responses before (in) and after (out) compression."),
+}
+
+
+class _Shard:
+    __slots__ = ("lock", "counters", "histograms")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+_flusher = None
+_stop = threading.Event()
+_instance = None
+
+
+def _reset_after_fork():
+    # Start every worker from zero; anything the master recorded while booting is not traffic.
+    global _local, _shards, _shards_lock, _flusher, _stop, _instance
+    _local = threading.local()
+    _shards = []
+    _shards_lock = threading.Lock()
+    _flusher = None
+    _stop = threading.Event()
+    _instance = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+# ---------- Recording ----------
+def inc(name, labels=(), value=1):
+    shard = _shard()
+    key = (name, labels)
+    with shard.lock:
+        shard.counters[key] = shard.counters.get(key, 0) + value
+
+
+def observe(name, seconds, labels=()):
+    shard = _shard()
+    key = (name, labels)
+    with shard.lock:
+        hist = shard.histograms.get(key)
+        if hist is None:
+            # Per-bucket counts (not cumulative), then +Inf, count, sum
+            hist = shard.histograms[key] = [0] * (len(BUCKETS) + 3)
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        hist[i] += 1
+        hist[-2] += 1
+        hist[-1] += seconds
+
+
+class timer:
+    """with metrics.timer("mitu_db_query_seconds"): ..."""
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        observe(self.name, time.perf_counter() - self.start, self.labels)
+
+
+# ---------- Aggregation ----------
+def snapshot():
+    """This process's totals as {"counters": [[name, labels, value]], "histograms": [[name, labels, values]]}."""
+    counters, histograms = {}, {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        with shard.lock:
+            for key, value in shard.counters.items():
+                counters[key] = counters.get(key, 0) + value
+            for key, values in shard.histograms.items():
+                total = histograms.setdefault(key, [0] * len(values))
+                for i, v in enumerate(values):
+                    total[i] += v
+    return _serialize(counters, histograms)
+
+
+def _instance_id():
+    # pid plus start time: a recycled worker that gets a dead worker's pid must not
+    # overwrite (and so shrink) that worker's totals
+    global _instance
+    if _instance is None:
+        _instance = f"{os.getpid()}-{time.time_ns()}"
+    return _instance
+
+
+def _snapshot_path(instance):
+    return os.path.join(METRICS_DIR, f"metrics-{instance}.json")
+
+
+RETIRED_PATH = os.path.join(METRICS_DIR, "metrics-retired.json")
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write_json(_snapshot_path(_instance_id()), snapshot())
+
+
+def retire():
+    """Fold this worker's totals into metrics-retired.json and remove its own file."""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(_instance_id())
+    with open(os.path.join(METRICS_DIR, ".retired.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired = _read_json(RETIRED_PATH) or {"counters": [], "histograms": [], "instances": []}
+        counters, histograms = _combine([retired, snapshot()])
+        # Scrapes skip files of listed instances; only ones whose file still exists
+        # need listing, and ours is deleted right after
+        instances = [i for i in retired["instances"] if os.path.exists(_snapshot_path(i))] + [_instance_id()]
+        _write_json(RETIRED_PATH, {**_serialize(counters, histograms), "instances": instances})
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _serialize(counters, histograms):
+    return {
+        "counters": [[name, [list(l) for l in labels], v] for (name, labels), v in counters.items()],
+        "histograms": [[name, [list(l) for l in labels], v] for (name, labels), v in histograms.items()],
+    }
+
+
+def _merged():
+    """Totals across all workers: our live numbers, every other worker's last flush
+    and everything retired workers left behind.
+
+    Files of workers that died without retiring are kept, so counters never go backwards.
+    """
+    snapshots = [snapshot()]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own = os.path.basename(_snapshot_path(_instance_id()))
+        workers = {}
+        for name in os.listdir(METRICS_DIR):
+            if name.startswith("metrics-") and name.endswith(".json") and name not in (own, "metrics-retired.json"):
+                snap = _read_json(os.path.join(METRICS_DIR, name))
+                if snap is not None:
+                    workers[name[len("metrics-"):-len(".json")]] = snap
+        # Read last: a worker file that vanished above was folded in before it was removed
+        retired = _read_json(RETIRED_PATH)
+        if retired is not None:
+            for instance in retired["instances"]:
+                workers.pop(instance, None)
+            snapshots.append(retired)
+        snapshots.extend(workers.values())
+    return _combine(snapshots)
+
+
+def _combine(snapshots):
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(tuple(l) for l in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snap["histograms"]:
+            key = (name, tuple(tuple(l) for l in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, v in enumerate(values):
+                total[i] += v
+    return counters, histograms
+
+
+def clear_dir():
+    """Drop snapshot files left by a previous server run (call from the master before forking)."""
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            if name.startswith("metrics-"):
+                os.remove(os.path.join(METRICS_DIR, name))
+
+
+# ---------- Exposition ----------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render():
+    counters, histograms = _merged()
+    lines = []
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for (name, labels), values in histograms.items():
+        by_name.setdefault(name, []).append((labels, values))
+
+    for name in sorted(by_name):
+        kind, help_text = DESCRIPTIONS.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {value[-2]}")
+            lines.append(f"{name}_sum{_labels(labels)} {value[-1]:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {value[-2]}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Background flush ----------
+def _run():
+    while not _stop.wait(FLUSH_INTERVAL):
+        try:
+            flush()
+        except Exception as e:
+            print(f"Metrics flush error: {e}")
+
+
+def start():
+    global _flusher
+    if not METRICS_DIR or (_flusher is not None and _flusher.is_alive()):
+        return
+    _flusher = threading.Thread(target=_run, name="metrics-flush", daemon=True)
+    _flusher.start()
+
+
+def stop():
+    _stop.set()
+    if _flusher is not None:
+        # A flush still running could recreate the file retire() removes
+        _flusher.join(FLUSH_INTERVAL)
+    try:
+        retire()
+    except Exception as e:
+        print(f"Metrics flush error: {e}")
+
+
+# ---------- Flask wiring ----------
+def init_app(app):
+    from flask import g, request, before_render_template, template_rendered
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            observe("http_request_duration_seconds", time.perf_counter() - start,
+                    (("route", route), ("method", request.method)))
+            inc("http_requests_total", (("route", route), ("method", request.method),
+                                        ("status", str(response.status_code))))
+        return response
+
+    def _before_render(sender, template, context, **extra):
+        _local.render_start = time.perf_counter()
+
+    def _rendered(sender, template, context, **extra):
+        start = getattr(_local, "render_start", None)
+        if start is not None:
+            observe("mitu_template_render_seconds", time.perf_counter() - start,
+                    (("template", template.name or "string"),))
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
@@ -0,0 +1,329 @@
+# Offline mining of messages the bot could not answer (intent = 'fallback').
+#
+# Streams the fallbacks out of MySQL in id order and turns each into a hashed
+# word/char n-gram TF-IDF vector with NumPy. Mini-batch spherical k-means then
+# clusters them. Memory stays bounded however many messages there are: one batch
+# matrix, the centroids and capped per-cluster samples. Three passes over the
+# stream: document frequencies, clustering, then a final assignment for the report.
+#   python mine_unmatched.py [--clusters 30] [--since 2025-01-01] [--output report.json]
+#   python mine_unmatched.py --backfill   # tag fallbacks stored before tagging existed
+import argparse
+import datetime
+import heapq
+import json
+import re
+import time
+import zlib
+
+import numpy as np
+
+import db
+from app import FALLBACK_REPLY, FALLBACK_TAG, get_intents
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+    a about an and are as at be but by can do does for from have hi hello how i if in is it me my no not of on or please
+    so tell that the there this to u us want was we what when where which who why will with you your
+""".split())
+
+MAX_EXAMPLES = 200      # distinct utterances remembered per cluster while scanning
+MAX_TERMS = 2000        # keyword counters are pruned back to half of this
+
+
+# ---------- Streaming ----------
+def iter_fallbacks(chunk, since=None, limit=None):
+    last_id, seen = 0, 0
+    while limit is None or seen < limit:
+        size = chunk if limit is None else min(chunk, limit - seen)
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, message FROM messages
+                WHERE intent = ? AND sender = 'user' AND id > ? {"AND timestamp >= ?" if since else ""}
+                ORDER BY id LIMIT ?
+            """, (FALLBACK_TAG, last_id) + ((since,) if since else ()) + (size,))
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        seen += len(rows)
+        yield rows
+
+
+def backfill_tags(chunk):
+    """Tag fallback replies stored before /chat recorded intents, and the user message each answered."""
+    last_id, tagged = 0, 0
+    while True:
+        with db.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, session_id FROM messages
+                WHERE sender = 'bot' AND intent IS NULL AND message = ? AND id > ? ORDER BY id LIMIT ?
+            """, (FALLBACK_REPLY, last_id, chunk))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids = [bot_id for bot_id, _ in rows]
+            for bot_id, session_id in rows:
+                cursor.execute("""
+                    SELECT MAX(id) FROM messages WHERE session_id = ? AND sender = 'user' AND id < ?
+                """, (session_id, bot_id))
+                user_id = cursor.fetchone()[0]
+                if user_id:
+                    ids.append(user_id)
+            cursor.executemany("UPDATE messages SET intent = ? WHERE id = ? AND intent IS NULL",
+                               [(FALLBACK_TAG, message_id) for message_id in ids])
+            conn.commit()
+        last_id = rows[-1][0]
+        tagged += len(rows)
+        print(f"  tagged {tagged} fallback replies (up to id {last_id})")
+    return tagged
+
+
+# ---------- Vectorizing ----------
+def terms(text):
+    """Suggested-keyword candidates: content words and word pairs."""
+    words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOPWORDS and len(w) > 1]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def features(text):
+    words = TOKEN_RE.findall(text.lower())
+    grams = [f"w:{w}" for w in words if w not in STOPWORDS]
+    grams += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f" {w} "
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return grams
+
+
+def feature_index(gram, n_features):
+    # crc32 rather than hash(): stable across processes and runs
+    return zlib.crc32(gram.encode("utf-8")) % n_features
+
+
+def term_index(term, n_features):
+    return feature_index(("b:" if " " in term else "w:") + term, n_features)
+
+
+class Vectorizer:
+    def __init__(self, n_features):
+        self.n_features = n_features
+        self.df = np.zeros(n_features, dtype=np.int64)
+        self.n_docs = 0
+        self.idf = None
+
+    def _coo(self, texts):
+        rows, cols = [], []
+        for i, text in enumerate(texts):
+            idx = [feature_index(g, self.n_features) for g in features(text)]
+            rows.extend([i] * len(idx))
+            cols.extend(idx)
+        return np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+
+    def partial_fit(self, texts):
+        rows, cols = self._coo(texts)
+        if len(cols):
+            # Count each feature once per document
+            unique = np.unique(rows * self.n_features + cols) % self.n_features
+            np.add.at(self.df, unique, 1)
+        self.n_docs += len(texts)
+
+    def finalize(self):
+        self.idf = (np.log((1 + self.n_docs) / (1 + self.df)) + 1).astype(np.float32)
+
+    def transform(self, texts):
+        rows, cols = self._coo(texts)
+        X = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        np.add.at(X, (rows, cols), 1)
+        nonzero = X > 0
+        X[nonzero] = 1 + np.log(X[nonzero])      # sublinear tf
+        X *= self.idf
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        return X / np.maximum(norms, 1e-12)
+
+
+# ---------- Clustering ----------
+class MiniBatchKMeans:
+    """Spherical k-means on unit vectors with Sculley-style per-centre learning rates."""
+
+    def __init__(self, k, seed=0):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.centers = None
+        self.counts = None
+
+    def _init(self, X):
+        # k-means++ on cosine distance over the first batch
+        k = min(self.k, len(X))
+        centers = [X[self.rng.integers(len(X))]]
+        dist = 1 - X @ centers[0]
+        for _ in range(1, k):
+            p = np.clip(dist, 0, None)
+            total = p.sum()
+            i = self.rng.choice(len(X), p=p / total) if total > 0 else self.rng.integers(len(X))
+            centers.append(X[i])
+            dist = np.minimum(dist, 1 - X @ X[i])
+        self.centers = np.vstack(centers).astype(np.float32)
+        self.counts = np.zeros(len(self.centers), dtype=np.int64)
+
+    def predict(self, X):
+        sims = X @ self.centers.T
+        labels = sims.argmax(axis=1)
+        return labels, sims[np.arange(len(X)), labels]
+
+    def partial_fit(self, X):
+        if self.centers is None:
+            self._init(X)
+        labels, _ = self.predict(X)
+        n = np.bincount(labels, minlength=len(self.centers))
+        sums = np.zeros_like(self.centers)
+        np.add.at(sums, labels, X)
+        hit = n > 0
+        self.counts[hit] += n[hit]
+        eta = (n[hit] / self.counts[hit])[:, None].astype(np.float32)
+        self.centers[hit] = (1 - eta) * self.centers[hit] + eta * (sums[hit] / n[hit][:, None])
+        self.centers /= np.maximum(np.linalg.norm(self.centers, axis=1, keepdims=True), 1e-12)
+
+
+# ---------- Report ----------
+class ClusterSummary:
+    def __init__(self):
+        self.size = 0
+        self.similarity = 0.0
+        self.examples = {}      # normalized text -> [count, best similarity, original text]
+        self.terms = {}
+
+    def add(self, text, similarity):
+        self.size += 1
+        self.similarity += similarity
+        key = " ".join(TOKEN_RE.findall(text.lower()))
+        entry = self.examples.get(key)
+        if entry is not None:
+            entry[0] += 1
+            entry[1] = max(entry[1], similarity)
+        else:
+            self.examples[key] = [1, similarity, text]
+            if len(self.examples) > MAX_EXAMPLES:
+                # Forget the least representative singleton
+                drop = min(self.examples, key=lambda k: (self.examples[k][0], self.examples[k][1]))
+                del self.examples[drop]
+        for term in set(terms(text)):
+            self.terms[term] = self.terms.get(term, 0) + 1
+        if len(self.terms) > MAX_TERMS:
+            keep = heapq.nlargest(MAX_TERMS // 2, self.terms.items(), key=lambda kv: kv[1])
+            self.terms = dict(keep)
+
+    def keywords(self, vectorizer, n=8):
+        idf = vectorizer.idf
+        scored = [(count * idf[term_index(term, vectorizer.n_features)], term) for term, count in self.terms.items()
+                  if count > 1 or self.size < 5]
+        return [term for _, term in sorted(scored, reverse=True)[:n]]
+
+    def top_examples(self, n=5):
+        ranked = sorted(self.examples.values(), key=lambda e: (-e[0], -e[1]))
+        return [{"text": text, "count": count} for count, _, text in ranked[:n]]
+
+
+def closest_intent(keywords):
+    words = {w for k in keywords for w in k.split()}
+    best, best_overlap = None, 0
+    for intent in get_intents()["intents"]:
+        intent_words = {w for k in intent.get("keywords", []) for w in TOKEN_RE.findall(k.lower())}
+        overlap = len(words & intent_words)
+        if overlap > best_overlap:
+            best, best_overlap = intent["tag"], overlap
+    return best
+
+
+def mine(args):
+    vectorizer = Vectorizer(args.features)
+    start = time.perf_counter()
+
+    print("Pass 1/3: document frequencies...")
+    for rows in iter_fallbacks(args.batch, args.since, args.limit):
+        vectorizer.partial_fit([text for _, text in rows])
+    if vectorizer.n_docs == 0:
+        print("No fallback messages found. (Run with --backfill to tag older ones.)")
+        return None
+    vectorizer.finalize()
+    print(f"  {vectorizer.n_docs} messages")
+
+    print(f"Pass 2/3: mini-batch k-means (k={args.clusters}, {args.epochs} epoch(s))...")
+    model = MiniBatchKMeans(args.clusters, seed=args.seed)
+    for _ in range(args.epochs):
+        for rows in iter_fallbacks(args.batch, args.since, args.limit):
+            model.partial_fit(vectorizer.transform([text for _, text in rows]))
+
+    print("Pass 3/3: assigning messages...")
+    summaries = [ClusterSummary() for _ in range(len(model.centers))]
+    for rows in iter_fallbacks(args.batch, args.since, args.limit):
+        texts = [text for _, text in rows]
+        labels, sims = model.predict(vectorizer.transform(texts))
+        for text, label, sim in zip(texts, labels, sims):
+            summaries[label].add(text, float(sim))
+
+    candidates = []
+    for i, summary in enumerate(summaries):
+        if summary.size < args.min_size:
+            continue
+        keywords = summary.keywords(vectorizer)
+        candidates.append({
+            "cluster": i,
+            "size": summary.size,
+            "share": round(summary.size / vectorizer.n_docs, 4),
+            "cohesion": round(summary.similarity / summary.size, 3),
+            "suggested_keywords": keywords,
+            "examples": summary.top_examples(),
+            "overlaps_intent": closest_intent(keywords),
+        })
+    # Big, tight clusters first: those are the clearest missing intents
+    candidates.sort(key=lambda c: c["size"] * c["cohesion"], reverse=True)
+
+    return {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "messages": vectorizer.n_docs,
+        "clusters": len(model.centers),
+        "seconds": round(time.perf_counter() - start, 1),
+        "candidates": candidates,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clusters", type=int, default=30)
+    parser.add_argument("--features", type=int, default=4096, help="hashed feature dimensions")
+    parser.add_argument("--batch", type=int, default=2048, help="messages per mini-batch / DB chunk")
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--min-size", type=int, default=5, help="hide clusters smaller than this")
+    parser.add_argument("--since", help="only messages on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--limit", type=int, help="stop after this many messages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--backfill", action="store_true", help="tag untagged fallback replies first")
+    args = parser.parse_args()
+
+    if args.backfill:
+        print("Tagging older fallbacks...")
+        backfill_tags(args.batch)
+
+    report = mine(args)
+    if report is None:
+        return
+
+    for rank, c in enumerate(report["candidates"][:15], 1):
+        related = f" (close to '{c['overlaps_intent']}')" if c["overlaps_intent"] else ""
+        print(f"\n#{rank} {c['size']} messages, cohesion {c['cohesion']}{related}")
+        print(f"   keywords: {', '.join(c['suggested_keywords'])}")
+        for example in c["examples"][:3]:
+            print(f"   - {example['text']!r} x{example['count']}")
+    print(f"\n{report['messages']} fallbacks in {len(report['candidates'])} candidate clusters ({report['seconds']}s).")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
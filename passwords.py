@@ -0,0 +1,126 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import metrics
+
+# ---------- Settings ----------
+# bcrypt is CPU bound and releases the GIL, so a small pool keeps hashing off
+# the request threads without letting a login burst starve every worker.
+WORKERS = int(os.environ.get("BCRYPT_WORKERS", 2))
+MAX_QUEUE = int(os.environ.get("BCRYPT_MAX_QUEUE", 32))
+TARGET_MS = float(os.environ.get("BCRYPT_TARGET_MS", 250))
+MIN_ROUNDS = 12            # bcrypt.gensalt()'s default; calibration never goes below it
+MAX_ROUNDS = 15
+
+# Stored in place of a hash for accounts that can only log in through OAuth.
+# It is not a valid bcrypt hash, so check_password() always rejects it.
+UNUSABLE_PASSWORD = "!"
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many bcrypt jobs are already waiting for the pool."""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(WORKERS + MAX_QUEUE)
+_rounds = None
+
+
+def _reset_after_fork():
+    # Pool threads and lock state do not survive fork(); start clean in the child.
+    global _executor, _executor_lock, _slots
+    _executor = None
+    _executor_lock = threading.Lock()
+    _slots = threading.BoundedSemaphore(WORKERS + MAX_QUEUE)
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def _submit(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy("Too many password operations in progress")
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+# ---------- Cost calibration ----------
+def calibrate(target_ms=None):
+    """Pick the bcrypt cost whose hash time is closest to target_ms without exceeding it."""
+    global _rounds
+    target_ms = target_ms or TARGET_MS
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=MIN_ROUNDS))
+    elapsed_ms = max((time.perf_counter() - start) * 1000, 0.001)
+
+    # Every extra round doubles the work.
+    extra = int(math.floor(math.log2(target_ms / elapsed_ms))) if target_ms > elapsed_ms else 0
+    _rounds = max(MIN_ROUNDS, min(MAX_ROUNDS, MIN_ROUNDS + extra))
+    print(f"bcrypt cost calibrated to {_rounds} ({elapsed_ms:.1f} ms at {MIN_ROUNDS}, target {target_ms:.0f} ms)")
+    return _rounds
+
+
+def get_rounds():
+    if _rounds is None:
+        calibrate()
+    return _rounds
+
+
+def get_hash_rounds(hashed_password):
+    # bcrypt hashes look like $2b$12$<salt+hash>
+    try:
+        return int(hashed_password.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed_password):
+    # Only ever upgrade: calibration is noisy, and a worker that measured a slower
+    # machine must not weaken hashes made at a higher cost
+    rounds = get_hash_rounds(hashed_password)
+    return rounds is not None and rounds < get_rounds()
+
+
+# ---------- Hashing ----------
+def _hash(password, rounds):
+    with metrics.timer("mitu_bcrypt_seconds", (("op", "hash"),)):
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def _check(hashed_password, password):
+    try:
+        with metrics.timer("mitu_bcrypt_seconds", (("op", "check"),)):
+            return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("utf-8"))
+    except ValueError:
+        # Not a bcrypt hash (e.g. UNUSABLE_PASSWORD)
+        return False
+
+
+def hash_password(password):
+    return _submit(_hash, password, get_rounds())
+
+
+def check_password(hashed_password, password):
+    if not hashed_password or hashed_password == UNUSABLE_PASSWORD:
+        return False
+    return _submit(_check, hashed_password, password)
@@ -0,0 +1,61 @@
+# Startup profiling report: import time, create_app() time and time to first request.
+#   python profile_startup.py [--top 15]
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def slowest_imports(top):
+    # -X importtime writes "import time: self [us] | cumulative | name" lines to stderr
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            cwd=BASE_DIR, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(.+)", line)
+        if match and len(match.group(3)) <= 3:  # top-level imports only
+            rows.append((int(match.group(2)), match.group(4).strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    import app as app_module
+    import_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    app = app_module.create_app({"PROPAGATE_EXCEPTIONS": True})
+    create_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    error = None
+    try:
+        status = app.test_client().get("/login").status_code
+    except Exception as e:
+        status, error = None, e
+    first_request_ms = (time.perf_counter() - start) * 1000
+
+    print("=== Startup profile ===")
+    print(f"import app           {import_ms:9.1f} ms")
+    print(f"create_app()         {create_ms:9.1f} ms")
+    print(f"first request        {first_request_ms:9.1f} ms  (GET /login -> {status})")
+    for name, ms in app_module.STARTUP_TIMINGS.items():
+        print(f"  bootstrap.{name:<20}{ms:9.1f} ms")
+    if error is not None:
+        print(f"  bootstrap failed: {error}")
+
+    print(f"\n=== Slowest top-level imports (cumulative) ===")
+    for us, name in slowest_imports(args.top):
+        print(f"{us / 1000:9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# On-demand request profiling.
+#
+# A request is profiled when an admin sends "X-Profile: 1", or when it falls in the
+# PROFILE_SAMPLE_PERCENT sample. The request then runs under cProfile (saved as
+# .pstats, open with snakeviz or pstats) while a sampler thread records its stacks
+# in collapsed format (.folded, feed to flamegraph.pl or speedscope). With the
+# header absent and sampling at 0, the cost is one dict lookup per request.
+# One request per process is profiled at a time (Python 3.12+ allows only one
+# active profiler); requests arriving meanwhile simply run unprofiled.
+import cProfile
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+SAMPLE_PERCENT = float(os.environ.get("PROFILE_SAMPLE_PERCENT", 0))
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.001))
+KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+HEADER = "HTTP_X_PROFILE"
+
+SLUG_RE = re.compile(r"[^A-Za-z0-9]+")
+NAME_RE = re.compile(r"^[\w.-]+$")
+_counter = itertools.count()
+_busy = threading.Lock()
+
+
+def _reset_after_fork():
+    global _busy
+    _busy = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ---------- Stack sampler ----------
+class StackSampler:
+    """Samples one thread's Python stack every interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(names))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+# ---------- Middleware ----------
+class ProfilerMiddleware:
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if environ.get(HEADER, "").strip() == "1":
+            reason = "header" if self._is_admin(environ) else None
+        elif SAMPLE_PERCENT and random.random() * 100 < SAMPLE_PERCENT:
+            reason = "sample"
+        else:
+            reason = None
+        if reason is None or not _busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self._profile(environ, start_response, reason)
+        finally:
+            _busy.release()
+
+    def _is_admin(self, environ):
+        # Only worth decoding the session cookie when the header is present
+        from flask import session
+        with self.app.request_context(environ):
+            return session.get("user_role") == "Admin"
+
+    def _profile(self, environ, start_response, reason):
+        status = []
+
+        def capture(code, headers, exc_info=None):
+            status.append(code)
+            return start_response(code, headers, exc_info)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with StackSampler(threading.get_ident()) as sampler:
+            iterable = profiler.runcall(self.wsgi_app, environ, capture)
+            try:
+                # Render the body too, so lazy responses are inside the profile
+                body = profiler.runcall(list, iterable)
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+        elapsed = time.perf_counter() - start
+        try:
+            save(profiler, sampler, environ, status[0] if status else "", elapsed, reason)
+        except Exception as e:
+            print(f"Error saving profile: {e}")
+        return body
+
+
+# ---------- Storage ----------
+def save(profiler, sampler, environ, status, elapsed, reason):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    method = environ.get("REQUEST_METHOD", "GET")
+    path = environ.get("PATH_INFO", "/")
+    name = "{}-{}-{}-{}-{}".format(time.strftime("%Y%m%d-%H%M%S"), method,
+                                   SLUG_RE.sub("_", path).strip("_") or "root", os.getpid(), next(_counter))
+    base = os.path.join(PROFILE_DIR, name)
+    profiler.dump_stats(base + ".pstats")
+    sampler.write(base + ".folded")
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump({"name": name, "method": method, "path": path, "query": environ.get("QUERY_STRING", ""),
+                   "status": status, "ms": round(elapsed * 1000, 1), "reason": reason,
+                   "samples": sum(sampler.stacks.values()), "created": time.time()}, f)
+    _prune()
+
+
+def _prune():
+    entries = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+    for old in entries[:max(0, len(entries) - KEEP)]:
+        for ext in (".json", ".pstats", ".folded"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old[:-5] + ext))
+            except OSError:
+                pass
+
+
+def recent(limit=100):
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")), reverse=True)[:limit]:
+        try:
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def artifact_path(filename):
+    """Path of a saved .pstats/.folded file, or None for anything else."""
+    if not NAME_RE.match(filename) or not filename.endswith((".pstats", ".folded")):
+        return None
+    path = os.path.join(PROFILE_DIR, filename)
+    return path if os.path.isfile(path) else None
+
+
+def init_app(app):
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, app)
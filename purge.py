@@ -0,0 +1,317 @@
+# Chunked deletion service.
+#
+# Deleting a session or a user marks the row deleted_at right away (it disappears
+# from every query) and queues a job. A background thread then removes the data
+# in small batches, one short transaction each, throttled so a big purge never
+# holds locks or piles up undo log. Archived history is marked forgotten here, which
+# hides it at once; the bytes leave the segment files on the next `archive.py compact`
+# (cron), so the web workers never rewrite segments. Admins use the same jobs from the CLI:
+#   python purge.py session <id> | user <email> | all --yes [--background]
+#   python purge.py status | run
+import argparse
+import os
+import threading
+import time
+import uuid
+
+import chat_sessions
+import db
+import user_cache
+
+# ---------- Settings ----------
+BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", 500))
+MAX_ROWS_PER_SECOND = int(os.environ.get("PURGE_MAX_ROWS_PER_SECOND", 2000))
+POLL_INTERVAL = float(os.environ.get("PURGE_POLL_INTERVAL", 10))
+MAX_ATTEMPTS = 5
+# A running job refreshes its claim after every batch; one this quiet lost its worker.
+STALE_CLAIM_MINUTES = 10
+
+# Steps per job kind, run in order: (table, statement). Each statement removes (for
+# archive_chunks: marks) at most {limit} rows and is repeated until it comes back short.
+PLANS = {
+    "session": [
+        ("messages", "DELETE FROM messages WHERE session_id = ? LIMIT {limit}"),
+        ("archive_chunks", "UPDATE archive_chunks SET forgotten = 1 WHERE session_id = ? AND forgotten = 0 LIMIT {limit}"),
+        ("message_reactions", "DELETE FROM message_reactions WHERE session_id = ? LIMIT {limit}"),
+        ("sessions", "DELETE FROM sessions WHERE id = ? AND deleted_at IS NOT NULL LIMIT {limit}"),
+    ],
+    "user": [
+        ("messages", "DELETE FROM messages WHERE user_id = ? LIMIT {limit}"),
+        ("archive_chunks", "UPDATE archive_chunks SET forgotten = 1 WHERE user_id = ? AND forgotten = 0 LIMIT {limit}"),
+        ("message_reactions", "DELETE FROM message_reactions WHERE user_id = ? LIMIT {limit}"),
+        ("sessions", "DELETE FROM sessions WHERE user_id = ? LIMIT {limit}"),
+        ("session_tombstones", "DELETE FROM session_tombstones WHERE user_id = ? LIMIT {limit}"),
+        ("login_activity", "DELETE FROM login_activity WHERE user_id = ? LIMIT {limit}"),
+        ("leads", "DELETE FROM leads WHERE user_id = ? LIMIT {limit}"),
+        ("users", "DELETE FROM users WHERE id = ? AND deleted_at IS NOT NULL LIMIT {limit}"),
+    ],
+    # Wipes every account; leads are business records, so they are only detached.
+    "all": [
+        ("messages", "DELETE FROM messages LIMIT {limit}"),
+        ("archive_chunks", "UPDATE archive_chunks SET forgotten = 1 WHERE forgotten = 0 LIMIT {limit}"),
+        ("message_reactions", "DELETE FROM message_reactions LIMIT {limit}"),
+        ("sessions", "DELETE FROM sessions LIMIT {limit}"),
+        ("session_tombstones", "DELETE FROM session_tombstones LIMIT {limit}"),
+        ("login_activity", "DELETE FROM login_activity LIMIT {limit}"),
+        ("leads", "UPDATE leads SET user_id = NULL WHERE user_id IS NOT NULL LIMIT {limit}"),
+        ("users", "DELETE FROM users LIMIT {limit}"),
+    ],
+}
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_thread = None
+
+
+def _reset_after_fork():
+    global _wakeup, _stop, _thread
+    _wakeup = threading.Event()
+    _stop = threading.Event()
+    _thread = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_deletions(cursor):
+    for table in ("sessions", "users"):
+        cursor.execute(f"SHOW COLUMNS FROM {table}")
+        if 'deleted_at' not in [column[0] for column in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN deleted_at DATETIME DEFAULT NULL")
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deletion_jobs (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            kind VARCHAR(20) NOT NULL,
+            target_id INTEGER,
+            status VARCHAR(20) DEFAULT 'Pending',
+            current_step VARCHAR(64),
+            rows_deleted INTEGER DEFAULT 0,
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            claimed_by VARCHAR(64),
+            claimed_at DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME,
+            INDEX idx_deletion_due (status, id)
+        )
+    ''')
+
+
+# ---------- Soft delete ----------
+def enqueue(cursor, kind, target_id=None):
+    cursor.execute("INSERT INTO deletion_jobs (kind, target_id) VALUES (?, ?)", (kind, target_id))
+    return cursor.lastrowid
+
+
+def delete_session(cursor, user_id, session_id):
+    """Hide the session now and queue its purge. Returns the job id, or None if not the user's."""
+    # User row before session row, the same order as /chat, so the two can't deadlock
+    version = chat_sessions.bump_version(cursor, user_id)
+    cursor.execute("UPDATE sessions SET deleted_at = NOW() WHERE id = ? AND user_id = ? AND deleted_at IS NULL",
+                   (session_id, user_id))
+    if cursor.rowcount == 0:
+        return None
+    chat_sessions.add_tombstone(cursor, user_id, session_id, version)
+    return enqueue(cursor, "session", session_id)
+
+
+def delete_user(cursor, user_id):
+    cursor.execute("UPDATE users SET deleted_at = NOW() WHERE id = ? AND deleted_at IS NULL", (user_id,))
+    if cursor.rowcount == 0:
+        return None
+    user_cache.invalidate(user_id=user_id)
+    return enqueue(cursor, "user", user_id)
+
+
+def wake():
+    _wakeup.set()
+
+
+# ---------- Purge ----------
+def _checkpoint(cursor, job_id, table, total, claim):
+    cursor.execute("""
+        UPDATE deletion_jobs SET current_step = ?, rows_deleted = ?, claimed_at = NOW()
+        WHERE id = ? AND (claimed_by = ? OR ? IS NULL)
+    """, (table, total, job_id, claim, claim))
+
+
+def run_job(job_id, kind, target_id, progress=None, claim=None):
+    """Work through the job's plan batch by batch. Returns the number of rows removed."""
+    total = 0
+    for table, statement in PLANS[kind]:
+        sql = statement.format(limit=BATCH_SIZE)
+        params = (target_id,) if "?" in sql else ()
+        while not _stop.is_set():
+            start = time.monotonic()
+            with db.connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                count = cursor.rowcount
+                total += count
+                _checkpoint(cursor, job_id, table, total, claim)
+                conn.commit()
+            if progress:
+                progress(table, count, total)
+            if count < BATCH_SIZE:
+                break
+            # Throttle: never remove more than MAX_ROWS_PER_SECOND
+            _stop.wait(max(0.0, count / MAX_ROWS_PER_SECOND - (time.monotonic() - start)))
+    return total
+
+
+def _claim_job():
+    token = uuid.uuid4().hex
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE deletion_jobs SET status = 'Running', claimed_by = ?, claimed_at = NOW(), attempts = attempts + 1
+            WHERE status = 'Pending'
+               OR (status = 'Running' AND claimed_at < NOW() - INTERVAL {STALE_CLAIM_MINUTES} MINUTE)
+            ORDER BY id LIMIT 1
+        """, (token,))
+        conn.commit()
+        cursor.execute("SELECT id, kind, target_id, attempts FROM deletion_jobs WHERE claimed_by = ? AND status = 'Running'",
+                       (token,))
+        row = cursor.fetchone()
+    return (token,) + row if row else None
+
+
+def _finish(job_id, token, error=None, attempts=0):
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        if error is None:
+            cursor.execute("UPDATE deletion_jobs SET status = 'Done', finished_at = NOW(), claimed_by = NULL WHERE id = ?",
+                           (job_id,))
+        else:
+            status = 'Failed' if attempts >= MAX_ATTEMPTS else 'Pending'
+            cursor.execute("UPDATE deletion_jobs SET status = ?, last_error = ?, claimed_by = NULL WHERE id = ? AND claimed_by = ?",
+                           (status, error, job_id, token))
+        conn.commit()
+
+
+def run_next(progress=None):
+    """Claim and run one queued job. Returns its id, or None when the queue is empty."""
+    claimed = _claim_job()
+    if claimed is None:
+        return None
+    token, job_id, kind, target_id, attempts = claimed
+    try:
+        run_job(job_id, kind, target_id, progress=progress, claim=token)
+    except Exception as e:
+        print(f"Deletion job {job_id} ({kind} {target_id}) failed: {e}")
+        _finish(job_id, token, str(e), attempts)
+        return job_id
+    if not _stop.is_set():
+        _finish(job_id, token)
+    return job_id
+
+
+def _run():
+    while not _stop.is_set():
+        try:
+            while not _stop.is_set() and run_next() is not None:
+                pass
+        except Exception as e:
+            print(f"Deletion worker error: {e}")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="purge", daemon=True)
+    _thread.start()
+
+
+def stop(timeout=10):
+    # An interrupted job keeps its claim and is picked up again once it goes stale
+    _stop.set()
+    _wakeup.set()
+    if _thread is not None:
+        _thread.join(timeout)
+
+
+def jobs(limit=20):
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, kind, target_id, status, current_step, rows_deleted, attempts, last_error, created_at, finished_at
+            FROM deletion_jobs ORDER BY id DESC LIMIT ?
+        """, (limit,))
+        columns = ("id", "kind", "target_id", "status", "current_step", "rows_deleted",
+                   "attempts", "last_error", "created_at", "finished_at")
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+# ---------- Admin CLI ----------
+def _print_progress(table, count, total):
+    print(f"  {table}: -{count} rows ({total} total)")
+
+
+def _queue(kind, target):
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        init_deletions(cursor)
+        if kind == "session":
+            cursor.execute("SELECT user_id FROM sessions WHERE id = ?", (target,))
+            row = cursor.fetchone()
+            job_id = delete_session(cursor, row[0], target) if row else None
+        elif kind == "user":
+            cursor.execute("SELECT id FROM users WHERE LOWER(email) = ?", (target.strip().lower(),))
+            row = cursor.fetchone()
+            job_id = delete_user(cursor, row[0]) if row else None
+        else:
+            job_id = enqueue(cursor, "all")
+        conn.commit()
+    return job_id
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue and run chunked deletions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("session", help="delete one chat session")
+    p.add_argument("session_id", type=int)
+    p = sub.add_parser("user", help="delete a user and everything they own")
+    p.add_argument("email")
+    p = sub.add_parser("all", help="delete every user, session and message")
+    p.add_argument("--yes", action="store_true", help="confirm wiping all accounts")
+    sub.add_parser("run", help="drain the queue in the foreground")
+    sub.add_parser("status", help="show recent jobs")
+    for name in ("session", "user", "all"):
+        sub.choices[name].add_argument("--background", action="store_true",
+                                       help="only queue the job; the app's worker purges it")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        for job in jobs():
+            print(f"#{job['id']} {job['kind']} {job['target_id'] or ''} {job['status']} "
+                  f"step={job['current_step'] or '-'} rows={job['rows_deleted']} {job['last_error'] or ''}")
+        return
+
+    if args.command in ("session", "user", "all"):
+        if args.command == "all" and not args.yes:
+            parser.error("refusing to delete all accounts without --yes")
+        target = getattr(args, "session_id", None) or getattr(args, "email", None)
+        job_id = _queue(args.command, target)
+        if job_id is None:
+            print(f"No {args.command} {target} found (or already deleted).")
+            return
+        print(f"Queued deletion job #{job_id}.")
+        if args.background:
+            return
+
+    start_time = time.perf_counter()
+    while True:
+        job_id = run_next(progress=_print_progress)
+        if job_id is None:
+            break
+        print(f"Job #{job_id} finished.")
+    print(f"Queue drained in {time.perf_counter() - start_time:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# Token-bucket rate limiting for the expensive routes.
+#
+# Each (route, client) pair owns a bucket of `capacity` tokens that refills over
+# `period` seconds; a request spends one token or gets a 429. Clients are keyed by
+# the logged-in user id or by request.remote_addr (behind a proxy, set TRUSTED_PROXIES
+# so that is the client's address). Buckets live in memory, spread over SHARDS dicts
+# with one lock each, so concurrent requests rarely share a lock.
+# With several workers each process would enforce its own limit, so
+# RATELIMIT_BACKEND=sqlite keeps the buckets in one SQLite file (RATELIMIT_DB) on
+# the host instead. Limits are set per route with RATELIMIT_<ROUTE>="capacity/seconds".
+import os
+import sqlite3
+import threading
+import time
+
+from flask import flash, jsonify, render_template, request, session
+
+import metrics
+
+# ---------- Settings ----------
+ENABLED = os.environ.get("RATELIMIT_ENABLED", "True") == "True"
+BACKEND = os.environ.get("RATELIMIT_BACKEND", "memory")
+DB_PATH = os.environ.get("RATELIMIT_DB", "/tmp/mitu-ratelimit.sqlite3")
+SHARDS = 64
+MAX_KEYS_PER_SHARD = 5000
+SQLITE_PRUNE_EVERY = 1000   # writes between sweeps of idle rows from the shared file
+
+
+class Limit:
+    def __init__(self, capacity, period, key, methods=("POST",), template=None, message=None):
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.key = key              # "user" (falls back to IP when logged out) or "ip"
+        self.methods = methods
+        self.template = template    # form routes re-render with a flash; None means JSON
+        self.message = message
+
+    @property
+    def rate(self):
+        return self.capacity / self.period
+
+
+def _limit(name, capacity, period, **options):
+    spec = os.environ.get(f"RATELIMIT_{name.upper()}")
+    if spec:
+        capacity, period = (float(part) for part in spec.split("/"))
+    return Limit(capacity, period, **options)
+
+
+# Keyed by endpoint (the view function name)
+LIMITS = {
+    "chat": _limit("chat", 30, 60, key="user",
+                   message="You're sending messages too quickly. Please wait {retry} seconds."),
+    "login": _limit("login", 10, 300, key="ip", template="login.html",
+                    message="Too many login attempts. Please try again in {retry} seconds."),
+    "signup": _limit("signup", 5, 3600, key="ip", template="signup.html",
+                     message="Too many sign-ups from your network. Please try again in {retry} seconds."),
+    "forgot_password": _limit("forgot_password", 5, 3600, key="ip", template="forgot_password.html",
+                              message="Too many reset requests. Please try again in {retry} seconds."),
+}
+
+
+# ---------- In-memory buckets ----------
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}       # key -> [tokens, last refill (monotonic)]
+
+
+_shards = [_Shard() for _ in range(SHARDS)]
+
+
+def _take_memory(key, limit, now):
+    shard = _shards[hash(key) % SHARDS]
+    with shard.lock:
+        bucket = shard.buckets.get(key)
+        if bucket is None:
+            if len(shard.buckets) >= MAX_KEYS_PER_SHARD:
+                _prune(shard, now)
+            bucket = shard.buckets[key] = [limit.capacity, now]
+        tokens = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return True, 0
+        bucket[0] = tokens
+        return False, (1 - tokens) / limit.rate
+
+
+def _prune(shard, now):
+    # A bucket that has had time to refill completely is the same as no bucket
+    for key, (tokens, last) in list(shard.buckets.items()):
+        limit = LIMITS.get(key[0])
+        if limit is None or tokens + (now - last) * limit.rate >= limit.capacity:
+            del shard.buckets[key]
+
+
+# ---------- Shared SQLite buckets ----------
+_local = threading.local()
+
+
+def _reset_after_fork():
+    global _shards, _local
+    _shards = [_Shard() for _ in range(SHARDS)]
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _sqlite():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = sqlite3.connect(DB_PATH, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+    return conn
+
+
+def _take_sqlite(key, limit, now):
+    conn = _sqlite()
+    key = ":".join(str(part) for part in key)
+    # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write is atomic across workers
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        tokens = limit.capacity if row is None else min(limit.capacity, row[0] + (now - row[1]) * limit.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+        _local.writes = getattr(_local, "writes", 0) + 1
+        if _local.writes % SQLITE_PRUNE_EVERY == 0:
+            idle = max(limit.period for limit in LIMITS.values())
+            conn.execute("DELETE FROM buckets WHERE updated < ?", (now - idle,))
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    return allowed, 0 if allowed else (1 - tokens) / limit.rate
+
+
+def take(name, client, now=None):
+    """Spend a token from name's bucket for client. Returns (allowed, retry_after_seconds)."""
+    limit = LIMITS[name]
+    key = (name, client)
+    if BACKEND == "sqlite":
+        try:
+            # Wall clock: the timestamps are compared across processes
+            return _take_sqlite(key, limit, time.time() if now is None else now)
+        except sqlite3.Error as e:
+            # A broken shared file must not take the site down: fall back to this worker's buckets
+            print(f"Rate limiter backend error: {e}")
+    return _take_memory(key, limit, time.monotonic() if now is None else now)
+
+
+# ---------- Flask wiring ----------
+def client_key(limit):
+    if limit.key == "user" and "user_id" in session:
+        return f"user:{session['user_id']}"
+    return f"ip:{request.remote_addr}"
+
+
+def too_many(limit, retry_after):
+    retry = max(1, int(retry_after + 0.999))
+    message = limit.message.format(retry=retry)
+    if limit.template:
+        flash(message, "error")
+        body = render_template(limit.template)
+    else:
+        # "reply" so the chat window shows the message like any bot answer
+        body = jsonify({"reply": message, "error": "rate_limited", "retry_after": retry})
+    return body, 429, {"Retry-After": str(retry)}
+
+
+def init_app(app):
+    if not ENABLED:
+        return
+
+    @app.before_request
+    def _check_rate_limit():
+        limit = LIMITS.get(request.endpoint)
+        if limit is None or request.method not in limit.methods:
+            return None
+        allowed, retry_after = take(request.endpoint, client_key(limit))
+        if allowed:
+            return None
+        metrics.inc("mitu_ratelimit_rejected_total", (("route", request.endpoint), ("key", limit.key)))
+        return too_many(limit, retry_after)
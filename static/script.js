@@ -17,13 +17,15 @@ function sendMessage() {
 
     var chatBox = document.getElementById("chat-box");
     const userName = document.querySelector(".user-info strong").textContent || "User";
+    const userAvatar = document.querySelector(".user-info").dataset.avatar ||
+        `https://ui-avatars.com/api/?name=${encodeURIComponent(userName)}&background=random`;
 
     // Append user message
     var userMessageDiv = document.createElement("div");
     userMessageDiv.className = "user-message message";
     userMessageDiv.innerHTML = `
         <div class="content">${escapeHtml(userInput)}</div>
-        <div class="avatar"><img src="https://ui-avatars.com/api/?name=${encodeURIComponent(userName)}&background=random" alt="User"></div>
+        <div class="avatar"><img src="${userAvatar}" alt="User"></div>
     `;
     chatBox.appendChild(userMessageDiv);
     document.getElementById("user-input").value = "";
@@ -47,11 +49,19 @@ function sendMessage() {
             // Remove typing indicator
             removeTypingIndicator(typingDiv);
 
-            if (!sessionId && data.session_id) {
+            // A new session, or the old one was deleted and the server started another
+            if (data.session_id && String(data.session_id) !== sessionId) {
                 window.location.href = "/?session_id=" + data.session_id;
                 return;
             }
 
+            if (data.message_id) {
+                cacheMessages([
+                    { id: data.user_message_id, session_id: Number(sessionId), sender: "user", message: userInput },
+                    { id: data.message_id, session_id: Number(sessionId), sender: "bot", message: data.reply }
+                ]).catch(() => { });
+            }
+
             // Build bot message
             var botMessageDiv = document.createElement("div");
             botMessageDiv.className = "bot-message message";
@@ -141,10 +151,14 @@ function reactToMessage(btn, type) {
     const bar = btn.closest(".reaction-bar");
     const allBtns = bar.querySelectorAll(".reaction-btn");
 
+    const messageDiv = btn.closest(".message");
+    const messageId = messageDiv ? messageDiv.dataset.messageId : "";
+
     // Toggle off if already active
     if (btn.classList.contains("active")) {
         btn.classList.remove("active");
         btn.classList.remove("animate-reaction");
+        sendReaction(messageId, "none");
         return;
     }
 
@@ -159,13 +173,18 @@ function reactToMessage(btn, type) {
     // Show toast feedback
     showToast(type === "like" ? "Thanks for the feedback! 😊" : "We'll work on improving that 🙏");
 
-    // Optionally send feedback to backend (non-blocking)
+    sendReaction(messageId, type);
+}
+
+function sendReaction(messageId, type) {
+    // Replies shown before the server assigned an id (e.g. a failed send) can't be rated
+    if (!messageId) return;
     const csrfToken = document.getElementById("csrf_token").value;
     fetch("/react", {
         method: "POST",
         headers: { "Content-Type": "application/json", "X-CSRFToken": csrfToken },
-        body: JSON.stringify({ reaction: type })
-    }).catch(() => { }); // Silently fail if endpoint not ready
+        body: JSON.stringify({ reaction: type, message_id: Number(messageId) })
+    }).catch(() => { }); // Feedback is best effort
 }
 
 // ---------- Toast Notification ----------
@@ -425,6 +444,7 @@ window.onload = function () {
     var chatBox = document.getElementById("chat-box");
     chatBox.scrollTop = chatBox.scrollHeight;
     populateCourses();
+    syncHistory().catch(error => console.error("History sync failed:", error));
 };
 
 // ---------- Courses Data ----------
@@ -557,11 +577,13 @@ function deleteSession(event, sessionId) {
             .then(data => {
                 if (data.success) {
                     const currentSessionId = document.getElementById("current-session-id").value;
-                    if (currentSessionId === sessionId) {
-                        window.location.href = "/new_chat";
-                    } else {
-                        window.location.reload();
-                    }
+                    dropCachedSession(sessionId).catch(() => { }).finally(() => {
+                        if (currentSessionId === sessionId) {
+                            window.location.href = "/new_chat";
+                        } else {
+                            window.location.reload();
+                        }
+                    });
                 } else {
                     alert("Error: " + (data.error || "Could not delete session"));
                 }
@@ -572,3 +594,225 @@ function deleteSession(event, sessionId) {
             });
     }
 }
+
+// ---------- History Cache (IndexedDB) ----------
+// Conversations are kept in the browser so revisiting a session renders at once;
+// /sync then sends only what changed. The server skips rendering messages when the
+// history_cache cookie says this browser has a cache.
+const HISTORY_DB_VERSION = 1;
+let historyDbPromise = null;
+
+function currentUserId() {
+    return document.querySelector(".user-info").dataset.userId || "";
+}
+
+function openHistoryDb() {
+    if (historyDbPromise) return historyDbPromise;
+    historyDbPromise = new Promise((resolve, reject) => {
+        if (!window.indexedDB || !currentUserId()) {
+            reject(new Error("IndexedDB unavailable"));
+            return;
+        }
+        // One database per account, so a shared browser never mixes histories
+        const request = indexedDB.open("mitu-history-" + currentUserId(), HISTORY_DB_VERSION);
+        request.onupgradeneeded = () => {
+            const db = request.result;
+            const messages = db.createObjectStore("messages", { keyPath: "id" });
+            messages.createIndex("session_id", "session_id");
+            db.createObjectStore("sessions", { keyPath: "id" });
+            db.createObjectStore("meta", { keyPath: "key" });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+    return historyDbPromise;
+}
+
+function idbRequest(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function idbDone(tx) {
+    return new Promise((resolve, reject) => {
+        tx.oncomplete = () => resolve();
+        tx.onerror = tx.onabort = () => reject(tx.error);
+    });
+}
+
+async function getCachedMessages(sessionId) {
+    const db = await openHistoryDb();
+    const index = db.transaction("messages").objectStore("messages").index("session_id");
+    const rows = await idbRequest(index.getAll(Number(sessionId)));
+    return rows.sort((a, b) => a.id - b.id);
+}
+
+async function getSessionAfter(sessionId) {
+    // Newest message id fetched from /sync for the session; messages cached from /chat don't count,
+    // so a session first seen server-rendered is still filled in from the start
+    const db = await openHistoryDb();
+    const row = await idbRequest(db.transaction("meta").objectStore("meta").get("after:" + sessionId));
+    return row ? row.value : 0;
+}
+
+async function getSyncCursor() {
+    const db = await openHistoryDb();
+    const row = await idbRequest(db.transaction("meta").objectStore("meta").get("cursor"));
+    return row ? row.value : { since: 0, deleted_since: 0 };
+}
+
+async function applyDelta(delta) {
+    const db = await openHistoryDb();
+    const tx = db.transaction(["messages", "sessions", "meta"], "readwrite");
+    const messages = tx.objectStore("messages");
+    const sessions = tx.objectStore("sessions");
+    delta.sessions.forEach(s => sessions.put(s));
+    delta.messages.forEach(m => messages.put(m));
+    delta.deleted_sessions.forEach(id => {
+        sessions.delete(id);
+        tx.objectStore("meta").delete("after:" + id);
+        const range = IDBKeyRange.only(id);
+        messages.index("session_id").openKeyCursor(range).onsuccess = event => {
+            const cursor = event.target.result;
+            if (cursor) {
+                messages.delete(cursor.primaryKey);
+                cursor.continue();
+            }
+        };
+    });
+    if (delta.messages.length) {
+        const last = delta.messages[delta.messages.length - 1];
+        tx.objectStore("meta").put({ key: "after:" + last.session_id, value: last.id });
+    }
+    tx.objectStore("meta").put({
+        key: "cursor",
+        value: { since: delta.cursor.since, deleted_since: delta.cursor.deleted_since }
+    });
+    return idbDone(tx);
+}
+
+async function cacheMessages(messages) {
+    const db = await openHistoryDb();
+    const tx = db.transaction("messages", "readwrite");
+    messages.forEach(m => tx.objectStore("messages").put(m));
+    return idbDone(tx);
+}
+
+async function dropCachedSession(sessionId) {
+    await applyDelta({
+        sessions: [], messages: [], deleted_sessions: [Number(sessionId)],
+        cursor: await getSyncCursor()
+    });
+}
+
+function clearHistoryCache() {
+    document.cookie = "history_cache=; path=/; max-age=0; SameSite=Lax";
+    if (!window.indexedDB || !currentUserId()) return Promise.resolve();
+    return new Promise(resolve => {
+        const request = indexedDB.deleteDatabase("mitu-history-" + currentUserId());
+        request.onsuccess = request.onerror = request.onblocked = () => resolve();
+    });
+}
+
+function renderCachedMessage(chatBox, msg) {
+    // Same markup the server renders in index.html
+    if (chatBox.querySelector(`.message[data-message-id="${msg.id}"]`)) return;
+    const div = document.createElement("div");
+    div.dataset.messageId = msg.id;
+    if (msg.sender === "user") {
+        const userName = document.querySelector(".user-info strong").textContent || "User";
+        const userAvatar = document.querySelector(".user-info").dataset.avatar ||
+            `https://ui-avatars.com/api/?name=${encodeURIComponent(userName)}&background=random`;
+        div.className = "user-message message";
+        div.innerHTML = `
+            <div class="content">${escapeHtml(msg.message)}</div>
+            <div class="avatar"><img src="${userAvatar}" alt="User"></div>
+        `;
+    } else {
+        div.className = "bot-message message";
+        div.innerHTML = `
+            <div class="avatar"><img src="/static/logo.png" alt="Bot"></div>
+            <div class="message-wrapper">
+                <div class="content">${escapeHtml(msg.message)}</div>
+                <div class="reaction-bar">
+                    <button class="reaction-btn" onclick="reactToMessage(this, 'like')" title="Helpful">👍</button>
+                    <button class="reaction-btn" onclick="reactToMessage(this, 'dislike')" title="Not helpful">👎</button>
+                </div>
+            </div>
+        `;
+    }
+    chatBox.appendChild(div);
+}
+
+function updateSidebar(delta) {
+    delta.deleted_sessions.forEach(id => {
+        const wrapper = document.querySelector(`.session-wrapper[data-session-id="${id}"]`);
+        if (wrapper) wrapper.remove();
+    });
+    delta.sessions.forEach(s => {
+        const wrapper = document.querySelector(`.session-wrapper[data-session-id="${s.id}"]`);
+        if (!wrapper) return;
+        const previewEl = wrapper.querySelector(".session-preview");
+        if (previewEl && s.preview) previewEl.textContent = s.preview;
+        const countEl = wrapper.querySelector(".session-count");
+        if (countEl) countEl.textContent = s.message_count;
+    });
+}
+
+function logout(event) {
+    // Don't leave this account's history behind on a shared browser
+    event.preventDefault();
+    const href = event.currentTarget.href;
+    clearHistoryCache().finally(() => { window.location.href = href; });
+}
+
+async function syncHistory() {
+    const chatBox = document.getElementById("chat-box");
+    const sessionId = document.getElementById("current-session-id").value;
+    const fromCache = chatBox.dataset.sync === "1";
+    let after = 0;
+    let cursor = { since: 0, deleted_since: 0 };
+
+    try {
+        if (fromCache && sessionId) {
+            const cached = await getCachedMessages(sessionId);
+            cached.forEach(m => renderCachedMessage(chatBox, m));
+            chatBox.scrollTop = chatBox.scrollHeight;
+        }
+        if (sessionId) after = await getSessionAfter(sessionId);
+        cursor = await getSyncCursor();
+        // From now on the server can leave message rendering to us
+        document.cookie = "history_cache=1; path=/; max-age=31536000; SameSite=Lax";
+    } catch (e) {
+        // No usable IndexedDB (private mode, old browser): fall back to server rendering
+        document.cookie = "history_cache=; path=/; max-age=0; SameSite=Lax";
+        if (!fromCache) return;
+    }
+
+    let hasMore = true;
+    while (hasMore) {
+        const params = new URLSearchParams({
+            since: cursor.since, deleted_since: cursor.deleted_since, after: after
+        });
+        if (sessionId) params.set("session_id", sessionId);
+        const response = await fetch("/sync?" + params.toString());
+        if (!response.ok) return;
+        const delta = await response.json();
+
+        if (fromCache) {
+            delta.messages.forEach(m => renderCachedMessage(chatBox, m));
+            if (delta.messages.length) chatBox.scrollTop = chatBox.scrollHeight;
+        }
+        updateSidebar(delta);
+        if (sessionId && delta.deleted_sessions.includes(Number(sessionId))) {
+            window.location.href = "/new_chat";
+        }
+        await applyDelta(delta).catch(() => { });
+
+        cursor = delta.cursor;
+        after = delta.cursor.after;
+        hasMore = delta.has_more;
+    }
+}
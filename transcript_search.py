@@ -0,0 +1,167 @@
+import argparse
+import datetime
+import re
+import time
+
+import db
+
+# Transcript search for admins and counselors, backed by an InnoDB FULLTEXT index on
+# messages.message. InnoDB updates the index on commit, so replies saved by /chat are
+# searchable straight away, with no reindexing job. Building the index reads the whole
+# table, so it is a one-off step rather than part of startup:
+#   python transcript_search.py
+PER_PAGE = 20
+SNIPPET_RADIUS = 80
+MIN_TOKEN = 3   # innodb_ft_min_token_size default; shorter words are not indexed
+
+WORD_RE = re.compile(r"\w+")
+PHONE_RE = re.compile(r"^\+?[\d\s().-]{6,}$")
+BOOLEAN_CHARS = set('+-"*()<>~')
+
+
+def has_search_index(cursor):
+    cursor.execute("SHOW INDEX FROM messages WHERE Key_name = 'ft_messages_message'")
+    return bool(cursor.fetchall())
+
+
+def init_search_index(cursor):
+    # Only checks: on a large messages table the ALTER would hold up startup for the whole rebuild
+    if not has_search_index(cursor):
+        print("Transcript search index missing; admin search is unavailable. Run: python transcript_search.py")
+
+
+def build_search_index(cursor):
+    cursor.execute("ALTER TABLE messages ADD FULLTEXT INDEX ft_messages_message (message)")
+
+
+# ---------- Query building ----------
+def build_match(query):
+    """Return (mode, against) for MATCH ... AGAINST, or None if nothing is searchable."""
+    query = query.strip()
+    if not query:
+        return None
+    if PHONE_RE.match(query):
+        # Numbers are stored however students typed them: "99601 63010" or "9960163010"
+        groups = [g for g in re.findall(r"\d+", query) if len(g) >= MIN_TOKEN]
+        digits = "".join(re.findall(r"\d", query))[-10:]
+        terms = [f'"{" ".join(groups)}"'] if len(groups) > 1 else []
+        terms.append(f"{digits}*")
+        return "BOOLEAN", " ".join(terms)
+    if BOOLEAN_CHARS & set(query):
+        # Power users can write +placement -internship or "exact phrase"
+        return "BOOLEAN", query
+    if not any(len(w) >= MIN_TOKEN for w in WORD_RE.findall(query)):
+        return None
+    return "NATURAL LANGUAGE", query
+
+
+def _parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+
+
+def _filters(user=None, session_id=None, date_from=None, date_to=None):
+    where, params = ["s.deleted_at IS NULL"], []
+    if user:
+        user = str(user).strip()
+        if user.isdigit():
+            where.append("m.user_id = ?")
+            params.append(int(user))
+        else:
+            where.append("LOWER(u.email) = ?")
+            params.append(user.lower())
+    if session_id:
+        where.append("m.session_id = ?")
+        params.append(int(session_id))
+    start, end = _parse_date(date_from), _parse_date(date_to)
+    if start:
+        where.append("m.timestamp >= ?")
+        params.append(start)
+    if end:
+        where.append("m.timestamp < ?")
+        params.append(end + datetime.timedelta(days=1))
+    return where, params
+
+
+# ---------- Snippets ----------
+def snippet(text, query):
+    """[(fragment, highlighted)] around the first hit, for the template to render safely."""
+    terms = sorted({w.lower() for w in WORD_RE.findall(query) if len(w) >= 2}, key=len, reverse=True)
+    if not terms:
+        return [(text[:2 * SNIPPET_RADIUS], False)]
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - SNIPPET_RADIUS) if first else 0
+    end = min(len(text), start + 2 * SNIPPET_RADIUS + (first.end() - first.start() if first else 0))
+    window = text[start:end]
+    parts, pos = [], 0
+    if start > 0:
+        parts.append(("…", False))
+    for m in pattern.finditer(window):
+        if m.start() > pos:
+            parts.append((window[pos:m.start()], False))
+        parts.append((m.group(0), True))
+        pos = m.end()
+    parts.append((window[pos:], False))
+    if end < len(text):
+        parts.append(("…", False))
+    return parts
+
+
+# ---------- Search ----------
+def search(cursor, query="", user=None, session_id=None, date_from=None, date_to=None, page=1, per_page=PER_PAGE):
+    """Ranked, paginated message hits. With no query but a session, returns that transcript in order."""
+    page = max(1, int(page or 1))
+    where, params = _filters(user, session_id, date_from, date_to)
+    match = build_match(query or "")
+
+    if match is None and not session_id:
+        return {"results": [], "total": 0, "page": page, "pages": 0, "searched": False}
+
+    if match is not None:
+        mode, against = match
+        score = f"MATCH(m.message) AGAINST (? IN {mode} MODE)"
+        where.insert(0, score)
+        params.insert(0, against)
+        select_score, order, score_params = score, "score DESC, m.id DESC", [against]
+    else:
+        select_score, order, score_params = "0", "m.id ASC", []
+
+    joins = "FROM messages m JOIN sessions s ON s.id = m.session_id JOIN users u ON u.id = m.user_id"
+    where_sql = " AND ".join(where)
+    cursor.execute(f"SELECT COUNT(*) {joins} WHERE {where_sql}", params)
+    total = cursor.fetchone()[0]
+
+    cursor.execute(f"""
+        SELECT m.id, m.session_id, s.title, m.user_id, u.name, u.email, m.sender, m.message, m.timestamp,
+               {select_score} AS score
+        {joins} WHERE {where_sql}
+        ORDER BY {order} LIMIT ? OFFSET ?
+    """, score_params + params + [per_page, (page - 1) * per_page])
+    results = [{
+        "id": mid, "session_id": sid, "title": title, "user_id": uid, "user_name": name, "email": email,
+        "sender": sender, "timestamp": ts, "score": round(float(score or 0), 3),
+        "snippet": snippet(message, query or "") if match is not None else [(message, False)],
+    } for mid, sid, title, uid, name, email, sender, message, ts, score in cursor.fetchall()]
+
+    return {"results": results, "total": total, "page": page,
+            "pages": (total + per_page - 1) // per_page, "searched": True}
+
+
+def main():
+    argparse.ArgumentParser(description="Build the FULLTEXT index behind /admin/search.").parse_args()
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        if has_search_index(cursor):
+            print("Transcript search index already exists.")
+            return
+        print("Building transcript search index (reads every message)...")
+        start = time.perf_counter()
+        build_search_index(cursor)
+    print(f"Done in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+
+import db
+import metrics
+
+# Entries are dropped after this many seconds so that writes made by other
+# worker processes become visible without cross-process invalidation.
+TTL = float(os.environ.get("USER_CACHE_TTL", 60))
+MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", 10000))
+
+# No password hash: credential checks always read it fresh from the primary
+USER_COLUMNS = "id, name, email, role, google_id, is_verified, created_at, avatar"
+
+
+class CachedUser:
+    __slots__ = ("id", "name", "email", "role", "google_id",
+                 "is_verified", "created_at", "avatar", "expires_at")
+
+    def __init__(self, row, expires_at):
+        (self.id, self.name, self.email, self.role,
+         self.google_id, self.is_verified, self.created_at, self.avatar) = row
+        self.expires_at = expires_at
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+_lock = threading.Lock()
+_by_id = {}
+_by_email = {}
+
+
+def _reset_after_fork():
+    # Entries inherited from the master stay valid; only the lock is replaced.
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _store(row):
+    user = CachedUser(row, time.monotonic() + TTL)
+    with _lock:
+        if len(_by_id) >= MAX_ENTRIES:
+            _by_id.clear()
+            _by_email.clear()
+        _by_id[user.id] = user
+        _by_email[normalize_email(user.email)] = user
+    return user
+
+
+def _lookup(index, key):
+    with _lock:
+        user = index.get(key)
+    if user is not None and user.expires_at > time.monotonic():
+        metrics.inc("mitu_user_cache_lookups_total", (("result", "hit"),))
+        return user
+    metrics.inc("mitu_user_cache_lookups_total", (("result", "miss"),))
+    return None
+
+
+def get_by_id(user_id, cursor=None):
+    user = _lookup(_by_id, user_id)
+    if user is not None:
+        return user
+    return _load("id = ?", user_id, cursor)
+
+
+def get_by_email(email, cursor=None):
+    email = normalize_email(email)
+    user = _lookup(_by_email, email)
+    if user is not None:
+        return user
+    return _load("LOWER(email) = ?", email, cursor)
+
+
+def _load(where, value, cursor):
+    query = f"SELECT {USER_COLUMNS} FROM users WHERE {where} AND deleted_at IS NULL"
+    if cursor is not None:
+        cursor.execute(query, (value,))
+        row = cursor.fetchone()
+    else:
+        with db.connect() as conn:
+            c = conn.cursor()
+            c.execute(query, (value,))
+            row = c.fetchone()
+    if not row:
+        return None
+    if getattr(cursor, "read_only", False):
+        # Read from a replica that may lag: use it for this request but don't share it
+        return CachedUser(row, 0)
+    return _store(row)
+
+
+def invalidate(user_id=None, email=None):
+    metrics.inc("mitu_user_cache_invalidations_total")
+    with _lock:
+        user = _by_id.pop(user_id, None) if user_id is not None else None
+        if user is not None:
+            _by_email.pop(normalize_email(user.email), None)
+        if email:
+            user = _by_email.pop(normalize_email(email), None)
+            if user is not None:
+                _by_id.pop(user.id, None)
+
+
+def clear():
+    with _lock:
+        _by_id.clear()
+        _by_email.clear()
+